@@ -0,0 +1,408 @@
+"""
+Offline Benchmark Suite
+Runs repeatable SMTP, IMAP and notification scenarios against local stand-in
+servers (self-signed TLS) and writes machine-readable results.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.application import MIMEApplication
+
+from email_client import (send_email, receive_email, send_notification, sync_mailbox,
+                          sync_accounts, SMTPConnectionPool, NotificationChannel,
+                          IMPLICIT_TLS_PORTS)
+from local_servers import IMAPStandIn, SMTPStandIn, Mailbox, server_ssl_context, sample_message
+from notification_server import run_in_thread
+from mail_cache import MailCache
+from wire_metrics import default_tls_sessions, OperationMetrics
+from push_notifications import NotificationDispatcher, HeadlessBackend
+from metrics_registry import percentile
+
+
+USER = "user@example.com"
+PASSWORD = "password"
+HOST = "127.0.0.1"
+
+
+# ==================== Local Servers ====================
+
+class LocalServers:
+    """SMTP (STARTTLS and implicit TLS), IMAP (both) and notification servers.
+
+    The two IMAP listeners share one set of mailboxes. The implicit-TLS ports
+    are registered in IMPLICIT_TLS_PORTS so the client wraps them from the
+    first byte, as it does for 465/993.
+    """
+
+    def __init__(self, delay=0.0):
+        context = server_ssl_context()
+        self.imap = IMAPStandIn(HOST, ssl_context=context, delay=delay).start()
+        self.imaps = IMAPStandIn(HOST, ssl_context=context, implicit_tls=True, delay=delay)
+        self.imaps.mailboxes = self.imap.mailboxes
+        self.imaps.start()
+        self.smtp = SMTPStandIn(HOST, ssl_context=context, keep_messages=False,
+                                delay=delay).start()
+        self.smtps = SMTPStandIn(HOST, ssl_context=context, implicit_tls=True,
+                                 keep_messages=False, delay=delay).start()
+        self.notify = run_in_thread(HOST, 0, verbose=False)
+        IMPLICIT_TLS_PORTS.update({self.imaps.port, self.smtps.port})
+
+    def fresh_inbox(self):
+        """Replace INBOX with an empty mailbox. Returns it."""
+        self.imap.mailboxes["INBOX"] = Mailbox()
+        return self.imap.mailboxes["INBOX"]
+
+    def stop(self):
+        for server in (self.imap, self.imaps, self.smtp, self.smtps):
+            server.stop()
+        self.notify.stop()
+        IMPLICIT_TLS_PORTS.difference_update({self.imaps.port, self.smtps.port})
+
+
+# ==================== Measurement ====================
+
+def summarize(results, elapsed):
+    """Aggregate metrics tuples (success, time, bytes, pkts_sent, pkts_recv, ...)."""
+    ok = [r for r in results if r[0]]
+    latencies = [r[1] for r in ok]
+    wires = [r.wire for r in ok if getattr(r, 'wire', None)]
+    phases = {}
+    for wire in wires:
+        for name, seconds in wire['phases'].items():
+            phases[name] = phases.get(name, 0) + seconds
+    total_bytes = sum(r[2] for r in ok)
+    return {
+        "operations": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": elapsed,
+        "ops_per_sec": len(ok) / elapsed if elapsed > 0 else 0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0,
+        "bytes": total_bytes,
+        "segs_out": sum(r[3] for r in ok),
+        "segs_in": sum(r[4] for r in ok),
+        "throughput_bps": total_bytes / elapsed if elapsed > 0 else 0,
+        "phase_mean_ms": {name: seconds * 1000 / len(wires) for name, seconds in phases.items()},
+        "tls_resumed": sum(wire.get('tls_resumed', 0) for wire in wires),
+        "uncompressed_recv": sum(wire.get('uncompressed_recv', 0) for wire in wires),
+    }
+
+
+def run_ops(operation, count, concurrency=1):
+    """Call operation(i) count times, `concurrency` at a time, and summarize."""
+    start = time.perf_counter()
+    if concurrency <= 1:
+        results = [operation(i) for i in range(count)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(operation, range(count)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def large_body(size):
+    """Plain-text body of roughly `size` bytes in 76-character lines."""
+    line = "x" * 75 + "\n"
+    return line * max(1, size // len(line))
+
+
+def attachment_message(n, size):
+    """RFC822 message with a short text part and a `size`-byte binary attachment."""
+    msg = MIMEMultipart()
+    msg['From'] = "alice@example.com"
+    msg['To'] = USER
+    msg['Subject'] = f"Attachment {n}"
+    msg.attach(MIMEText("See the attached file.\n", 'plain'))
+    part = MIMEApplication(os.urandom(size), Name="data.bin")
+    part['Content-Disposition'] = 'attachment; filename="data.bin"'
+    msg.attach(part)
+    return msg.as_bytes()
+
+
+# ==================== Scenarios ====================
+
+def scenario_smtp_small(servers, args):
+    """Many small messages: new connection per message vs. a pooled session.
+
+    implicit_tls resumes the TLS session of the previous connection;
+    implicit_tls_full forgets it first, so every handshake is a full one.
+    """
+    def sender(port, pool=None, resume=True):
+        def send(i):
+            if not resume:
+                default_tls_sessions.clear()
+            return send_email(USER, PASSWORD, "bob@example.com", f"Benchmark {i}",
+                              f"Small message number {i}.", HOST, port, pool=pool)
+        return send
+
+    pool = SMTPConnectionPool()
+    try:
+        return {
+            "starttls": run_ops(sender(servers.smtp.port), args.messages),
+            "implicit_tls": run_ops(sender(servers.smtps.port), args.messages),
+            "implicit_tls_full": run_ops(sender(servers.smtps.port, resume=False), args.messages),
+            "pooled": run_ops(sender(servers.smtp.port, pool), args.messages),
+        }
+    finally:
+        pool.close_all()
+
+
+def scenario_smtp_large(servers, args):
+    """Large messages: a large text body, and a file attachment streamed from
+    disk with BDAT (CHUNKING) and with classic DATA."""
+    body = large_body(args.attachment_kb * 1024)
+    send = lambda port: lambda i: send_email(USER, PASSWORD, "bob@example.com",
+                                             f"Large {i}", body, HOST, port)
+    with tempfile.NamedTemporaryFile(suffix=".bin") as attachment:
+        attachment.write(os.urandom(args.attachment_kb * 1024))
+        attachment.flush()
+        attach = lambda i: send_email(USER, PASSWORD, "bob@example.com", f"Attachment {i}",
+                                      "See the attached file.", HOST, servers.smtp.port,
+                                      attachments=[attachment.name])
+        results = {
+            "starttls": run_ops(send(servers.smtp.port), args.large_count),
+            "implicit_tls": run_ops(send(servers.smtps.port), args.large_count),
+            "attachment_bdat": run_ops(attach, args.large_count),
+        }
+        servers.smtp.chunking = False
+        try:
+            results["attachment_data"] = run_ops(attach, args.large_count)
+        finally:
+            servers.smtp.chunking = True
+    return results
+
+
+def scenario_imap_attachment(servers, args):
+    """Latest message carries a large attachment: full RFC822 fetch vs. headers-first."""
+    servers.fresh_inbox().append(attachment_message(1, args.attachment_kb * 1024))
+    receive = lambda lazy: lambda i: receive_email(USER, PASSWORD, HOST, servers.imap.port,
+                                                   lazy=lazy)
+    return {
+        "full": run_ops(receive(False), args.large_count),
+        "lazy": run_ops(receive(True), args.large_count),
+    }
+
+
+def scenario_imap_large_mailbox(servers, args):
+    """Mailbox with args.mailbox_size messages: latest message and cache sync.
+
+    latest_uncompressed turns COMPRESS=DEFLATE off on the server.
+    """
+    mailbox = servers.fresh_inbox()
+    start = time.perf_counter()
+    for n in range(args.mailbox_size):
+        mailbox.append(sample_message(n))
+    setup = time.perf_counter() - start
+
+    cache = MailCache(":memory:")
+    receive = lambda lazy, port: lambda i: receive_email(USER, PASSWORD, HOST, port, lazy=lazy)
+    sync = lambda i: sync_mailbox(USER, PASSWORD, HOST, servers.imap.port, cache=cache, lazy=True)
+    try:
+        servers.imap.compress = False
+        uncompressed = run_ops(receive(False, servers.imap.port), args.repeat)
+        servers.imap.compress = True
+        return {
+            "setup": {"messages": args.mailbox_size, "elapsed_s": setup},
+            "latest_full": run_ops(receive(False, servers.imap.port), args.repeat),
+            "latest_uncompressed": uncompressed,
+            "latest_lazy": run_ops(receive(True, servers.imap.port), args.repeat),
+            "latest_implicit_tls": run_ops(receive(True, servers.imaps.port), args.repeat),
+            "sync_initial": run_ops(sync, 1),
+            "sync_unchanged": run_ops(sync, args.repeat),
+        }
+    finally:
+        servers.imap.compress = True
+        cache.close()
+
+
+def scenario_concurrent(servers, args):
+    """args.clients clients at once, each with its own connection."""
+    mailbox = servers.fresh_inbox()
+    for n in range(50):
+        mailbox.append(sample_message(n))
+    count = args.clients * args.repeat
+    send = lambda i: send_email(USER, PASSWORD, "bob@example.com", f"Concurrent {i}",
+                                "Concurrent client message.", HOST, servers.smtp.port)
+    receive = lambda i: receive_email(USER, PASSWORD, HOST, servers.imap.port, lazy=True)
+
+    def notify(i):
+        channel = NotificationChannel(HOST, servers.notify.port)
+        try:
+            return send_notification(f"Concurrent {i}", HOST, servers.notify.port, channel=channel)
+        finally:
+            channel.close()
+
+    return {
+        "smtp_send": run_ops(send, count, args.clients),
+        "imap_receive": run_ops(receive, count, args.clients),
+        "notify_new_connection": run_ops(notify, count, args.clients),
+    }
+
+
+def scenario_multi_mailbox(servers, args):
+    """args.clients mailboxes of 200 messages: one after another vs. sync_accounts.
+
+    Runs with a simulated round trip (--latency-ms, at least 10 ms) so the
+    in-process server does not make the comparison CPU-bound.
+    """
+    delay, servers.imap.delay = servers.imap.delay, max(servers.imap.delay, 0.01)
+    names = [f"Folder {i}" for i in range(args.clients)]
+    for name in names:
+        mailbox = servers.imap.mailboxes[name] = Mailbox()
+        for n in range(200):
+            mailbox.append(sample_message(n))
+
+    cache = MailCache(":memory:")
+    start = time.perf_counter()
+    serial = [sync_mailbox(USER, PASSWORD, HOST, servers.imap.port, name, cache, lazy=True)
+              for name in names]
+    serial = summarize(serial, time.perf_counter() - start)
+    cache.close()
+
+    cache = MailCache(":memory:")
+    account = {"email": USER, "password": PASSWORD, "imap_server": HOST,
+               "imap_port": servers.imap.port, "mailboxes": names}
+    total, _, mailbox_metrics = sync_accounts([account], cache, lazy=True,
+                                              max_workers=args.clients, per_server_limit=8)
+    cache.close()
+    servers.imap.delay = delay
+    return {"serial": serial, "parallel": summarize(list(mailbox_metrics.values()), total[1])}
+
+
+def scenario_notifications(servers, args):
+    """Notifications over one persistent channel, unbatched and batched."""
+    results = {}
+    for name, window in (("persistent", 0.0), ("batched", 0.005)):
+        channel = NotificationChannel(HOST, servers.notify.port, batch_window=window)
+        start = time.perf_counter()
+        metrics = [send_notification(f"Benchmark {i}", HOST, servers.notify.port, channel=channel)
+                   for i in range(args.messages)]
+        channel.close()  # flushes anything still queued
+        results[name] = summarize(metrics, time.perf_counter() - start)
+        results[name]["connections"] = channel.connects
+        results[name]["writes"] = channel.writes
+    return results
+
+
+def scenario_push_notifications(servers, args):
+    """A burst of new-mail desktop notifications, against a headless backend
+    that takes 20 ms per notification (roughly a desktop call): shown
+    synchronously by the caller vs. queued on the coalescing dispatcher."""
+    def caller(show):
+        def notify(i):
+            start = time.perf_counter()
+            show("New Email", f"alice@example.com: Benchmark {i}")
+            return OperationMetrics((True, time.perf_counter() - start, 0, 0, 0))
+        return notify
+
+    direct = HeadlessBackend(delay=0.02)
+    results = {"direct": run_ops(caller(direct.show), args.messages)}
+    results["direct"]["shown"] = args.messages
+
+    dispatcher = NotificationDispatcher(HeadlessBackend(delay=0.02), window=0.5)
+    results["dispatcher"] = run_ops(caller(lambda title, message: dispatcher.notify(
+        title, message, summary="{count} new emails")), args.messages)
+    dispatcher.flush()
+    results["dispatcher"]["shown"] = dispatcher.shown
+    return results
+
+
+SCENARIOS = {
+    "smtp_small": scenario_smtp_small,
+    "smtp_large": scenario_smtp_large,
+    "imap_attachment": scenario_imap_attachment,
+    "imap_large_mailbox": scenario_imap_large_mailbox,
+    "concurrent": scenario_concurrent,
+    "multi_mailbox": scenario_multi_mailbox,
+    "notifications": scenario_notifications,
+    "push_notifications": scenario_push_notifications,
+}
+
+
+# ==================== Reporting ====================
+
+def print_results(report, baseline=None):
+    """One row per scenario variant; with a baseline, also the ops/s and p50 change."""
+    print("\n" + "="*106)
+    print("BENCHMARK RESULTS")
+    print("="*106)
+    header = f"{'Scenario':<40} {'Ops':<6} {'Errors':<7} {'Ops/s':<10} {'p50(ms)':<10} {'p99(ms)':<10} {'Bytes':<12}"
+    if baseline:
+        header += f" {'Ops/s vs base':<14} {'p50 vs base':<12}"
+    print(header)
+    print("-"*106)
+    for scenario, variants in report["scenarios"].items():
+        for variant, r in variants.items():
+            if "operations" not in r:
+                continue
+            name = f"{scenario}.{variant}"
+            row = (f"{name:<40} {r['operations']:<6} {r['errors']:<7} {r['ops_per_sec']:<10.1f} "
+                   f"{r['p50_ms']:<10.2f} {r['p99_ms']:<10.2f} {r['bytes']:<12}")
+            base = (baseline or {}).get("scenarios", {}).get(scenario, {}).get(variant)
+            if base and base.get("ops_per_sec") and base.get("p50_ms"):
+                row += (f" {r['ops_per_sec'] / base['ops_per_sec'] - 1:<+14.1%}"
+                        f" {r['p50_ms'] / base['p50_ms'] - 1:<+12.1%}")
+            print(row)
+    print("="*106 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email client against local servers")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--messages", type=int, default=200, help="small messages per variant")
+    parser.add_argument("--attachment-kb", type=int, default=5 * 1024)
+    parser.add_argument("--large-count", type=int, default=5, help="large messages per variant")
+    parser.add_argument("--mailbox-size", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of slow operations")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="simulated round trip added by the SMTP/IMAP servers per command")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "scenarios": {},
+    }
+    servers = LocalServers(args.latency_ms / 1000)
+    try:
+        for name in names:
+            print(f"[BENCH] Running {name}...")
+            # The client logs every operation; keep the benchmark output readable
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                report["scenarios"][name] = SCENARIOS[name](servers, args)
+    finally:
+        servers.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
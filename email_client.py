@@ -4,257 +4,2736 @@ A Python email client using SMTP (send) and IMAP (receive) protocols.
 Course: Computer Networks - Fall 2025
 """
 
+import os
+import sys
+import argparse
+import contextlib
 import smtplib
 import imaplib
 import socket
+import ssl
 import time
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import re
+import quopri
+import base64
+import binascii
+import json
+import atexit
+import random
+import itertools
+import select
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from mail_cache import MailCache, account_key
+from mail_archive import (MAILDIR, Checkpoint, MaildirWriter, archive_format, append_file,
+                          read_archive, write_mbox_message)
+from mime_stream import MessageStream, dot_stuff, rechunk
+from outbox import Outbox
+from metrics_registry import default_registry, MetricsServer
+from push_notifications import default_dispatcher
+from notification_server import encode_frame
+from wire_metrics import (WireMeter, OperationMetrics, MeteredSocket, MeteredSMTP, MeteredSMTP_SSL,
+                          MeteredIMAP4, MeteredIMAP4_SSL, DeflateSocket, merge_stats,
+                          local_hostname)
+
+
+# Ports that speak TLS from the first byte; any other port upgrades with STARTTLS
+IMPLICIT_TLS_PORTS = {465, 993}
 
 
 # ==================== Push Notification ====================
 
-def show_push_notification(title, message):
-    """Show a desktop push notification using Plyer."""
+def show_push_notification(title, message, key=None, summary=None):
+    """Queue a desktop notification; it is shown in the background and bursts
+    with the same key are merged (see push_notifications)."""
+    default_dispatcher().notify(title, message, key, summary)
+
+
+# ==================== Metrics ====================
+
+def _metrics(success, start_time, wire, direction, *extra, record=None):
+    """Build a metrics tuple (success, time, bytes, packets_sent, packets_recv, *extra).
+
+    Bytes and packets are measured (see wire_metrics): bytes are the wire bytes
+    in the operation's main direction, packets are TCP segments. record is
+    (operation, host, port); the tuple is then also added to the metrics
+    registry.
+    """
+    time_taken = time.perf_counter() - start_time
+    if wire is None:
+        metrics = OperationMetrics((success, time_taken, 0, 0, 0) + extra)
+    else:
+        values = (success, time_taken, wire['wire_bytes_' + direction], wire['segs_out'], wire['segs_in'])
+        metrics = OperationMetrics(values + extra, wire)
+    if record:
+        _record(metrics, *record)
+    return metrics
+
+
+def _record(metrics, operation, host, port):
+    default_registry.observe(operation, f"{host}:{port}", metrics)
+
+
+# ==================== SMTP - Send Email ====================
+
+def _smtp_connect(smtp_server, smtp_port, timeout=30, meter=None):
+    """Open a metered SMTP connection (implicit SSL on 465, STARTTLS otherwise)."""
+    if smtp_port in IMPLICIT_TLS_PORTS:
+        server = MeteredSMTP_SSL(smtp_server, smtp_port, meter=meter, timeout=timeout,
+                                 local_hostname=local_hostname())
+    else:
+        server = MeteredSMTP(smtp_server, smtp_port, meter=meter, timeout=timeout,
+                             local_hostname=local_hostname())
+        server.starttls()
+    return server
+
+
+SEND_CHUNK = 1024 * 1024  # message bytes per write (and per BDAT command)
+BDAT_WINDOW = 2           # BDAT commands sent before waiting for a reply
+
+
+def _transmit(server, sender_email, recipients, message):
+    """MAIL, RCPT and the message itself, written as it is generated.
+
+    Does what smtplib's sendmail does (same exceptions, returns the refused
+    recipients) without ever holding the whole message: with CHUNKING
+    (RFC 3030) it goes out as BDAT chunks, otherwise as dot-stuffed DATA.
+    The message size is announced with SIZE= when the server supports it.
+    """
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    server.ehlo_or_helo_if_needed()
+    options = [f"SIZE={message.size}"] if server.has_extn('size') else []
+
+    code, resp = server.mail(sender_email, options)
+    if code != 250:
+        if code == 421:
+            server.close()
+        else:
+            server._rset()
+        raise smtplib.SMTPSenderRefused(code, resp, sender_email)
+    refused = {}
+    for recipient in recipients:
+        code, resp = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, resp)
+        if code == 421:
+            server.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(recipients):
+        server._rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    if server.has_extn('chunking'):
+        # Keep up to BDAT_WINDOW chunks in flight; the reply to each chunk
+        # is read while the next one is already on its way. After a refusal
+        # nothing more is sent, but every outstanding reply is still read.
+        failure = None
+        unread = 0
+        previous = None
+        for chunk in rechunk(message, SEND_CHUNK):
+            if previous is not None:
+                server.send(b"BDAT %d\r\n" % len(previous) + previous)
+                unread += 1
+                if unread >= BDAT_WINDOW:
+                    code, resp = server.getreply()
+                    unread -= 1
+                    if code != 250:
+                        failure = (code, resp)
+                        break
+            previous = chunk
+        else:
+            server.send(b"BDAT %d LAST\r\n" % len(previous or b"") + (previous or b""))
+            unread += 1
+        for _ in range(unread):
+            code, resp = server.getreply()
+            if code != 250 and failure is None:
+                failure = (code, resp)
+        if failure:
+            server._rset()
+            raise smtplib.SMTPDataError(*failure)
+    else:
+        code, resp = server.docmd('data')
+        if code != 354:
+            server._rset()
+            raise smtplib.SMTPDataError(code, resp)
+        previous = b""
+        for chunk in rechunk(dot_stuff(message), SEND_CHUNK):
+            if previous:
+                server.send(previous)
+            previous = chunk
+        # The terminator goes out with the tail (the message always ends
+        # with CRLF); a separate tiny write would wait on a delayed ACK
+        server.send(previous + b".\r\n")
+        code, resp = server.getreply()
+        if code != 250:
+            server._rset()
+            raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def send_email(sender_email, password, recipient_email, subject, body,
+               smtp_server="mail.tm", smtp_port=465, pool=None, attachments=None):
+    """Send an email using SMTP. Returns (success, time, bytes, packets_sent, packets_recv).
+
+    attachments is a list of file paths; they are encoded from disk while
+    the message is being sent, never loaded whole. If a pool is given, a
+    logged-in session is borrowed from it instead of connecting, logging in
+    and quitting for this one message.
+    """
+    if pool is not None:
+        return _send_pooled(pool, sender_email, password, recipient_email, subject, body,
+                            smtp_server, smtp_port, attachments=attachments)
+
+    start_time = time.perf_counter()
+    record = ('smtp_send', smtp_server, smtp_port)
+    meter = WireMeter()
+
+    try:
+        # Create email message (generated lazily while sending)
+        message = MessageStream(sender_email, recipient_email, subject, body, attachments)
+        meter.begin()
+
+        # Connect to SMTP server
+        print(f"[SMTP] Connecting to {smtp_server}:{smtp_port}...")
+        server = _smtp_connect(smtp_server, smtp_port, meter=meter)
+
+        # Login and send
+        print("[SMTP] Logging in...")
+        server.login(sender_email, password)
+        meter.mark('auth')
+
+        print(f"[SMTP] Sending email ({message.size} bytes)...")
+        _transmit(server, sender_email, recipient_email, message)
+        meter.mark('transfer')
+
+        server.quit()
+        meter.mark('quit')
+
+        metrics = _metrics(True, start_time, meter.stats(), 'sent', record=record)
+        print(f"[SMTP] SUCCESS! Time: {metrics[1]:.3f}s, Bytes: {metrics[2]}")
+        print(f"[SMTP] Packets sent: {metrics[3]}, received: {metrics[4]}")
+        return metrics
+
+    except smtplib.SMTPAuthenticationError:
+        print("[SMTP] ERROR: Authentication failed.")
+        return _metrics(False, start_time, meter.stats(), 'sent', record=record)
+    except Exception as e:
+        print(f"[SMTP] ERROR: {e}")
+        return _metrics(False, start_time, meter.stats(), 'sent', record=record)
+
+
+# ==================== SMTP - Connection Pool ====================
+
+class SMTPConnectionPool:
+    """Pool of logged-in SMTP sessions keyed by (server, port, user).
+
+    Idle sessions are checked with NOOP before they are handed out again and
+    are replaced transparently when the server has dropped them.
+    """
+
+    def __init__(self, max_size=4, max_idle_time=120, timeout=30):
+        self.max_size = max_size            # open sessions per key
+        self.max_idle_time = max_idle_time  # seconds before an idle session is retired
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = {}   # key -> [(server, last_used), ...]
+        self._open = {}   # key -> open sessions (idle + in use)
+
+    def acquire(self, smtp_server, smtp_port, user, password):
+        """Borrow a logged-in session. Returns (server, reused)."""
+        key = (smtp_server, smtp_port, user)
+        while True:
+            candidate = None
+            with self._cond:
+                idle = self._idle.get(key)
+                if idle:
+                    candidate = idle.pop()
+                elif self._open.get(key, 0) < self.max_size:
+                    self._open[key] = self._open.get(key, 0) + 1
+                else:
+                    self._cond.wait()
+                    continue
+
+            if candidate is None:
+                break
+
+            server, last_used = candidate
+            if time.time() - last_used <= self.max_idle_time and self._is_alive(server):
+                return server, True
+            self._discard(key, server)
+
+        # Open a new session outside the lock
+        try:
+            server = self._connect(smtp_server, smtp_port, user, password)
+        except Exception:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+        return server, False
+
+    def release(self, smtp_server, smtp_port, user, server, broken=False):
+        """Return a session to the pool, or drop it if it is broken."""
+        key = (smtp_server, smtp_port, user)
+        if broken:
+            self._discard(key, server)
+            return
+        with self._cond:
+            self._idle.setdefault(key, []).append((server, time.time()))
+            self._cond.notify()
+
+    def close_all(self):
+        """QUIT every idle session."""
+        with self._cond:
+            idle, self._idle = self._idle, {}
+            for key, sessions in idle.items():
+                self._open[key] -= len(sessions)
+            self._cond.notify_all()
+        for sessions in idle.values():
+            for server, _ in sessions:
+                self._quit(server)
+
+    def _connect(self, smtp_server, smtp_port, user, password):
+        """Open and log in a new session."""
+        print(f"[SMTP] Pool: connecting to {smtp_server}:{smtp_port}...")
+        server = _smtp_connect(smtp_server, smtp_port, self.timeout)
+        server.login(user, password)
+        server.meter.mark('auth')
+        return server
+
+    @staticmethod
+    def _is_alive(server):
+        """Health check an idle session with NOOP."""
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def _discard(self, key, server):
+        """Close a session and free its slot."""
+        self._close(server)
+        with self._cond:
+            self._open[key] -= 1
+            self._cond.notify()
+
+
+# Shared pool used by the CLI/GUI so consecutive sends reuse one session
+default_smtp_pool = SMTPConnectionPool()
+atexit.register(default_smtp_pool.close_all)
+
+
+def _send_pooled(pool, sender_email, password, recipient_email, subject, body,
+                 smtp_server, smtp_port, raise_errors=False, attachments=None):
+    """Send one message over a pooled session. Same return shape as send_email.
+
+    For a reused session the metrics cover only this message; a new session
+    also includes its connect, TLS and login. With raise_errors=True a failure
+    raises the smtplib exception instead of returning a failed tuple, so the
+    caller can look at the reply code.
+    """
+    start_time = time.perf_counter()
+    record = ('smtp_send', smtp_server, smtp_port)
+    wire = None
+
+    try:
+        message = MessageStream(sender_email, recipient_email, subject, body, attachments)
+
+        # One reconnect attempt if the session died between NOOP and send
+        for attempt in range(2):
+            server, reused = pool.acquire(smtp_server, smtp_port, sender_email, password)
+            since = server.meter.snapshot() if reused else None
+            server.meter.begin()
+
+            try:
+                _transmit(server, sender_email, recipient_email, message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                    smtplib.SMTPDataError):
+                # Session is still usable after the server refused this message
+                # (smtplib errors subclass OSError, so these must come first)
+                pool.release(smtp_server, smtp_port, sender_email, server)
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                pool.release(smtp_server, smtp_port, sender_email, server, broken=True)
+                if attempt:
+                    raise
+                print("[SMTP] Pooled session dropped, reconnecting...")
+                continue
+            except Exception:
+                pool.release(smtp_server, smtp_port, sender_email, server, broken=True)
+                raise
+
+            server.meter.mark('transfer')
+            wire = server.meter.stats(since)
+            pool.release(smtp_server, smtp_port, sender_email, server)
+            break
+
+        metrics = _metrics(True, start_time, wire, 'sent', record=record)
+        print(f"[SMTP] SUCCESS! Time: {metrics[1]:.3f}s, Bytes: {metrics[2]} "
+              f"({'reused' if reused else 'new'} session)")
+        return metrics
+
+    except smtplib.SMTPAuthenticationError:
+        metrics = _metrics(False, start_time, wire, 'sent', record=record)
+        if raise_errors:
+            raise
+        print("[SMTP] ERROR: Authentication failed.")
+        return metrics
+    except Exception as e:
+        metrics = _metrics(False, start_time, wire, 'sent', record=record)
+        if raise_errors:
+            raise
+        print(f"[SMTP] ERROR: {e}")
+        return metrics
+
+
+def send_many(messages, sender_email, password, smtp_server="mail.tm", smtp_port=465,
+              pool=None, max_workers=None):
+    """Send a batch of messages over pooled SMTP sessions.
+
+    messages is an iterable of dicts with 'recipient', 'subject', 'body' and
+    optionally 'attachments' (file paths).
+    Returns (batch_metrics, results) where batch_metrics has the send_email
+    shape summed over the batch (time is wall time) and results holds one
+    send_email tuple per message, in input order.
+    """
+    messages = list(messages)
+    pool = pool or default_smtp_pool
+    start_time = time.perf_counter()
+
+    if not messages:
+        return OperationMetrics((True, 0, 0, 0, 0)), []
+
+    def send_one(msg):
+        return _send_pooled(pool, sender_email, password, msg['recipient'],
+                            msg.get('subject', ''), msg.get('body', ''),
+                            smtp_server, smtp_port, attachments=msg.get('attachments'))
+
+    workers = max_workers or min(pool.max_size, len(messages))
+    print(f"[SMTP] Sending batch of {len(messages)} over {workers} session(s)...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(send_one, messages))
+
+    time_taken = time.perf_counter() - start_time
+    batch_metrics = OperationMetrics((
+        all(r[0] for r in results),
+        time_taken,
+        sum(r[2] for r in results),
+        sum(r[3] for r in results),
+        sum(r[4] for r in results),
+    ), merge_stats([r.wire for r in results if r.wire]))
+    sent = sum(1 for r in results if r[0])
+    print(f"[SMTP] Batch done: {sent}/{len(messages)} sent in {time_taken:.3f}s "
+          f"({len(messages) / time_taken if time_taken > 0 else 0:.1f} msg/s)")
+    return batch_metrics, results
+
+
+# ==================== SMTP - Outbound Spool ====================
+
+class TokenBucket:
+    """Token bucket: `rate` sends per second on average, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token if one is available. Returns 0, or the seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+def _is_transient(error):
+    """True for failures worth retrying: 4xx replies and dropped or refused connections.
+
+    5xx replies (bad address, rejected content, failed login) are permanent.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, (smtplib.SMTPNotSupportedError, FileNotFoundError,
+                          IsADirectoryError, PermissionError)):
+        return False  # also a missing or unreadable attachment
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class OutboxWorker:
+    """Background sender that drains an Outbox.
+
+    Each SMTP server gets its own token bucket, so a throttled provider does
+    not hold up the others. Transient failures are retried with exponential
+    backoff (plus jitter, so retries from many messages do not line up);
+    permanent ones, or too many attempts, turn the message into a dead letter.
+    Passwords stay in memory: queued mail for an account waits until
+    set_credentials() (or submit()) has been called for it in this process.
+    """
+
+    def __init__(self, outbox, pool=None, rate=1.0, burst=5, max_workers=4,
+                 base_delay=30, max_delay=3600, max_attempts=8):
+        self.outbox = outbox
+        self.pool = pool or default_smtp_pool
+        self.rate = rate                  # sends per second per server
+        self.burst = burst
+        self.max_workers = max_workers
+        self.base_delay = base_delay      # first retry delay, doubled per attempt
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        self.sent = 0
+        self.retries = 0
+        self.dead = 0
+        self._credentials = {}  # sender -> password
+        self._buckets = {}      # (server, port) -> TokenBucket
+        self._results = {}      # message id -> (status, metrics or error text)
+        self._sent_times = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._executor = None
+        self._thread = None
+        self._started = time.monotonic()
+
+    def start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._wake.set()
+            thread.join(timeout)
+            self._executor.shutdown(wait=True)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def set_credentials(self, sender_email, password):
+        with self._cond:
+            self._credentials[sender_email] = password
+        self._wake.set()
+
+    def submit(self, sender_email, password, recipient_email, subject, body,
+               smtp_server="mail.tm", smtp_port=465, attachments=None):
+        """Queue a message for sending. Returns its outbox id.
+
+        Attachments are stored as paths, so the files must stay in place
+        until the message has been sent.
+        """
+        self.set_credentials(sender_email, password)
+        message_id = self.outbox.enqueue(sender_email, recipient_email, subject, body,
+                                         smtp_server, smtp_port, attachments)
+        print(f"[SMTP] Queued message {message_id} for {recipient_email}")
+        self._wake.set()
+        return message_id
+
+    def wait(self, message_id, timeout=None):
+        """Wait for the first delivery attempt of a message.
+
+        Returns ('sent', metrics), ('retry', error) or ('dead', error), or None
+        if the attempt has not finished within the timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while message_id not in self._results:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._results.pop(message_id)
+
+    def requeue(self, message_id=None):
+        """Retry one dead letter, or all of them."""
+        count = self.outbox.requeue(message_id)
+        self._wake.set()
+        return count
+
+    def cancel(self, message_id):
+        """Drop a queued message. False if it is already being sent (or gone)."""
+        return self.outbox.cancel(message_id)
+
+    def stats(self, window=60):
+        """Queue depth and drain rate (messages sent per second over the last window)."""
+        now = time.monotonic()
+        with self._cond:
+            while self._sent_times and self._sent_times[0] < now - window:
+                self._sent_times.popleft()
+            recent = len(self._sent_times)
+            counters = {"sent": self.sent, "retries": self.retries, "dead_lettered": self.dead}
+        stats = self.outbox.depth()
+        stats.update(counters)
+        stats["drain_rate"] = recent / min(window, max(now - self._started, 1e-9))
+        return stats
+
+    def _bucket(self, smtp_server, smtp_port):
+        key = (smtp_server, smtp_port)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return self._buckets[key]
+
+    def _run(self):
+        while self._thread is not None:
+            with self._cond:
+                senders = list(self._credentials)
+                free = self.max_workers - self._in_flight
+
+            for row in self.outbox.claim_due(free, senders) if free > 0 and senders else []:
+                wait = self._bucket(row['smtp_server'], row['smtp_port']).take()
+                if wait:
+                    # Rate limited: leave it queued until a token is due
+                    self.outbox.release(row['id'], time.time() + wait)
+                    continue
+                with self._cond:
+                    self._in_flight += 1
+                    password = self._credentials[row['sender']]
+                self._executor.submit(self._deliver, row, password)
+
+            # Sleep until the next message is due or something changes
+            next_due = self.outbox.next_due(senders) if senders else None
+            timeout = 1.0 if next_due is None else min(1.0, max(0.01, next_due - time.time()))
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _deliver(self, row, password):
+        message_id = row['id']
+        try:
+            metrics = _send_pooled(self.pool, row['sender'], password, row['recipient'],
+                                   row['subject'], row['body'], row['smtp_server'],
+                                   row['smtp_port'], raise_errors=True,
+                                   attachments=row['attachments'])
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            attempts = row['attempts'] + 1
+            if _is_transient(e) and attempts < self.max_attempts:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.0)
+                self.outbox.mark_retry(message_id, error, time.time() + delay)
+                result = ('retry', error)
+                print(f"[SMTP] Message {message_id} deferred ({error}); retry {attempts} in {delay:.1f}s")
+            else:
+                self.outbox.mark_dead(message_id, error)
+                result = ('dead', error)
+                print(f"[SMTP] Message {message_id} failed permanently: {error}")
+        else:
+            self.outbox.mark_sent(message_id)
+            result = ('sent', metrics)
+
+        with self._cond:
+            # Counters change only under the lock: deliveries run on several threads
+            if result[0] == 'sent':
+                self.sent += 1
+                self._sent_times.append(time.monotonic())
+            elif result[0] == 'retry':
+                self.retries += 1
+            else:
+                self.dead += 1
+            self._in_flight -= 1
+            self._results[message_id] = result
+            while len(self._results) > 1000:  # nobody waited for these
+                self._results.pop(next(iter(self._results)))
+            self._cond.notify_all()
+        self._wake.set()
+
+
+_default_outbox_worker = None
+
+
+def default_outbox_worker():
+    """Return the process-wide OutboxWorker (outbox.db), starting it on first use."""
+    global _default_outbox_worker
+    if _default_outbox_worker is None:
+        _default_outbox_worker = OutboxWorker(Outbox()).start()
+        atexit.register(_default_outbox_worker.stop)
+    return _default_outbox_worker
+
+
+def queue_email(sender_email, password, recipient_email, subject, body,
+                smtp_server="mail.tm", smtp_port=465, worker=None, wait=30, attachments=None):
+    """Send through the outbox: the message is stored before the first attempt.
+
+    Waits up to `wait` seconds for that attempt. Returns (message_id, status,
+    metrics): status is 'sent', 'retry' (still queued, will be retried),
+    'dead' or 'queued' (no result yet); metrics has the send_email shape.
+    """
+    worker = worker or default_outbox_worker()
+    message_id = worker.submit(sender_email, password, recipient_email, subject, body,
+                               smtp_server, smtp_port, attachments)
+    result = worker.wait(message_id, wait)
+    if result is None:
+        return message_id, 'queued', OperationMetrics((False, 0, 0, 0, 0))
+    status, detail = result
+    if status == 'sent':
+        return message_id, status, detail
+    return message_id, status, OperationMetrics((False, 0, 0, 0, 0))
+
+
+def _print_outbox(worker):
+    """Print outbox depth, drain rate and dead letters."""
+    stats = worker.stats()
+    print(f"[SMTP] Outbox: {stats['queued']} queued, {stats['sending']} sending, "
+          f"{stats['dead']} dead | sent {stats['sent']}, retries {stats['retries']}, "
+          f"drain {stats['drain_rate'] * 60:.1f} msg/min, oldest {stats['oldest_age_s']:.0f}s")
+    for row in worker.outbox.dead_letters():
+        print(f"  #{row['id']} to {row['recipient']} \"{row['subject']}\" "
+              f"after {row['attempts']} attempt(s): {row['last_error']}")
+
+
+# ==================== IMAP - Response Parsing ====================
+
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]'
+
+
+def _read_imap_value(data, pos=0):
+    """Parse one IMAP value (list, string, literal, NIL or atom). Returns (value, pos)."""
+    while data[pos:pos + 1] == b' ':
+        pos += 1
+    ch = data[pos:pos + 1]
+
+    if ch == b'(':
+        items = []
+        pos += 1
+        while True:
+            while data[pos:pos + 1] == b' ':
+                pos += 1
+            if data[pos:pos + 1] in (b')', b''):
+                return items, pos + 1
+            value, pos = _read_imap_value(data, pos)
+            items.append(value)
+
+    if ch == b'"':
+        out = bytearray()
+        pos += 1
+        while data[pos:pos + 1] not in (b'"', b''):
+            if data[pos:pos + 1] == b'\\':
+                pos += 1
+            out += data[pos:pos + 1]
+            pos += 1
+        return out.decode('utf-8', errors='replace'), pos + 1
+
+    if ch == b'{':
+        end = data.index(b'}', pos)
+        size = int(data[pos + 1:end].rstrip(b'+'))
+        start = end + 3  # skip "}\r\n"
+        return data[start:start + size], start + size
+
+    # Atom; section specifiers like BODY[HEADER.FIELDS (FROM)]<0> stay whole
+    start = pos
+    depth = 0
+    while pos < len(data):
+        c = data[pos:pos + 1]
+        if c == b'[':
+            depth += 1
+        elif c == b']':
+            depth -= 1
+        elif depth == 0 and c in (b' ', b'(', b')'):
+            break
+        pos += 1
+    atom = data[start:pos].decode('ascii', errors='replace')
+    return (None if atom.upper() == 'NIL' else atom), pos
+
+
+def _parse_fetch_response(msg_data):
+    """Turn imaplib FETCH data into a list of (seq, {ITEM: value}) pairs.
+
+    imaplib splits each response around its literals; the element after a
+    (line, literal) tuple continues the same response.
+    """
+    responses = []
+    current = None
+    continues = False
+    for item in msg_data:
+        if item is None:
+            continue
+        chunk = item[0] + b"\r\n" + item[1] if isinstance(item, tuple) else item
+        if current is not None and continues:
+            current += chunk
+        else:
+            if current is not None:
+                responses.append(current)
+            current = chunk
+        continues = isinstance(item, tuple)
+    if current is not None:
+        responses.append(current)
+
+    parsed = []
+    for response in responses:
+        seq, _, rest = response.partition(b' ')
+        values, _ = _read_imap_value(rest, rest.index(b'('))
+        items = {}
+        for key, value in zip(values[::2], values[1::2]):
+            items[key.upper()] = value
+        parsed.append((int(seq), items))
+    return parsed
+
+
+def _fetch_item(items, prefix):
+    """Return the first FETCH item whose name starts with prefix."""
+    for key, value in items.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def _as_text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def _body_parts(structure, section=''):
+    """Yield the leaf parts of a parsed BODYSTRUCTURE with their section numbers."""
+    if isinstance(structure[0], list):
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            yield from _body_parts(child, f"{section}.{number}" if section else str(number))
+        return
+
+    maintype = (_as_text(structure[0]) or '').lower()
+    subtype = (_as_text(structure[1]) or '').lower()
+    params = structure[2] if isinstance(structure[2], list) else []
+    params = {(_as_text(k) or '').lower(): _as_text(v) for k, v in zip(params[::2], params[1::2])}
+
+    # Extension data follows the type-specific fields
+    if maintype == 'text':
+        extension = 8
+    elif (maintype, subtype) == ('message', 'rfc822'):
+        extension = 10
+    else:
+        extension = 7
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    filename = params.get('name')
+    if isinstance(disposition, list) and len(disposition) > 1 and isinstance(disposition[1], list):
+        disp_params = disposition[1]
+        for key, value in zip(disp_params[::2], disp_params[1::2]):
+            if (_as_text(key) or '').lower() == 'filename':
+                filename = _as_text(value)
+
+    yield {
+        "section": section or '1',
+        "type": f"{maintype}/{subtype}",
+        "charset": params.get('charset'),
+        "encoding": (_as_text(structure[5]) or '7BIT').upper(),
+        "size": int(structure[6] or 0),
+        "filename": filename,
+        "attachment": isinstance(disposition, list) and
+                      (_as_text(disposition[0]) or '').lower() == 'attachment',
+    }
+
+
+def _decode_body(data, encoding, charset, partial=False):
+    """Decode a (possibly truncated) body section to text."""
+    if encoding == 'BASE64':
+        data = re.sub(rb'[^A-Za-z0-9+/=]', b'', data)
+        data = base64.b64decode(data[:len(data) - len(data) % 4])
+    elif encoding == 'QUOTED-PRINTABLE':
+        if partial:
+            data = re.sub(rb'=[0-9A-Fa-f]?$', b'', data)  # cut escape at range end
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return data.decode('utf-8', errors='ignore')
+
+
+# ==================== IMAP - Receive Email ====================
+
+FETCH_BATCH = 100  # UIDs per FETCH command during sync
+IMAP_COMPRESS = True  # turn on COMPRESS=DEFLATE after login when the server offers it
+
+# imaplib only sends commands it knows about
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+
+def _imap_connect(imap_server, imap_port, meter=None):
+    """Open a metered IMAP connection (implicit SSL on 993, STARTTLS otherwise)."""
+    if imap_port in IMPLICIT_TLS_PORTS:
+        return MeteredIMAP4_SSL(imap_server, imap_port, meter=meter)
+    mail = MeteredIMAP4(imap_server, imap_port, meter=meter)
+    mail.starttls()
+    return mail
+
+
+def _imap_login(mail, email_addr, password, compress=None):
+    """LOGIN, then negotiate COMPRESS=DEFLATE (RFC 4978) if the server offers it.
+
+    Servers often list COMPRESS only once logged in, in the [CAPABILITY ...]
+    code of the LOGIN reply, so that is checked as well as the greeting's
+    list. compress=None follows IMAP_COMPRESS. Returns True if the session
+    is now compressed.
+    """
+    status, data = mail.login(email_addr, password)
+    capabilities = set(mail.capabilities)
+    match = re.match(rb'\[CAPABILITY ([^\]]*)\]', data[0] or b'')
+    if match:
+        capabilities.update(match.group(1).decode('ascii', 'replace').upper().split())
+    if not (IMAP_COMPRESS if compress is None else compress) or 'COMPRESS=DEFLATE' not in capabilities:
+        return False
+    status, _ = mail._simple_command('COMPRESS', 'DEFLATE')
+    if status != 'OK':
+        return False
+    # Everything after the tagged OK is deflated in both directions; anything
+    # the old reader already buffered past the OK is compressed too
+    mail.sock = DeflateSocket(mail.sock, mail.meter, read_ahead=_read_ahead(mail) or b"")
+    mail.file = mail.sock.makefile('rb')
+    return True
+
+
+def _read_ahead(mail):
+    """Bytes imaplib's buffered reader holds but has not parsed yet, without blocking.
+
+    The socket is switched to non-blocking for a peek(), which returns the
+    buffered bytes, or reads whatever the socket has ready when the buffer
+    is empty. Returns None when a TLS or deflate layer is waiting for more
+    input, and b"" when nothing is ready (or, on a readable socket, at the
+    end of the stream).
+    """
+    timeout = mail.sock.gettimeout()
+    mail.sock.settimeout(0)
+    try:
+        return mail.file.peek()
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return None
+    finally:
+        mail.sock.settimeout(timeout)
+
+
+def _print_compression(wire):
+    """One line comparing compressed and uncompressed bytes, if the session was compressed."""
+    if wire and wire.get('uncompressed_recv'):
+        saved = 1 - wire['compressed_recv'] / wire['uncompressed_recv']
+        print(f"[IMAP] COMPRESS=DEFLATE: {wire['compressed_recv']} bytes received for "
+              f"{wire['uncompressed_recv']} uncompressed ({saved:.0%} saved)")
+
+
+def _parse_email(raw_email):
+    """Parse raw RFC822 bytes into {from, subject, date, body}."""
+    email_msg = message_from_bytes(raw_email)
+
+    # Extract details
+    subject = email_msg['Subject'] or "(No Subject)"
+    sender = email_msg['From'] or "(Unknown)"
+
+    # Extract body
+    body = ""
+    if email_msg.is_multipart():
+        for part in email_msg.walk():
+            if part.get_content_type() == "text/plain":
+                body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                break
+    else:
+        body = (email_msg.get_payload(decode=True) or b"").decode('utf-8', errors='ignore')
+
+    return {"from": sender, "subject": subject, "date": email_msg['Date'], "body": body}
+
+
+def _print_email(email_data):
+    """Display an email in the console."""
+    print("\n" + "="*50)
+    print("LATEST EMAIL:")
+    print("="*50)
+    print(f"From: {email_data['from']}")
+    print(f"Subject: {email_data['subject']}")
+    print("-"*50)
+    print(f"Body: {email_data['body'][:500]}")
+    for part in email_data.get('parts') or []:
+        print(f"Part {part['section']}: {part['filename'] or part['type']} ({part['size']} bytes, not downloaded)")
+    print("="*50 + "\n")
+
+
+def _fetch_lazy(mail, uids, partial=None):
+    """Fetch headers + BODYSTRUCTURE, then only the text/plain section.
+
+    partial limits the text section to its first N bytes (BODY.PEEK[n]<0.N>).
+    Attachments are never downloaded; they are listed under 'parts'.
+    Returns {uid: email_data}.
+    """
+    results = {}
+    text_parts = {}  # section -> [uid, ...]
+
+    status, msg_data = mail.uid('FETCH', ','.join(map(str, uids)),
+                                f'(UID RFC822.SIZE BODYSTRUCTURE {HEADER_FIELDS})')
+    if status != 'OK':
+        raise imaplib.IMAP4.error("UID FETCH failed")
+
+    for _, items in _parse_fetch_response(msg_data):
+        uid = int(items['UID'])
+        headers = BytesHeaderParser().parsebytes(_fetch_item(items, 'BODY[HEADER') or b"")
+        parts = list(_body_parts(items['BODYSTRUCTURE']))
+        text = next((p for p in parts if p['type'] == 'text/plain' and not p['attachment']), None)
+        results[uid] = {
+            "uid": uid,
+            "from": headers['From'] or "(Unknown)",
+            "subject": headers['Subject'] or "(No Subject)",
+            "date": headers['Date'],
+            "body": "",
+            "size": int(items.get('RFC822.SIZE') or 0),
+            "truncated": bool(text and partial and text['size'] > partial),
+            "parts": [p for p in parts if p is not text],
+            "_text": text,
+        }
+        if text:
+            text_parts.setdefault(text['section'], []).append(uid)
+
+    # One FETCH per distinct text section number (usually just "1")
+    for section, section_uids in text_parts.items():
+        spec = f'BODY.PEEK[{section}]' + (f'<0.{partial}>' if partial else '')
+        status, msg_data = mail.uid('FETCH', ','.join(map(str, section_uids)), f'(UID {spec})')
+        if status != 'OK':
+            raise imaplib.IMAP4.error("UID FETCH failed")
+        for _, items in _parse_fetch_response(msg_data):
+            email_data = results[int(items['UID'])]
+            text = email_data['_text']
+            data = _fetch_item(items, f'BODY[{section}]') or b""
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            email_data['body'] = _decode_body(data, text['encoding'], text['charset'],
+                                              partial=email_data['truncated'])
+
+    for email_data in results.values():
+        del email_data['_text']
+    return results
+
+
+def _quote_mailbox(name):
+    """Quote a mailbox name for SELECT if it contains spaces or specials."""
+    if re.search(r'[\s"(){%*\\]', name):
+        return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return name
+
+
+def _sync_session(mail, cache, account, mailbox='INBOX', lazy=False):
+    """Bring the cache up to date over a logged-in session.
+
+    Only UIDs above the last one seen are requested. When the server supports
+    CONDSTORE and HIGHESTMODSEQ is unchanged, no SEARCH or FETCH is sent at all.
+    With lazy=True only headers and the text/plain section are downloaded.
+    Returns the number of new messages.
+    """
+    if 'CONDSTORE' in mail.capabilities and 'ENABLE' in mail.capabilities:
+        mail.enable('CONDSTORE')
+
+    print(f"[IMAP] Selecting {mailbox}...")
+    status, data = mail.select(_quote_mailbox(mailbox))
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"SELECT {mailbox} failed")
+
+    exists = int(data[0] or 0)
+    uidvalidity = int(mail.response('UIDVALIDITY')[1][0])
+    modseq = mail.response('HIGHESTMODSEQ')[1][0]
+    modseq = int(modseq) if modseq else None
+
+    state = cache.get_state(account, mailbox)
+    last_uid = 0
+    if state and state[0] == uidvalidity:
+        last_uid = state[1]
+        if modseq is not None and state[2] == modseq and cache.count(account, mailbox) == exists:
+            print("[IMAP] Mailbox unchanged (HIGHESTMODSEQ), nothing to fetch.")
+            return 0
+    elif state:
+        print("[IMAP] UIDVALIDITY changed, discarding cached mailbox.")
+        cache.reset_mailbox(account, mailbox)
+
+    # Ask only for UIDs above the last one seen ("n:*" always matches the
+    # highest UID, so filter it out if it is not new)
+    status, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+    new_uids = []
+    if status == 'OK' and data[0]:
+        new_uids = [uid for uid in map(int, data[0].split()) if uid > last_uid]
+
+    if new_uids:
+        print(f"[IMAP] Fetching {len(new_uids)} new message(s)...")
+    for i in range(0, len(new_uids), FETCH_BATCH):
+        batch = new_uids[i:i + FETCH_BATCH]
+        if lazy:
+            fetched = _fetch_lazy(mail, batch)
+            for uid, email_data in fetched.items():
+                cache.store(account, mailbox, uidvalidity, uid, email_data, email_data['size'])
+            last_uid = max(last_uid, max(batch))
+            continue
+
+        status, msg_data = mail.uid('FETCH', ','.join(map(str, batch)), '(RFC822)')
+        if status != 'OK':
+            raise imaplib.IMAP4.error("UID FETCH failed")
+
+        for item in msg_data:
+            if not isinstance(item, tuple):
+                continue
+            match = re.search(rb'UID (\d+)', item[0])
+            if not match:
+                continue
+            raw_email = item[1]
+            cache.store(account, mailbox, uidvalidity, int(match.group(1)),
+                        _parse_email(raw_email), len(raw_email))
+        last_uid = max(last_uid, max(batch))
+
+    # More cached than the server holds means messages were expunged
+    if cache.count(account, mailbox) > exists:
+        status, data = mail.uid('SEARCH', None, 'ALL')
+        if status == 'OK':
+            cache.prune(account, mailbox, uidvalidity, map(int, (data[0] or b"").split()))
+
+    cache.set_state(account, mailbox, uidvalidity, last_uid, modseq)
+    return len(new_uids)
+
+
+def sync_mailbox(email_addr, password, imap_server="mail.tm", imap_port=993,
+                 mailbox='INBOX', cache=None, lazy=False):
+    """Incrementally sync a mailbox into the local cache.
+
+    Returns (success, time, bytes, packets_sent, packets_recv, new_count).
+    """
+    cache = cache or default_mail_cache()
+    start_time = time.perf_counter()
+    record = ('imap_sync', imap_server, imap_port)
+    meter = WireMeter()
+
+    try:
+        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, meter)
+
+        print("[IMAP] Logging in...")
+        _imap_login(mail, email_addr, password)
+        meter.mark('auth')
+
+        account = account_key(email_addr, imap_server, imap_port)
+        new_count = _sync_session(mail, cache, account, mailbox, lazy)
+        meter.mark('transfer')
+
+        mail.logout()
+        meter.mark('quit')
+
+        metrics = _metrics(True, start_time, meter.stats(), 'recv', new_count, record=record)
+        print(f"[IMAP] Synced {mailbox}: {new_count} new, Time: {metrics[1]:.3f}s, Bytes: {metrics[2]}")
+        _print_compression(metrics.wire)
+        return metrics
+
+    except Exception as e:
+        print(f"[IMAP] ERROR: {e}")
+        return _metrics(False, start_time, meter.stats(), 'recv', 0, record=record)
+
+
+_default_cache = None
+
+
+def default_mail_cache():
+    """Return the process-wide MailCache, opening it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MailCache()
+    return _default_cache
+
+
+def receive_email(email_addr, password, imap_server="mail.tm", imap_port=993, cache=None,
+                  lazy=False, partial=2048, meter=None):
+    """Receive latest email using IMAP. Returns (success, time, bytes, packets_sent, packets_recv, email_data).
+
+    With a cache, only new UIDs are fetched and the latest email is read from
+    the cache, so nothing is downloaded when the mailbox has not changed.
+    With lazy=True, headers and BODYSTRUCTURE are fetched first and then only
+    the first `partial` bytes of the text/plain part; attachments are listed
+    in email_data['parts'] but not downloaded. Pass a WireMeter to follow
+    the phases as they happen or to abort() the operation.
+    """
+    start_time = time.perf_counter()
+    record = ('imap_receive', imap_server, imap_port)
+    meter = meter or WireMeter()
+    email_data = None
+
+    try:
+        # Connect to IMAP server
+        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, meter)
+
+        # Login
+        print("[IMAP] Logging in...")
+        _imap_login(mail, email_addr, password)
+        meter.mark('auth')
+
+        if cache is not None:
+            account = account_key(email_addr, imap_server, imap_port)
+            _sync_session(mail, cache, account, 'INBOX', lazy)
+            latest = cache.latest(account, 'INBOX')
+            email_data = latest[0] if latest else None
+        elif lazy:
+            print("[IMAP] Selecting INBOX...")
+            mail.select('INBOX')
+
+            status, messages = mail.uid('SEARCH', None, 'ALL')
+
+            if status == 'OK' and messages[0]:
+                latest_uid = int(messages[0].split()[-1])
+                print("[IMAP] Fetching headers and text of latest email...")
+                fetched = _fetch_lazy(mail, [latest_uid], partial)
+                email_data = fetched.get(latest_uid)
+        else:
+            # Select inbox
+            print("[IMAP] Selecting INBOX...")
+            mail.select('INBOX')
+
+            # Search for all emails
+            status, messages = mail.search(None, 'ALL')
+
+            if status == 'OK' and messages[0]:
+                # Get latest email
+                email_ids = messages[0].split()
+                latest_id = email_ids[-1]
+
+                print("[IMAP] Fetching latest email...")
+                status, msg_data = mail.fetch(latest_id, '(RFC822)')
+
+                if status != 'OK':
+                    print("[IMAP] ERROR: Failed to fetch email.")
+                    mail.logout()
+                    return _metrics(False, start_time, meter.stats(), 'recv', None, record=record)
+
+                # Parse email
+                raw_email = msg_data[0][1]
+                email_data = _parse_email(raw_email)
+
+        meter.mark('transfer')
+
+        if email_data is None:
+            print("[IMAP] No emails found.")
+            mail.logout()
+            meter.mark('quit')
+            return _metrics(True, start_time, meter.stats(), 'recv', None, record=record)
+
+        # Store email data
+        email_data = dict(email_data, body=email_data['body'][:500])
+
+        mail.logout()
+        meter.mark('quit')
+
+        metrics = _metrics(True, start_time, meter.stats(), 'recv', email_data, record=record)
+
+        # Display email in console
+        _print_email(email_data)
+
+        print(f"[IMAP] SUCCESS! Time: {metrics[1]:.3f}s, Bytes: {metrics[2]}")
+        print(f"[IMAP] Packets sent: {metrics[3]}, received: {metrics[4]}")
+        _print_compression(metrics.wire)
+        return metrics
+
+    except Exception as e:
+        print(f"[IMAP] ERROR: {e}")
+        return _metrics(False, start_time, meter.stats(), 'recv', None, record=record)
+
+
+# ==================== IMAP - Session Pool ====================
+
+class IMAPSessionPool(SMTPConnectionPool):
+    """Pool of logged-in IMAP sessions keyed by (server, port, user).
+
+    Same interface as SMTPConnectionPool (NOOP health check, reconnect when
+    the server has dropped an idle session). A session may come back with
+    any mailbox selected, so callers SELECT or EXAMINE what they need.
+    """
+
+    def _connect(self, imap_server, imap_port, user, password):
+        print(f"[IMAP] Pool: connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, WireMeter())
+        _imap_login(mail, user, password)
+        mail.meter.mark('auth')
+        return mail
+
+    @staticmethod
+    def _is_alive(mail):
+        try:
+            return mail.noop()[0] == 'OK'
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _close(mail):
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+
+
+def _receive_pooled(pool, email_addr, password, imap_server, imap_port, mailbox='INBOX',
+                    uid=None, partial=2048, raise_errors=False):
+    """Fetch one message (the latest, or uid) over a pooled session.
+
+    Headers and the first `partial` bytes of the text are fetched as with
+    receive_email(lazy=True). Returns (success, time, bytes, packets_sent,
+    packets_recv, email_data); email_data is None for an empty mailbox.
+    raise_errors works as for _send_pooled.
+    """
+    start_time = time.perf_counter()
+    record = ('imap_receive', imap_server, imap_port)
+    wire = None
+
+    try:
+        # One reconnect attempt if the session died between NOOP and use
+        for attempt in range(2):
+            mail, reused = pool.acquire(imap_server, imap_port, email_addr, password)
+            since = mail.meter.snapshot() if reused else None
+            mail.meter.begin()
+
+            try:
+                status, data = mail.select(_quote_mailbox(mailbox), readonly=True)
+                if status != 'OK':
+                    raise imaplib.IMAP4.error(f"EXAMINE {mailbox} failed")
+                if uid is None and not int(data[0] or 0):
+                    target = None
+                elif uid is None:
+                    status, data = mail.uid('SEARCH', None, '*')
+                    uids = (data[0] or b"").split() if status == 'OK' else []
+                    target = int(uids[-1]) if uids else None
+                else:
+                    target = int(uid)
+                email_data = _fetch_lazy(mail, [target], partial).get(target) if target else None
+            except (imaplib.IMAP4.abort, OSError):
+                pool.release(imap_server, imap_port, email_addr, mail, broken=True)
+                if attempt:
+                    raise
+                print("[IMAP] Pooled session dropped, reconnecting...")
+                continue
+            except Exception:
+                # A NO reply leaves the session usable
+                pool.release(imap_server, imap_port, email_addr, mail)
+                raise
+
+            mail.meter.mark('transfer')
+            wire = mail.meter.stats(since)
+            pool.release(imap_server, imap_port, email_addr, mail)
+            break
+
+        if uid is not None and email_data is None:
+            raise imaplib.IMAP4.error(f"no message with UID {uid} in {mailbox}")
+        metrics = _metrics(True, start_time, wire, 'recv', email_data, record=record)
+        print(f"[IMAP] SUCCESS! Time: {metrics[1]:.3f}s, Bytes: {metrics[2]} "
+              f"({'reused' if reused else 'new'} session)")
+        return metrics
+
+    except Exception as e:
+        metrics = _metrics(False, start_time, wire, 'recv', None, record=record)
+        if raise_errors:
+            raise
+        print(f"[IMAP] ERROR: {e}")
+        return metrics
+
+
+# ==================== IMAP - Inbox Listing ====================
+
+ENVELOPE_ITEMS = '(UID FLAGS RFC822.SIZE INTERNALDATE ENVELOPE)'
+
+
+def _decode_words(value):
+    """Decode RFC 2047 encoded words in an ENVELOPE string."""
+    value = _as_text(value)
+    if not value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _envelope_addresses(addresses):
+    """Format an ENVELOPE address list as "Name <mailbox@host>, ..."."""
+    formatted = []
+    for address in addresses or []:
+        name, _, mailbox, host = (list(address) + [None] * 4)[:4]
+        if mailbox is None or host is None:
+            continue  # group start/end markers
+        address = f"{_as_text(mailbox)}@{_as_text(host)}"
+        name = _decode_words(name)
+        formatted.append(f'"{name}" <{address}>' if name and ',' in name else
+                         f"{name} <{address}>" if name else address)
+    return ", ".join(formatted)
+
+
+def _envelope_data(seq, items):
+    """Turn one FETCH (UID FLAGS RFC822.SIZE INTERNALDATE ENVELOPE) response into a dict."""
+    envelope = items.get('ENVELOPE') or [None] * 10
+    flags = [_as_text(flag) for flag in items.get('FLAGS') or []]
+    return {
+        "uid": int(items['UID']),
+        "seq": seq,
+        "from": _envelope_addresses(envelope[2]) or "(Unknown)",
+        "to": _envelope_addresses(envelope[5]),
+        "subject": _decode_words(envelope[1]) or "(No Subject)",
+        "date": _as_text(envelope[0]),
+        "message_id": _as_text(envelope[9]),
+        "internaldate": _as_text(items.get('INTERNALDATE')),
+        "size": int(items.get('RFC822.SIZE') or 0),
+        "flags": flags,
+        "seen": '\\Seen' in flags,
+    }
+
+
+def _stream_fetch(mail, message_set, items, by_uid=False):
+    """Send one FETCH and yield (seq, {ITEM: value}) as each response arrives.
+
+    imaplib's fetch() only returns once the tagged completion has been read;
+    here every untagged FETCH response is parsed as soon as it is complete,
+    so the first rows of a page are available before the last one arrives.
+    """
+    mail.untagged_responses.pop('FETCH', None)
+    if by_uid:
+        tag = mail._command('UID', 'FETCH', message_set, items)
+    else:
+        tag = mail._command('FETCH', message_set, items)
+    try:
+        while mail.tagged_commands[tag] is None:
+            mail._get_response()
+            responses = mail.untagged_responses.pop('FETCH', None)
+            if responses:
+                yield from _parse_fetch_response(responses)
+    except GeneratorExit:
+        # Abandoned mid-page: read the rest so the session stays usable
+        while mail.tagged_commands[tag] is None:
+            mail._get_response()
+        mail.tagged_commands.pop(tag)
+        mail.untagged_responses.pop('FETCH', None)
+        raise
+    status, data = mail.tagged_commands.pop(tag)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"FETCH failed: {_as_text(data[-1])}")
+
+
+class MailboxPager:
+    """Page through a mailbox's envelopes over one open IMAP session.
+
+    Each page is a single FETCH of sequence numbers (newest first: page 0 is
+    the newest page_size messages), so listing N messages costs one round
+    trip per page instead of a session per message. Rows are yielded as the
+    server streams them, oldest of the page first. uid_range() fetches a UID
+    range the same way. Nothing is marked \\Seen (the mailbox is EXAMINEd).
+    """
+
+    def __init__(self, email_addr, password, imap_server="mail.tm", imap_port=993,
+                 mailbox='INBOX', page_size=25):
+        self.email_addr = email_addr
+        self.password = password
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.mailbox = mailbox
+        self.page_size = page_size
+        self.meter = WireMeter()
+        self.mail = None
+        self.exists = 0
+        self.last_metrics = None   # metrics of the last page, once it is exhausted
+
+    def open(self):
+        """Connect, log in and EXAMINE the mailbox. Returns self."""
+        print(f"[IMAP] Connecting to {self.imap_server}:{self.imap_port}...")
+        self.mail = _imap_connect(self.imap_server, self.imap_port, self.meter)
+        _imap_login(self.mail, self.email_addr, self.password)
+        self.meter.mark('auth')
+        status, data = self.mail.select(_quote_mailbox(self.mailbox), readonly=True)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SELECT {self.mailbox} failed")
+        self.exists = int(data[0] or 0)
+        return self
+
+    def close(self):
+        if self.mail is not None:
+            try:
+                self.mail.logout()
+            except Exception:
+                pass
+            self.mail = None
+
+    @property
+    def pages(self):
+        return max(1, -(-self.exists // self.page_size))
+
+    def refresh(self):
+        """NOOP to pick up new or expunged mail. Returns the message count."""
+        self.mail.noop()
+        self._update_exists()
+        return self.exists
+
+    def page(self, number=0):
+        """Yield the envelopes of one page (0 = newest)."""
+        self._update_exists()
+        last = self.exists - number * self.page_size
+        first = max(1, last - self.page_size + 1)
+        if last < 1:
+            self.last_metrics = _metrics(True, time.perf_counter(), None, 'recv', 0)
+            return
+        yield from self._fetch(f"{first}:{last}", by_uid=False)
+
+    def uid_range(self, first_uid, last_uid='*'):
+        """Yield the envelopes of the messages with first_uid <= UID <= last_uid."""
+        yield from self._fetch(f"{first_uid}:{last_uid}", by_uid=True)
+
+    def _fetch(self, message_set, by_uid):
+        start_time = time.perf_counter()
+        since = self.meter.snapshot()
+        self.meter.begin()
+        count = 0
+        for seq, items in _stream_fetch(self.mail, message_set, ENVELOPE_ITEMS, by_uid):
+            count += 1
+            yield _envelope_data(seq, items)
+        self.meter.mark('transfer')
+        self.last_metrics = _metrics(True, start_time, self.meter.stats(since), 'recv', count,
+                                     record=('imap_list', self.imap_server, self.imap_port))
+
+    def _update_exists(self):
+        """Apply untagged EXISTS and EXPUNGE responses to the message count.
+
+        Servers send EXISTS after the expunges it follows, so without one
+        each EXPUNGE lowers the count by one.
+        """
+        exists = self.mail.untagged_responses.pop('EXISTS', None)
+        expunged = self.mail.untagged_responses.pop('EXPUNGE', None)
+        if exists and exists[-1]:
+            self.exists = int(exists[-1])
+        elif expunged:
+            self.exists = max(0, self.exists - len(expunged))
+
+
+def list_messages(email_addr, password, imap_server="mail.tm", imap_port=993,
+                  mailbox='INBOX', count=20, uid_range=None):
+    """List the newest `count` messages (or a (first, last) UID range) in one FETCH.
+
+    Returns (success, time, bytes, packets_sent, packets_recv, messages) with
+    messages newest first.
+    """
+    start_time = time.perf_counter()
+    record = ('imap_list', imap_server, imap_port)
+    pager = MailboxPager(email_addr, password, imap_server, imap_port, mailbox, count)
+    messages = []
     try:
-        from plyer import notification
-        notification.notify(title=title, message=message, app_name="Email Client", timeout=2)
-    except ImportError:
-        print("[!] Plyer not installed. Run: pip install plyer")
+        pager.open()
+        rows = pager.uid_range(*uid_range) if uid_range else pager.page(0)
+        messages = list(rows)[::-1]
+        pager.close()
+        pager.meter.mark('quit')
+        metrics = _metrics(True, start_time, pager.meter.stats(), 'recv', messages)  # pages are recorded
+        print(f"[IMAP] Listed {len(messages)} message(s) in {metrics[1]:.3f}s, Bytes: {metrics[2]}")
+        return metrics
     except Exception as e:
-        print(f"[!] Notification error: {e}")
+        print(f"[IMAP] ERROR: {e}")
+        pager.close()
+        return _metrics(False, start_time, pager.meter.stats(), 'recv', messages, record=record)
 
 
-# ==================== SMTP - Send Email ====================
+def _print_listing(messages):
+    """Print one line per message: flags, date, sender, subject."""
+    print("\n" + "="*75)
+    for email_data in messages:
+        mark = ' ' if email_data['seen'] else '*'
+        print(f"{mark} {email_data['uid']:>6}  {(email_data['internaldate'] or '')[:11]:<11}  "
+              f"{email_data['from'][:24]:<24}  {email_data['subject'][:28]}")
+    print("="*75 + "\n")
 
-def send_email(sender_email, password, recipient_email, subject, body,
-               smtp_server="mail.tm", smtp_port=465):
-    """Send an email using SMTP. Returns (success, time, bytes, packets_sent, packets_recv)."""
-    start_time = time.time()
-    bytes_sent = 0
-    # SMTP typical packet count: 3 (handshake) + ~8 (SMTP commands/responses) + 4 (close)
-    packets_sent = 0
-    packets_recv = 0
 
+# ==================== IMAP - Attachment Download ====================
+
+ATTACHMENT_CHUNK = 1024 * 1024  # encoded bytes per partial FETCH
+ATTACHMENT_PIPELINE = 4         # partial FETCHes in flight
+
+
+class _StreamDecoder:
+    """Incremental Content-Transfer-Encoding decoder.
+
+    feed() decodes as much of the data seen so far as it can and keeps the
+    incomplete tail (a partial base64 quantum or an unfinished QP line) for
+    the next call, so memory stays at one chunk.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or '7BIT').upper()
+        self._pending = b""
+
+    def feed(self, data):
+        if self.encoding == 'BASE64':
+            data = self._pending + data.translate(None, b' \t\r\n')
+            cut = len(data) - len(data) % 4
+            self._pending = data[cut:]
+            return binascii.a2b_base64(data[:cut])
+        if self.encoding == 'QUOTED-PRINTABLE':
+            data = self._pending + data
+            cut = data.rfind(b'\n') + 1
+            if not cut and len(data) > 65536:
+                # No line breaks: don't split an "=XY" escape or trailing
+                # whitespace (which decoding strips at the end of a line)
+                escape = data.rfind(b'=', len(data) - 2)
+                cut = escape if escape >= 0 else len(data)
+                while cut and data[cut - 1:cut] in (b' ', b'\t'):
+                    cut -= 1
+            self._pending = data[cut:]
+            return binascii.a2b_qp(data[:cut])
+        return data
+
+    def flush(self):
+        data, self._pending = self._pending, b""
+        if self.encoding == 'BASE64':
+            try:
+                return binascii.a2b_base64(data + b'=' * (-len(data) % 4)) if data else b""
+            except binascii.Error:
+                return b""  # truncated input
+        if self.encoding == 'QUOTED-PRINTABLE':
+            return binascii.a2b_qp(data)
+        return data
+
+
+def _message_parts(mail, uid):
+    """Leaf MIME parts of one message, from its BODYSTRUCTURE."""
+    status, msg_data = mail.uid('FETCH', str(uid), '(UID BODYSTRUCTURE)')
+    if status != 'OK':
+        raise imaplib.IMAP4.error("UID FETCH failed")
+    for _, items in _parse_fetch_response(msg_data):
+        if int(items['UID']) == uid:
+            return list(_body_parts(items['BODYSTRUCTURE']))
+    raise imaplib.IMAP4.error(f"no message with UID {uid}")
+
+
+def _fetch_section_chunks(mail, uid, section, size, chunk_size=ATTACHMENT_CHUNK,
+                          pipeline=ATTACHMENT_PIPELINE):
+    """Yield the encoded bytes of one body section, in order, chunk by chunk.
+
+    Each chunk is a BODY.PEEK[section]<offset.chunk_size> FETCH; up to
+    `pipeline` of them are in flight so the link stays busy, and only those
+    chunks are ever held in memory. size is the encoded size from
+    BODYSTRUCTURE; if it turns out to be short, fetching continues until the
+    server returns a short chunk.
+    """
+    pending = deque()  # (offset, tag) in the order sent
+    chunks = {}        # offset -> data
+    next_offset = 0
+    end = max(size, 1)
+    mail.untagged_responses.pop('FETCH', None)
+
+    while pending or next_offset < end:
+        while next_offset < end and len(pending) < pipeline:
+            tag = mail._command('UID', 'FETCH', str(uid),
+                                f'(UID BODY.PEEK[{section}]<{next_offset}.{chunk_size}>)')
+            pending.append((next_offset, tag))
+            next_offset += chunk_size
+
+        offset, tag = pending.popleft()
+        while mail.tagged_commands[tag] is None:
+            mail._get_response()
+        status, data = mail.tagged_commands.pop(tag)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"FETCH failed: {_as_text(data[-1])}")
+        for _, items in _parse_fetch_response(mail.untagged_responses.pop('FETCH', [])):
+            for key, value in items.items():
+                match = re.match(r'BODY\[[^\]]*\]<(\d+)>', key)
+                if match:
+                    chunks[int(match.group(1))] = value.encode('latin-1') if isinstance(value, str) else value or b""
+
+        data = chunks.pop(offset, b"")
+        yield data
+        if len(data) < chunk_size:
+            # End of the section: let the requests still in flight finish
+            for _, tag in pending:
+                while mail.tagged_commands[tag] is None:
+                    mail._get_response()
+                mail.tagged_commands.pop(tag)
+            mail.untagged_responses.pop('FETCH', None)
+            return
+        if not pending and next_offset >= end:
+            end += chunk_size
+
+
+def _attachment_path(path, part, uid):
+    """Where to save a part: path itself, or path/<filename> if path is a directory."""
+    if not os.path.isdir(path):
+        return path
+    name = _decode_words(part['filename']) or f"{uid}-{part['section']}"
+    name = os.path.basename(name.replace('\\', '/')) or f"{uid}-{part['section']}"
+    return os.path.join(path, name)
+
+
+def _save_section(mail, uid, part, target, chunk_size, pipeline):
+    """Stream one part to target (written as target.part, then renamed). Returns decoded size."""
+    decoder = _StreamDecoder(part['encoding'])
+    written = 0
     try:
-        # Create email message
-        message = MIMEMultipart()
-        message['From'] = sender_email
-        message['To'] = recipient_email
-        message['Subject'] = subject
-        message.attach(MIMEText(body, 'plain'))
+        with open(target + '.part', 'wb') as out:
+            for chunk in _fetch_section_chunks(mail, uid, part['section'], part['size'],
+                                               chunk_size, pipeline):
+                data = decoder.feed(chunk)
+                out.write(data)
+                written += len(data)
+            data = decoder.flush()
+            out.write(data)
+            written += len(data)
+    except BaseException:
+        # open() itself may have failed: keep the original error
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(target + '.part')
+        raise
+    os.replace(target + '.part', target)
+    return written
 
-        msg_string = message.as_string()
-        bytes_sent = len(msg_string.encode('utf-8'))
 
-        # Connect to SMTP server
-        print(f"[SMTP] Connecting to {smtp_server}:{smtp_port}...")
-        
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=30)
+def download_attachment(email_addr, password, imap_server="mail.tm", imap_port=993, uid=None,
+                        section=None, path='.', mailbox='INBOX', chunk_size=ATTACHMENT_CHUNK,
+                        pipeline=ATTACHMENT_PIPELINE, meter=None):
+    """Save a message part to disk without loading the message into memory.
+
+    The part (section like "2", or every attachment when section is None) is
+    fetched in chunks, decoded as it arrives and written straight to the
+    file, so memory use does not grow with its size. path is a file name
+    (single section) or a directory. Returns (success, time, bytes,
+    packets_sent, packets_recv, saved) where saved lists
+    {section, path, size} per file. meter works as for receive_email().
+    """
+    start_time = time.perf_counter()
+    record = ('imap_download', imap_server, imap_port)
+    meter = meter or WireMeter()
+    mail = None
+    saved = []
+
+    try:
+        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, meter)
+        _imap_login(mail, email_addr, password)
+        meter.mark('auth')
+        status, _ = mail.select(_quote_mailbox(mailbox), readonly=True)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SELECT {mailbox} failed")
+
+        parts = _message_parts(mail, uid)
+        if section is not None:
+            parts = [p for p in parts if p['section'] == section]
+            if not parts:
+                raise ValueError(f"message {uid} has no section {section}")
         else:
-            server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
-            server.starttls()
-        
-        packets_sent += 2  # SYN, ACK
-        packets_recv += 1  # SYN-ACK
+            parts = [p for p in parts if p['attachment'] or p['filename']]
+            if not parts:
+                print(f"[IMAP] Message {uid} has no attachments.")
 
-        # Login and send
-        print("[SMTP] Logging in...")
-        server.login(sender_email, password)
-        packets_sent += 2  # AUTH command + credentials
-        packets_recv += 2  # AUTH responses
-        
-        print("[SMTP] Sending email...")
-        server.sendmail(sender_email, recipient_email, msg_string)
-        packets_sent += 4  # MAIL FROM, RCPT TO, DATA, message
-        packets_recv += 4  # Responses
-        
-        server.quit()
-        packets_sent += 2  # QUIT + FIN
-        packets_recv += 2  # Response + FIN-ACK
+        for part in parts:
+            target = _attachment_path(path, part, uid)
+            part_start = time.perf_counter()
+            size = _save_section(mail, uid, part, target, chunk_size, pipeline)
+            elapsed = time.perf_counter() - part_start
+            saved.append({"section": part['section'], "path": target, "size": size})
+            print(f"[IMAP] Saved {target} ({size} bytes, "
+                  f"{size / elapsed / 1e6 if elapsed > 0 else 0:.2f} MB/s)")
+        meter.mark('transfer')
 
-        time_taken = time.time() - start_time
-        print(f"[SMTP] SUCCESS! Time: {time_taken:.3f}s, Bytes: {bytes_sent}")
-        print(f"[SMTP] Packets sent: {packets_sent}, received: {packets_recv}")
-        return True, time_taken, bytes_sent, packets_sent, packets_recv
+        mail.logout()
+        meter.mark('quit')
+        metrics = _metrics(True, start_time, meter.stats(), 'recv', saved, record=record)
+        print(f"[IMAP] SUCCESS! Time: {metrics[1]:.3f}s, Bytes: {metrics[2]} "
+              f"({metrics[2] / metrics[1] / 1e6 if metrics[1] > 0 else 0:.2f} MB/s on the wire)")
+        _print_compression(metrics.wire)
+        return metrics
 
-    except smtplib.SMTPAuthenticationError:
-        print("[SMTP] ERROR: Authentication failed.")
-        return False, time.time() - start_time, bytes_sent, packets_sent, packets_recv
     except Exception as e:
-        print(f"[SMTP] ERROR: {e}")
-        return False, time.time() - start_time, bytes_sent, packets_sent, packets_recv
+        print(f"[IMAP] ERROR: {e}")
+        if mail is not None:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+        return _metrics(False, start_time, meter.stats(), 'recv', saved, record=record)
 
 
-# ==================== IMAP - Receive Email ====================
+# ==================== IMAP - Export / Import ====================
 
-def receive_email(email_addr, password, imap_server="mail.tm", imap_port=993):
-    """Receive latest email using IMAP. Returns (success, time, bytes, packets_sent, packets_recv, email_data)."""
-    start_time = time.time()
-    bytes_received = 0
-    packets_sent = 0
-    packets_recv = 0
-    email_data = None
+EXPORT_CHUNK = 250        # UIDs per UID FETCH during export
+EXPORT_CONNECTIONS = 4    # parallel IMAP sessions during export
+APPEND_PIPELINE = 16      # APPEND commands in flight during import (LITERAL+)
+MULTIAPPEND_BATCH = 25    # messages per APPEND when the server offers MULTIAPPEND
+EXPORT_ITEMS = '(UID FLAGS INTERNALDATE BODY.PEEK[])'
 
-    try:
-        # Connect to IMAP server
-        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
-        mail = imaplib.IMAP4_SSL(imap_server, imap_port)
-        packets_sent += 2  # SYN, ACK
-        packets_recv += 1  # SYN-ACK
 
-        # Login
-        print("[IMAP] Logging in...")
-        mail.login(email_addr, password)
-        packets_sent += 1  # LOGIN command
-        packets_recv += 1  # LOGIN response
+def _internaldate_seconds(value):
+    """INTERNALDATE ("17-Oct-2026 09:30:00 +0000") as a Unix timestamp, or None."""
+    value = _as_text(value)
+    if not value:
+        return None
+    parsed = imaplib.Internaldate2tuple(b'INTERNALDATE "' + value.encode('ascii') + b'"')
+    return time.mktime(parsed) if parsed else None
 
-        # Select inbox
-        print("[IMAP] Selecting INBOX...")
-        mail.select('INBOX')
-        packets_sent += 1  # SELECT command
-        packets_recv += 1  # SELECT response
 
-        # Search for all emails
-        status, messages = mail.search(None, 'ALL')
-        packets_sent += 1  # SEARCH command
-        packets_recv += 1  # SEARCH response
+def _export_range(mail, lo, hi, write):
+    """UID FETCH one range of whole messages, handing each to write(). Returns the count."""
+    count = 0
+    for _, items in _stream_fetch(mail, f'{lo}:{hi}', EXPORT_ITEMS, by_uid=True):
+        uid = int(items['UID'])
+        raw = _fetch_item(items, 'BODY[')
+        if raw is None or not lo <= uid <= hi:
+            continue
+        if isinstance(raw, str):
+            raw = raw.encode('latin-1')
+        flags = [_as_text(flag) for flag in items.get('FLAGS') or []]
+        write(uid, raw, flags, _internaldate_seconds(items.get('INTERNALDATE')))
+        count += 1
+    return count
 
-        if status != 'OK' or not messages[0]:
-            print("[IMAP] No emails found.")
-            mail.logout()
-            return True, time.time() - start_time, 0, packets_sent, packets_recv, None
 
-        # Get latest email
-        email_ids = messages[0].split()
-        latest_id = email_ids[-1]
+def export_mailbox(email_addr, password, imap_server="mail.tm", imap_port=993, mailbox='INBOX',
+                   path='INBOX.mbox', fmt=None, connections=EXPORT_CONNECTIONS,
+                   chunk_size=EXPORT_CHUNK, checkpoint=None):
+    """Stream a whole mailbox into an mbox file or a Maildir.
+
+    fmt is 'mbox' or 'maildir' (default: Maildir if path is a directory or
+    ends in a slash). The UIDs found by UID SEARCH are split into chunks of
+    chunk_size and fetched with UID FETCH by up to `connections` sessions in
+    parallel; only
+    the message being written is held in memory. For mbox each chunk goes to
+    its own part file and the parts are appended to path in UID order.
+
+    Progress is kept in a checkpoint file (default path + '.export.json'),
+    so running the export again continues after the last complete chunk;
+    it starts over if the mailbox's UIDVALIDITY changed or the output is
+    missing or shorter than the checkpoint says. Returns (success,
+    time, bytes, packets_sent, packets_recv, exported).
+    """
+    start_time = time.perf_counter()
+    record = ('imap_export', imap_server, imap_port)
+    fmt = fmt or archive_format(path)
+    checkpoint = Checkpoint(checkpoint or path.rstrip('/' + os.sep) + '.export.json')
+    meters = [WireMeter() for _ in range(max(1, connections))]
+    mail = None
+    out = None
+    exported = 0
+    cond = threading.Condition()
+    errors = []
 
-        print("[IMAP] Fetching latest email...")
-        status, msg_data = mail.fetch(latest_id, '(RFC822)')
-        packets_sent += 1  # FETCH command
-        packets_recv += 2  # FETCH response (may be multiple packets for large emails)
+    def wire():
+        return merge_stats([meter.stats() for meter in meters])
 
+    try:
+        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, meters[0])
+        _imap_login(mail, email_addr, password)
+        meters[0].mark('auth')
+        status, data = mail.select(_quote_mailbox(mailbox), readonly=True)
         if status != 'OK':
-            print("[IMAP] ERROR: Failed to fetch email.")
-            mail.logout()
-            return False, time.time() - start_time, 0, packets_sent, packets_recv, None
-
-        # Parse email
-        raw_email = msg_data[0][1]
-        bytes_received = len(raw_email)
-        email_msg = message_from_bytes(raw_email)
-
-        # Extract details
-        subject = email_msg['Subject'] or "(No Subject)"
-        sender = email_msg['From'] or "(Unknown)"
-
-        # Extract body
-        body = ""
-        if email_msg.is_multipart():
-            for part in email_msg.walk():
-                if part.get_content_type() == "text/plain":
-                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    break
+            raise imaplib.IMAP4.error(f"EXAMINE {mailbox} failed")
+        exists = int(data[0] or 0)
+        uidvalidity = int(mail.response('UIDVALIDITY')[1][0])
+
+        state = checkpoint.load(mailbox=mailbox, uidvalidity=uidvalidity, format=fmt)
+        if state and not (os.path.isdir(path) if fmt == MAILDIR else
+                          os.path.isfile(path) and os.path.getsize(path) >= state['mbox_size']):
+            print(f"[IMAP] {path} does not match the checkpoint, exporting from the start")
+            state = None
+        next_uid = state['next_uid'] if state else 1
+        if state:
+            print(f"[IMAP] Resuming export of {mailbox} at UID {next_uid} "
+                  f"({state['exported']} message(s) already exported)")
+            exported = state['exported']
+
+        if fmt == MAILDIR:
+            writer = MaildirWriter(path)
         else:
-            body = email_msg.get_payload(decode=True).decode('utf-8', errors='ignore')
+            out = open(path, 'r+b' if state else 'wb')
+            out.truncate(state['mbox_size'] if state else 0)
+            out.seek(0, os.SEEK_END)
 
-        # Store email data
-        email_data = {"from": sender, "subject": subject, "body": body[:500]}
+        # Chunk the UIDs that exist, so sparse UID spaces cost no empty FETCHes
+        # ("n:*" always matches the highest UID, so filter it)
+        status, data = mail.uid('SEARCH', None, f'UID {next_uid}:*')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"UID SEARCH {mailbox} failed")
+        uids = [uid for uid in map(int, (data[0] or b"").split()) if uid >= next_uid]
+        ranges = [(uids[i], uids[min(i + chunk_size, len(uids)) - 1])
+                  for i in range(0, len(uids), chunk_size)]
+        del uids
+        print(f"[IMAP] Exporting {mailbox} ({exists} messages) to {path} as {fmt}, "
+              f"{len(ranges)} chunk(s) over {min(len(meters), len(ranges))} connection(s)...")
+
+        finished = {}               # range index -> (count, part file or None)
+        claimed = [0, 0]            # next range to hand out, ranges committed so far
+        window = 2 * len(meters)    # ranges a worker may run ahead of the commit point
+
+        def worker(index):
+            session = mail if index == 0 else None
+            try:
+                while True:
+                    with cond:
+                        cond.wait_for(lambda: errors or claimed[0] - claimed[1] < window)
+                        if errors or claimed[0] >= len(ranges):
+                            return
+                        i = claimed[0]
+                        claimed[0] += 1
+                    if session is None:
+                        session = _imap_connect(imap_server, imap_port, meters[index])
+                        _imap_login(session, email_addr, password)
+                        status, _ = session.select(_quote_mailbox(mailbox), readonly=True)
+                        if status != 'OK':
+                            raise imaplib.IMAP4.error(f"EXAMINE {mailbox} failed")
+                    lo, hi = ranges[i]
+                    if fmt == MAILDIR:
+                        part = None
+                        count = _export_range(session, lo, hi, lambda uid, raw, flags, date: writer.add(
+                            raw, flags, date, name=f"{int(date or 0)}.U{uid}V{uidvalidity}"))
+                    else:
+                        part = f"{path}.{lo}-{hi}.part"
+                        try:
+                            with open(part, 'wb') as f:
+                                count = _export_range(session, lo, hi, lambda uid, raw, flags, date:
+                                                      write_mbox_message(f, raw, flags, date))
+                        except BaseException:
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(part)
+                            raise
+                    with cond:
+                        finished[i] = (count, part)
+                        cond.notify_all()
+            except Exception as e:
+                with cond:
+                    errors.append(e)
+                    cond.notify_all()
+            finally:
+                if index and session is not None:
+                    try:
+                        session.logout()
+                    except Exception:
+                        pass
+
+        threads = [threading.Thread(target=worker, args=(index,), daemon=True)
+                   for index in range(min(len(meters), len(ranges)))]
+        for thread in threads:
+            thread.start()
+
+        # Commit chunks in UID order: append the mbox part, then checkpoint
+        last_report = time.perf_counter()
+        try:
+            for i, (lo, hi) in enumerate(ranges):
+                with cond:
+                    cond.wait_for(lambda: i in finished or errors)
+                    if i not in finished:  # chunks finished before an error are still kept
+                        raise errors[0]
+                    count, part = finished.pop(i)
+                if part:
+                    append_file(out, part)
+                    os.remove(part)
+                    out.flush()
+                exported += count
+                checkpoint.save({"mailbox": mailbox, "uidvalidity": uidvalidity, "format": fmt,
+                                 "next_uid": hi + 1, "exported": exported,
+                                 "mbox_size": out.tell() if out else 0})
+                with cond:
+                    claimed[1] = i + 1
+                    cond.notify_all()
+                if time.perf_counter() - last_report >= 1 or i == len(ranges) - 1:
+                    last_report = time.perf_counter()
+                    elapsed = last_report - start_time
+                    print(f"[IMAP] {exported}/{exists} exported "
+                          f"({exported / elapsed if elapsed > 0 else 0:.0f} msg/s)")
+        finally:
+            with cond:
+                errors.append(None)  # stops any worker still waiting for a range
+                cond.notify_all()
+            for thread in threads:
+                thread.join()
+            for _, part in finished.values():
+                if part and os.path.exists(part):
+                    os.remove(part)
+        meters[0].mark('transfer')
 
+        if out:
+            out.close()
+            out = None
+        checkpoint.remove()
         mail.logout()
-        packets_sent += 2  # LOGOUT + FIN
-        packets_recv += 2  # Response + FIN-ACK
-        
-        time_taken = time.time() - start_time
+        meters[0].mark('quit')
+        metrics = _metrics(True, start_time, wire(), 'recv', exported, record=record)
+        print(f"[IMAP] SUCCESS! Exported {exported} message(s) in {metrics[1]:.3f}s "
+              f"({exported / metrics[1] if metrics[1] > 0 else 0:.0f} msg/s), Bytes: {metrics[2]}")
+        return metrics
 
-        # Display email in console
-        print("\n" + "="*50)
-        print("LATEST EMAIL:")
-        print("="*50)
-        print(f"From: {sender}")
-        print(f"Subject: {subject}")
-        print("-"*50)
-        print(f"Body: {body[:500]}")
-        print("="*50 + "\n")
+    except Exception as e:
+        print(f"[IMAP] ERROR: {e}")
+        if out:
+            out.close()
+        if mail is not None:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+        return _metrics(False, start_time, wire(), 'recv', exported, record=record)
+
+
+def import_mailbox(email_addr, password, imap_server="mail.tm", imap_port=993, path='INBOX.mbox',
+                   mailbox='INBOX', pipeline=APPEND_PIPELINE, batch=MULTIAPPEND_BATCH,
+                   checkpoint=None):
+    """Upload an mbox file or a Maildir into a mailbox (created if missing).
+
+    Messages are read from disk one at a time. When the server offers
+    LITERAL+ the APPEND commands are pipelined (up to `pipeline` in flight,
+    each message sent as a non-synchronizing literal), and with MULTIAPPEND
+    each command carries up to `batch` messages; otherwise every message is
+    a plain APPEND. Flags and internal dates are kept.
+
+    The number of messages the server has acknowledged is kept in a
+    checkpoint file (default path + '.import.json'), so running the import
+    again skips what was already uploaded (a message whose reply was lost
+    when the connection dropped is uploaded again). Returns (success, time,
+    bytes, packets_sent, packets_recv, imported).
+    """
+    start_time = time.perf_counter()
+    record = ('imap_import', imap_server, imap_port)
+    checkpoint = Checkpoint(checkpoint or path.rstrip('/' + os.sep) + '.import.json')
+    meter = WireMeter()
+    mail = None
+    imported = 0
+    skipped = 0
 
-        print(f"[IMAP] SUCCESS! Time: {time_taken:.3f}s, Bytes: {bytes_received}")
-        print(f"[IMAP] Packets sent: {packets_sent}, received: {packets_recv}")
-        return True, time_taken, bytes_received, packets_sent, packets_recv, email_data
+    try:
+        print(f"[IMAP] Connecting to {imap_server}:{imap_port}...")
+        mail = _imap_connect(imap_server, imap_port, meter)
+        _imap_login(mail, email_addr, password)
+        mail._get_capabilities()  # servers may list more once logged in
+        meter.mark('auth')
+        quoted = _quote_mailbox(mailbox)
+        status, _ = mail.create(quoted)  # NO if it exists already, which is fine
+
+        source = os.path.abspath(path)
+        state = checkpoint.load(source=source, mailbox=mailbox)
+        skipped = imported = state['imported'] if state else 0
+        if state:
+            print(f"[IMAP] Resuming import: skipping {skipped} message(s) already uploaded")
+
+        def save():
+            checkpoint.save({"source": source, "mailbox": mailbox, "imported": imported})
+
+        literal_plus = 'LITERAL+' in mail.capabilities
+        batch = batch if 'MULTIAPPEND' in mail.capabilities else 1
+        mode = "pipelined APPEND" if literal_plus else "APPEND"
+        if literal_plus and batch > 1:
+            mode = f"pipelined MULTIAPPEND ({batch} per command)"
+        print(f"[IMAP] Importing {path} into {mailbox} ({mode})...")
+
+        messages = itertools.islice(read_archive(path), skipped, None)
+        last_report = time.perf_counter()
+        if not literal_plus:
+            for raw, flags, internaldate in messages:
+                status, data = mail.append(quoted, '(' + ' '.join(flags) + ')',
+                                           imaplib.Time2Internaldate(internaldate or time.time()), raw)
+                if status != 'OK':
+                    raise imaplib.IMAP4.error(f"APPEND failed: {_as_text(data[-1])}")
+                imported += 1
+                save()
+        else:
+            in_flight = deque()  # (tag, message count)
+            while True:
+                group = list(itertools.islice(messages, batch))
+                if not group:
+                    break
+                tag = mail._new_tag()
+                command = [tag, b' APPEND ', quoted.encode('utf-8')]
+                for raw, flags, internaldate in group:
+                    date = imaplib.Time2Internaldate(internaldate or time.time())
+                    command += [f" ({' '.join(flags)}) {date} {{{len(raw)}+}}\r\n".encode('ascii'), raw]
+                # One write per command: small writes would wait on Nagle
+                mail.send(b''.join(command + [b'\r\n']))
+                in_flight.append((tag, len(group)))
+                del group, command
+                while len(in_flight) >= pipeline:
+                    imported += _append_done(mail, *in_flight.popleft())
+                    save()
+                    if time.perf_counter() - last_report >= 1:
+                        last_report = time.perf_counter()
+                        elapsed = last_report - start_time
+                        print(f"[IMAP] {imported} imported "
+                              f"({(imported - skipped) / elapsed if elapsed > 0 else 0:.0f} msg/s)")
+            while in_flight:
+                imported += _append_done(mail, *in_flight.popleft())
+                save()
+        meter.mark('transfer')
+
+        checkpoint.remove()
+        mail.logout()
+        meter.mark('quit')
+        metrics = _metrics(True, start_time, meter.stats(), 'sent', imported, record=record)
+        uploaded = imported - skipped
+        print(f"[IMAP] SUCCESS! Imported {uploaded} message(s) in {metrics[1]:.3f}s "
+              f"({uploaded / metrics[1] if metrics[1] > 0 else 0:.0f} msg/s), Bytes: {metrics[2]}")
+        _print_compression(metrics.wire)
+        return metrics
 
     except Exception as e:
         print(f"[IMAP] ERROR: {e}")
-        return False, time.time() - start_time, bytes_received, packets_sent, packets_recv, None
+        if mail is not None:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+        return _metrics(False, start_time, meter.stats(), 'sent', imported, record=record)
+
+
+def _append_done(mail, tag, count):
+    """Wait for one pipelined APPEND; returns how many messages it stored."""
+    while mail.tagged_commands[tag] is None:
+        mail._get_response()
+    status, data = mail.tagged_commands.pop(tag)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"APPEND failed: {_as_text(data[-1])}")
+    return count
+
+
+# ==================== IMAP - Multi-account Sync ====================
+
+def load_accounts(path):
+    """Read account configs from a JSON file (a list of dicts, see sync_accounts)."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def _interleave_by_server(jobs):
+    """Order jobs round-robin across servers so one busy server does not block the pool."""
+    by_server = {}
+    for job in jobs:
+        by_server.setdefault((job['imap_server'], job['imap_port']), []).append(job)
+    ordered = []
+    queues = list(by_server.values())
+    while queues:
+        ordered += [queue.pop(0) for queue in queues]
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+def sync_accounts(accounts, cache=None, lazy=False, max_workers=8, per_server_limit=4):
+    """Sync many accounts and mailboxes into the local cache concurrently.
+
+    accounts is a list of dicts with 'email', 'password', 'imap_server',
+    'imap_port' and optionally 'mailboxes' (default ['INBOX']). Every
+    mailbox is synced on its own connection by a bounded thread pool, with
+    at most per_server_limit connections open to one server at a time, so
+    the wall time follows the slowest mailbox rather than the sum.
+
+    Returns (total_metrics, account_metrics, mailbox_metrics). Each metrics
+    tuple is (success, time, bytes, packets_sent, packets_recv, new_count);
+    account_metrics is keyed by account_key(), mailbox_metrics by
+    (account_key, mailbox). A failed mailbox marks its account unsuccessful.
+    """
+    cache = cache or default_mail_cache()
+    jobs = []
+    for config in accounts:
+        for mailbox in config.get('mailboxes') or ['INBOX']:
+            jobs.append(dict(config, mailbox=mailbox,
+                             imap_server=config.get('imap_server', "mail.tm"),
+                             imap_port=int(config.get('imap_port', 993))))
+    limits = {(job['imap_server'], job['imap_port']): threading.BoundedSemaphore(per_server_limit)
+              for job in jobs}
+
+    def sync_one(job):
+        with limits[(job['imap_server'], job['imap_port'])]:
+            started = time.perf_counter()
+            metrics = sync_mailbox(job['email'], job['password'], job['imap_server'],
+                                   job['imap_port'], job['mailbox'], cache, lazy)
+            return job, started, time.perf_counter(), metrics
+
+    start_time = time.perf_counter()
+    jobs = _interleave_by_server(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        results = list(executor.map(sync_one, jobs))
+
+    mailbox_metrics = {}
+    spans = {}
+    for job, started, finished, metrics in results:
+        account = account_key(job['email'], job['imap_server'], job['imap_port'])
+        mailbox_metrics[(account, job['mailbox'])] = metrics
+        first, last = spans.get(account, (started, finished))
+        spans[account] = (min(first, started), max(last, finished))
+
+    account_metrics = {}
+    for account, (first, last) in spans.items():
+        parts = [m for (acct, _), m in mailbox_metrics.items() if acct == account]
+        account_metrics[account] = _combine_metrics(parts, last - first)
+    total_metrics = _combine_metrics(list(mailbox_metrics.values()),
+                                     time.perf_counter() - start_time)
+
+    failed = [key for key, m in mailbox_metrics.items() if not m[0]]
+    print(f"[SYNC] {len(jobs)} mailbox(es) in {total_metrics[1]:.3f}s, "
+          f"{total_metrics[5]} new, {len(failed)} failed")
+    return total_metrics, account_metrics, mailbox_metrics
+
+
+def _combine_metrics(parts, time_taken):
+    """Sum sync metrics tuples; success only if every part succeeded."""
+    return OperationMetrics((
+        all(m[0] for m in parts),
+        time_taken,
+        sum(m[2] for m in parts),
+        sum(m[3] for m in parts),
+        sum(m[4] for m in parts),
+        sum(m[5] for m in parts),
+    ), merge_stats([m.wire for m in parts if m.wire]))
+
+
+# ==================== IMAP - IDLE Push ====================
+
+class IMAPIdleWatcher:
+    """Keep one authenticated IMAP session open and push new mail as it arrives.
+
+    The session waits in IDLE (RFC 2177) and reacts to untagged EXISTS and
+    EXPUNGE responses; only the new UIDs are fetched (headers-first). IDLE is
+    re-issued before the server's 29-minute timeout, and a dropped connection
+    is re-established with exponential backoff.
+
+    on_message(email_data) is called for every new message and
+    on_expunge(seq) for every expunged sequence number, both from the
+    watcher thread.
+    """
+
+    def __init__(self, email_addr, password, imap_server="mail.tm", imap_port=993,
+                 mailbox='INBOX', on_message=None, on_expunge=None, cache=None,
+                 idle_timeout=25 * 60, poll_interval=30, max_backoff=300, partial=2048):
+        self.email_addr = email_addr
+        self.password = password
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.mailbox = mailbox
+        self.on_message = on_message
+        self.on_expunge = on_expunge
+        self.cache = cache
+        self.idle_timeout = idle_timeout     # re-issue IDLE after this many seconds
+        self.poll_interval = poll_interval   # NOOP interval for servers without IDLE
+        self.max_backoff = max_backoff
+        self.partial = partial
+        self.meter = WireMeter()             # byte/call counters across sessions
+        self.last_uid = None
+        self._uidvalidity = 0
+        self._backoff = 1
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching in a daemon thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """Leave IDLE, log out and wait for the watcher thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        self._backoff = 1
+        while not self._stop.is_set():
+            try:
+                self._session()
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                print(f"[IDLE] Connection lost ({e}), reconnecting in {self._backoff}s...")
+                self._stop.wait(self._backoff)
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _session(self):
+        print(f"[IDLE] Connecting to {self.imap_server}:{self.imap_port}...")
+        mail = _imap_connect(self.imap_server, self.imap_port, self.meter)
+        try:
+            _imap_login(mail, self.email_addr, self.password)
+            status, data = mail.select(_quote_mailbox(self.mailbox))
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"SELECT {self.mailbox} failed")
+            self._uidvalidity = int(mail.response('UIDVALIDITY')[1][0] or 0)
+            mail.untagged_responses.pop('EXISTS', None)  # SELECT's count, not new mail
+            self._backoff = 1
+
+            if self.last_uid is None:
+                # Only report mail that arrives after the watcher started
+                uidnext = mail.response('UIDNEXT')[1][0]
+                if uidnext:
+                    self.last_uid = int(uidnext) - 1
+                else:
+                    status, data = mail.uid('SEARCH', None, 'ALL')
+                    uids = (data[0] or b"").split() if status == 'OK' else []
+                    self.last_uid = int(uids[-1]) if uids else 0
+            else:
+                # Catch up on anything that arrived while disconnected
+                self._fetch_new(mail)
+
+            print(f"[IDLE] Watching {self.mailbox} (last UID {self.last_uid})...")
+            can_idle = 'IDLE' in mail.capabilities
+            while not self._stop.is_set():
+                if can_idle:
+                    events = self._idle(mail)
+                else:
+                    self._stop.wait(self.poll_interval)
+                    mail.noop()
+                    events = [(int(n), 'EXISTS') for n in mail.response('EXISTS')[1] if n]
+                    events += [(int(n), 'EXPUNGE') for n in mail.response('EXPUNGE')[1] if n]
+
+                for number, kind in events:
+                    if kind == 'EXPUNGE' and self.on_expunge:
+                        self.on_expunge(number)
+                if any(kind == 'EXISTS' for _, kind in events):
+                    self._fetch_new(mail)
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+    def _idle(self, mail):
+        """Run one IDLE cycle. Returns [(number, 'EXISTS'|'EXPUNGE'), ...].
+
+        Responses go through imaplib's buffered file, so nothing it has
+        already read from the socket is missed; select() is only used to wait
+        while that buffer is empty. Only whole lines are taken from the buffer
+        and a partial line is never waited on, so DONE goes out on time.
+        EXISTS/EXPUNGE that arrived during the previous command are returned
+        without idling.
+        """
+        events = [(int(n), 'EXISTS') for n in mail.untagged_responses.pop('EXISTS', []) if n]
+        events += [(int(n), 'EXPUNGE') for n in mail.untagged_responses.pop('EXPUNGE', []) if n]
+        if events:
+            return events
+
+        tag = mail._new_tag().decode()
+        mail.send(f"{tag} IDLE\r\n".encode())
+
+        idling = False
+        done_sent = False
+        partial = b""
+        deadline = time.monotonic() + self.idle_timeout
+
+        while True:
+            if idling and not done_sent and (events or self._stop.is_set()
+                                             or time.monotonic() >= deadline):
+                mail.send(b"DONE\r\n")
+                done_sent = True
+
+            data = _read_ahead(mail)
+            if not data:
+                # Nothing buffered, decrypted or inflated: wait for the socket.
+                # Readable with still nothing to read is the end of the stream.
+                if select.select([mail.sock], [], [], 1.0)[0] and _read_ahead(mail) == b"":
+                    raise ConnectionError("server closed the connection")
+                continue
+            end = data.find(b"\n")
+            if end < 0:
+                partial += mail.file.read(len(data))  # the rest of the line is still on its way
+                continue
+            line = partial + mail.file.read(end + 1)
+            partial = b""
+            text = line.rstrip(b"\r\n").decode('utf-8', errors='replace')
+            if text.startswith('+'):
+                idling = True
+            elif text.startswith(tag + ' '):
+                mail.tagged_commands.pop(tag.encode(), None)
+                if not text[len(tag) + 1:].upper().startswith('OK'):
+                    raise imaplib.IMAP4.error(f"IDLE failed: {text}")
+                return events
+            else:
+                match = re.match(r'\* (\d+) (EXISTS|EXPUNGE)', text, re.IGNORECASE)
+                if match:
+                    events.append((int(match.group(1)), match.group(2).upper()))
+                elif text.upper().startswith('* BYE'):
+                    raise ConnectionError(text)
+
+    def _fetch_new(self, mail):
+        """Fetch UIDs above last_uid and hand them to on_message."""
+        status, data = mail.uid('SEARCH', None, f'UID {self.last_uid + 1}:*')
+        if status != 'OK' or not data[0]:
+            return
+        new_uids = [uid for uid in map(int, data[0].split()) if uid > self.last_uid]
+        if not new_uids:
+            return
+        fetched = _fetch_lazy(mail, new_uids, self.partial)
+        self.last_uid = max(new_uids)
+        if self.cache is not None:
+            account = account_key(self.email_addr, self.imap_server, self.imap_port)
+            for uid, email_data in fetched.items():
+                self.cache.store(account, self.mailbox, self._uidvalidity, uid,
+                                 email_data, email_data['size'])
+        for uid in sorted(fetched):
+            print(f"[IDLE] New email UID {uid}: {fetched[uid]['subject']}")
+            if self.on_message:
+                self.on_message(fetched[uid])
+
+
+# ==================== Connection Warm-up ====================
+
+def warm_up(email_addr, password, smtp_server="mail.tm", smtp_port=465,
+            imap_server="mail.tm", imap_port=993, pool=None):
+    """Pre-connect to both servers (in parallel). Returns (smtp_ok, imap_ok).
+
+    Meant to run in the background as soon as the credentials are known.
+    SMTP: a logged-in session is parked in the pool, so the first send skips
+    connect, TLS and AUTH. IMAP: a session is opened, logged in (checking
+    the credentials) and closed, which leaves the server's address and a
+    resumable TLS session cached, so the next connection's 'dns' and 'tls'
+    phases are short.
+    """
+    pool = pool or default_smtp_pool
+
+    def smtp():
+        server, _ = pool.acquire(smtp_server, smtp_port, email_addr, password)
+        pool.release(smtp_server, smtp_port, email_addr, server)
+
+    def imap():
+        mail = _imap_connect(imap_server, imap_port)
+        mail.login(email_addr, password)
+        mail.logout()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [("SMTP", executor.submit(smtp)), ("IMAP", executor.submit(imap))]
+    for protocol, future in futures:
+        error = future.exception()
+        if error is not None:
+            print(f"[{protocol}] Warm-up failed: {error}")
+        results.append(error is None)
+    return tuple(results)
 
 
 # ==================== TCP Notification Client ====================
 
-def send_notification(message, host='127.0.0.1', port=9999):
-    """Send notification to TCP server. Returns (success, time, bytes, packets_sent, packets_recv)."""
-    start_time = time.time()
-    bytes_sent = 0
-    packets_sent = 0
-    packets_recv = 0
+class NotificationChannel:
+    """Long-lived framed connection to the notification server.
+
+    Frames go out with sendall. A connection the server has closed is noticed
+    before writing and reopened (one retry). With batch_window > 0, send()
+    only queues the frame and a background flusher writes everything queued
+    within the window in a single sendall.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9999, batch_window=0.0, timeout=5):
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.connects = 0
+        self.writes = 0
+        self.meter = None                      # WireMeter of the current connection
+        self._since = None                     # meter snapshot at the end of the last write
+        self._sock = None
+        self._lock = threading.Lock()          # guards the socket
+        self._cond = threading.Condition()     # guards the batch queue
+        self._pending = []
+        self._flusher = None
+
+    def send(self, message):
+        """Send (or queue) one notification. Returns (bytes, wire).
+
+        wire is the WireMeter stats of the write, or None when the frame was
+        only queued for the batch flusher.
+        """
+        frame = encode_frame(message)
+        if self.batch_window <= 0:
+            return len(frame), self._write(frame)
+
+        with self._cond:
+            self._pending.append(frame)
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+        return len(frame), None
+
+    def flush(self):
+        """Write every queued frame now in one sendall."""
+        with self._cond:
+            frames, self._pending = self._pending, []
+        if frames:
+            self._write(b"".join(frames))
+
+    def close(self):
+        """Flush queued frames and close the connection."""
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"[TCP] ERROR: {e}")
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    if not self._cond.wait(timeout=30):
+                        return  # idle: let the thread end
+            time.sleep(self.batch_window)  # coalesce whatever arrives meanwhile
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[TCP] ERROR: batch dropped: {e}")
+
+    def _write(self, data):
+        """sendall over the persistent socket, reconnecting once.
+
+        Returns the WireMeter stats of this write; a new connection also
+        counts its handshake (stats['phases'] has 'connect').
+        """
+        with self._lock:
+            for attempt in range(2):
+                if self._sock is not None and self._peer_closed():
+                    self._sock.close()
+                    self._sock = None
+                if self._sock is None:
+                    self.meter = WireMeter()
+                    sock = socket.create_connection((self.host, self.port), self.timeout)
+                    self.meter.mark('connect')
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._sock = MeteredSocket(sock, self.meter)
+                    self._since = None
+                    self.connects += 1
+                else:
+                    self.meter.begin()
+                try:
+                    self._sock.sendall(data)
+                    self.meter.mark('transfer')
+                    self.writes += 1
+                    # Measure from the end of the previous write: TCP_INFO can
+                    # lag sendall, and this way no late-counted segment is lost
+                    now = self.meter.snapshot()
+                    stats = self.meter.stats(self._since, now)
+                    self._since = now
+                    return stats
+                except OSError:
+                    self._sock.close()
+                    self._sock = None
+                    if attempt:
+                        raise
+
+    def _peer_closed(self):
+        """The server never writes, so a readable socket means EOF or reset."""
+        try:
+            if not select.select([self._sock], [], [], 0)[0]:
+                return False
+            return self._sock.sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def get_notification_channel(host='127.0.0.1', port=9999, batch_window=0.0):
+    """Return the shared channel for (host, port, batch_window), creating it on first use.
+
+    A caller asking for another batch window gets a channel of its own, so
+    it cannot change how the other users' notifications are batched.
+    """
+    key = (host, port, batch_window)
+    with _channels_lock:
+        channel = _channels.get(key)
+        if channel is None:
+            channel = _channels[key] = NotificationChannel(host, port, batch_window)
+        return channel
+
+
+def _close_channels():
+    for channel in list(_channels.values()):
+        channel.close()
+
+
+atexit.register(_close_channels)
+
+
+def send_notification(message, host='127.0.0.1', port=9999, channel=None):
+    """Send notification to TCP server. Returns (success, time, bytes, packets_sent, packets_recv).
+
+    The notification goes over a shared persistent NotificationChannel, so
+    only the first call (or a reconnect) pays for the TCP handshake.
+    """
+    start_time = time.perf_counter()
+    record = ('tcp_notify', host, port)
 
     try:
-        # Create TCP socket and connect
-        print(f"[TCP] Connecting to {host}:{port}...")
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((host, port))
-        packets_sent += 2  # SYN, ACK
-        packets_recv += 1  # SYN-ACK
-
-        # Send message
-        message_bytes = message.encode('utf-8')
-        bytes_sent = len(message_bytes)
-        client_socket.send(message_bytes)
-        packets_sent += 1  # DATA packet
-        
-        client_socket.close()
-        packets_sent += 1  # FIN
-        packets_recv += 1  # FIN-ACK
-
-        time_taken = time.time() - start_time
-        print(f"[TCP] SUCCESS! Sent: '{message}'")
-        print(f"[TCP] Packets sent: {packets_sent}, received: {packets_recv}")
-        return True, time_taken, bytes_sent, packets_sent, packets_recv
+        channel = channel or get_notification_channel(host, port)
+        frame_size, wire = channel.send(message)
+        if wire is None:
+            # Queued for the batch flusher: nothing has hit the wire yet
+            metrics = OperationMetrics((True, time.perf_counter() - start_time, frame_size, 0, 0))
+            _record(metrics, *record)
+        else:
+            if 'connect' in wire['phases']:
+                print(f"[TCP] Connected to {host}:{port}")
+            metrics = _metrics(True, start_time, wire, 'sent', record=record)
+
+        print(f"[TCP] SUCCESS! {'Queued' if wire is None else 'Sent'}: '{message}'")
+        print(f"[TCP] Packets sent: {metrics[3]}, received: {metrics[4]}")
+        return metrics
 
     except ConnectionRefusedError:
         print("[TCP] ERROR: Server not running.")
-        return False, time.time() - start_time, bytes_sent, packets_sent, packets_recv
+        return _metrics(False, start_time, None, 'sent', record=record)
     except Exception as e:
         print(f"[TCP] ERROR: {e}")
-        return False, time.time() - start_time, bytes_sent, packets_sent, packets_recv
+        return _metrics(False, start_time, None, 'sent', record=record)
+
+
+# ==================== Local Search ====================
+
+def search_mail(query, email_addr=None, imap_server=None, imap_port=None, cache=None, limit=20):
+    """Full-text search over the local cache (no network). Returns (results, time).
+
+    Given an account (email_addr, imap_server, imap_port) only its mail is
+    searched. Results are email_data dicts with 'mailbox' and 'snippet'.
+    """
+    cache = cache or default_mail_cache()
+    account = account_key(email_addr, imap_server, imap_port) if email_addr else None
+    start_time = time.perf_counter()
+    results = cache.search(query, account=account, limit=limit)
+    time_taken = time.perf_counter() - start_time
+    print(f"[SEARCH] {len(results)} result(s) for '{query}' in {time_taken * 1000:.1f} ms")
+    return results, time_taken
+
+
+def _print_search_results(results):
+    """Display search results in the console."""
+    for email_data in results:
+        print("-"*50)
+        print(f"[{email_data['mailbox']} #{email_data['uid']}] {email_data['date'] or ''}")
+        print(f"From: {email_data['from']}")
+        print(f"Subject: {email_data['subject']}")
+        print(f"  {' '.join((email_data['snippet'] or '').split())}")
+    if results:
+        print("-"*50)
 
 
 # ==================== Performance Summary ====================
 
-def print_performance_summary(smtp_metrics, imap_metrics, tcp_metrics):
-    """Print performance metrics for all operations."""
+def _print_metrics_rows(metrics_list, width=12):
+    """Print one row per (name, metrics tuple), then the measured phase breakdown."""
+    print(f"{'Operation':<{width}} {'Time(s)':<9} {'Bytes':<10} {'Pkts Sent':<10} {'Pkts Recv':<10} {'Throughput':<12}")
+    print("-"*(width + 63))
+
+    for name, metrics in metrics_list:
+        if metrics[0]:  # success
+            time_taken = metrics[1]
+            bytes_val = metrics[2]
+            pkts_sent = metrics[3]
+            pkts_recv = metrics[4]
+            throughput = bytes_val / time_taken if time_taken > 0 else 0
+            print(f"{name:<{width}} {time_taken:<9.3f} {bytes_val:<10} {pkts_sent:<10} {pkts_recv:<10} {throughput:<12.2f}")
+        else:
+            print(f"{name:<{width}} FAILED")
+
+    # Measured per-phase breakdown (only operations that carry wire stats)
+    wired = [(name, getattr(metrics, 'wire', None)) for name, metrics in metrics_list]
+    wired = [(name, wire) for name, wire in wired if wire]
+    if wired:
+        print("-"*(width + 63))
+        print(f"{'Phase (ms)':<{width}} {'DNS':<7} {'Connect':<9} {'TLS':<9} {'Auth':<9} {'Transfer':<9} {'Quit':<9} {'Calls S/R':<10} {'Retrans':<8}")
+        for name, wire in wired:
+            phases = [wire['phases'].get(p, 0) * 1000 for p in ('dns', 'connect', 'tls', 'auth', 'transfer', 'quit')]
+            cells = [f"{ms:.1f}" for ms in phases]
+            if wire.get('tls_handshakes') and wire['tls_resumed'] == wire['tls_handshakes']:
+                cells[2] += " r"
+            calls = f"{wire['send_calls']}/{wire['recv_calls']}"
+            retrans = wire['retrans'] if wire['retrans'] is not None else '-'
+            print(f"{name:<{width}} {cells[0]:<7} " + " ".join(f"{cell:<9}" for cell in cells[1:]) + f" {calls:<10} {retrans:<8}")
+        if any(wire.get('tls_resumed') for _, wire in wired):
+            print("(r = TLS session resumed: abbreviated handshake)")
+        for name, wire in wired:
+            if wire.get('uncompressed_recv'):
+                print(f"{name}: COMPRESS=DEFLATE {wire['compressed_recv']} bytes in / "
+                      f"{wire['uncompressed_recv']} uncompressed, {wire['compressed_sent']} out / "
+                      f"{wire['uncompressed_sent']} uncompressed")
+        if not all(wire['tcp_info'] for _, wire in wired):
+            print("(TCP_INFO unavailable: bytes/packets are socket-level counts and send/recv calls)")
+
+
+def print_sync_summary(total_metrics, account_metrics):
+    """Print sync_accounts() results: one row per account plus the total."""
+    width = max([12] + [len(name) for name in account_metrics])
+    print("\n" + "="*(width + 63))
+    print("SYNC SUMMARY")
+    print("="*(width + 63))
+    _print_metrics_rows(list(account_metrics.items()) + [("TOTAL", total_metrics)], width)
+    print(f"New messages: {total_metrics[5]}")
+    print("="*(width + 63) + "\n")
+
+
+def _print_registry(registry):
+    """Aggregated table of the registry: one block per server, one row per operation."""
+    rows = sorted(registry.summary(), key=lambda row: (row['server'], row['operation']))
+    if not rows:
+        print("No operations recorded yet.")
+        return
+    print(f"{'  Operation':<16} {'OK':<6} {'Err':<5} {'p50 ms':<8} {'p95 ms':<8} {'p99 ms':<8} "
+          f"{'p50 bytes':<10} {'p50 KB/s':<9}")
+    print("-"*75)
+    server = None
+    for row in rows:
+        if row['server'] != server:
+            server = row['server']
+            print(server)
+        counts = f"  {row['operation']:<14} {row['ok']:<6} {row['errors']:<5}"
+        if not row['ok']:
+            print(counts + " -")
+            continue
+        print(f"{counts} {row['latency_p50'] * 1000:<8.1f} {row['latency_p95'] * 1000:<8.1f} "
+              f"{row['latency_p99'] * 1000:<8.1f} {row['bytes_p50']:<10} "
+              f"{row['throughput_p50'] / 1000:<9.1f}")
+
+
+def print_performance_summary(smtp_metrics, imap_metrics, tcp_metrics, outbox_stats=None,
+                              registry=None):
+    """Print the aggregated metrics of every operation so far (percentiles over
+    the last 1000 per operation and server), then the phase breakdown of the
+    latest SMTP, IMAP and TCP operation."""
     print("\n" + "="*75)
     print("PERFORMANCE SUMMARY")
     print("="*75)
-    print(f"{'Operation':<12} {'Time(s)':<9} {'Bytes':<10} {'Pkts Sent':<10} {'Pkts Recv':<10} {'Throughput':<12}")
-    print("-"*75)
+    _print_registry(registry or default_registry)
 
+    print("="*75)
+    print("LATEST OPERATIONS")
+    print("-"*75)
     metrics_list = [
         ("SMTP", smtp_metrics),
         ("IMAP", imap_metrics),
         ("TCP", tcp_metrics)
     ]
+    _print_metrics_rows(metrics_list)
+    if outbox_stats:
+        print(f"Outbox: depth {outbox_stats['queued'] + outbox_stats['sending']}, "
+              f"dead {outbox_stats['dead']}, drain rate {outbox_stats['drain_rate']:.2f} msg/s")
 
-    for name, metrics in metrics_list:
-        if metrics[0]:  # success
-            time_taken = metrics[1]
-            bytes_val = metrics[2]
-            pkts_sent = metrics[3]
-            pkts_recv = metrics[4]
-            throughput = bytes_val / time_taken if time_taken > 0 else 0
-            print(f"{name:<12} {time_taken:<9.3f} {bytes_val:<10} {pkts_sent:<10} {pkts_recv:<10} {throughput:<12.2f}")
-        else:
-            print(f"{name:<12} FAILED")
-    
     print("="*75)
     print("\nWIRESHARK FILTERS:")
     print("-"*75)
@@ -265,14 +2744,263 @@ def print_performance_summary(smtp_metrics, imap_metrics, tcp_metrics):
     print("="*75 + "\n")
 
 
+# ==================== Batch Mode ====================
+
+# Batch mode settings: config file key -> environment variable (which wins)
+BATCH_ENV = {
+    'email': 'EMAIL_CLIENT_EMAIL',
+    'password': 'EMAIL_CLIENT_PASSWORD',
+    'smtp_server': 'EMAIL_CLIENT_SMTP_SERVER',
+    'smtp_port': 'EMAIL_CLIENT_SMTP_PORT',
+    'imap_server': 'EMAIL_CLIENT_IMAP_SERVER',
+    'imap_port': 'EMAIL_CLIENT_IMAP_PORT',
+    'notify_host': 'EMAIL_CLIENT_NOTIFY_HOST',
+    'notify_port': 'EMAIL_CLIENT_NOTIFY_PORT',
+}
+BATCH_DEFAULTS = {'smtp_server': "mail.tm", 'smtp_port': 465, 'imap_server': "mail.tm",
+                  'imap_port': 993, 'notify_host': '127.0.0.1', 'notify_port': 9999}
+BATCH_WORKERS = 8       # jobs run at once
+BATCH_CONNECTIONS = 4   # pooled sessions per server
+
+
+def load_batch_config(path=None, environ=None):
+    """Credentials and servers for batch mode.
+
+    Defaults, then the JSON object in path (keys as in BATCH_ENV), then the
+    EMAIL_CLIENT_* environment variables. Raises ValueError if the email
+    address or password is missing.
+    """
+    config = dict(BATCH_DEFAULTS)
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    environ = os.environ if environ is None else environ
+    for key, name in BATCH_ENV.items():
+        if environ.get(name):
+            config[key] = environ[name]
+    for key in ('smtp_port', 'imap_port', 'notify_port'):
+        config[key] = int(config[key])
+    missing = [BATCH_ENV[key] for key in ('email', 'password') if not config.get(key)]
+    if missing:
+        raise ValueError(f"missing {' and '.join(missing)} (or set them in the config file)")
+    return config
+
+
+def _read_jobs(lines):
+    """Yield (number, job) per non-blank JSONL line; job is a ValueError if the line is not a JSON object."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("a job must be a JSON object")
+        except ValueError as e:
+            job = ValueError(f"line {number}: {e}")
+        yield number, job
+
+
+def _run_job(job, config, smtp_pool, imap_pool):
+    """Run one job. Returns (metrics, extra result fields); errors raise."""
+    op = job.get('op')
+    if op == 'send':
+        if not job.get('recipient'):
+            raise ValueError("send needs a recipient")
+        metrics = _send_pooled(smtp_pool, config['email'], config['password'], job['recipient'],
+                               job.get('subject', ''), job.get('body', ''), config['smtp_server'],
+                               config['smtp_port'], raise_errors=True,
+                               attachments=job.get('attachments'))
+        return metrics, {}
+    if op == 'receive':
+        metrics = _receive_pooled(imap_pool, config['email'], config['password'],
+                                  config['imap_server'], config['imap_port'],
+                                  job.get('mailbox', 'INBOX'), job.get('uid'),
+                                  int(job.get('partial', 2048)), raise_errors=True)
+        return metrics, {"email": metrics[5]}
+    if op == 'notify':
+        if not job.get('message'):
+            raise ValueError("notify needs a message")
+        metrics = send_notification(job['message'], config['notify_host'], config['notify_port'])
+        if not metrics[0]:
+            raise OSError(f"notification server {config['notify_host']}:{config['notify_port']} "
+                          "did not take the notification")
+        return metrics, {}
+    raise ValueError(f"unknown op {op!r} (expected send, receive or notify)")
+
+
+def run_batch(lines, config, output, workers=BATCH_WORKERS, connections=BATCH_CONNECTIONS):
+    """Run send/receive/notify jobs from JSONL lines concurrently; write one JSONL result per job.
+
+    Jobs look like {"op": "send", "recipient": ..., "subject": ..., "body": ...,
+    "attachments": [...]}, {"op": "receive", "mailbox": "INBOX", "uid": 42} (uid
+    defaults to the latest message) or {"op": "notify", "message": ...}, each
+    with an optional "id". Sends and receives share pools of `connections`
+    logged-in sessions and notifications the persistent channel, so only the
+    first jobs pay for connecting. Sends go straight out, not through the
+    outbox. Jobs are read as they are needed, so the input can be any length.
+
+    Results are written in completion order:
+    {"id", "op", "ok", "time", "bytes", "packets_sent", "packets_recv"}, plus
+    "error" for a failed job and "email" for a receive. Returns a dict of
+    counts per op ({"send": {"ok": n, "failed": n}, ...}).
+    """
+    smtp_pool = SMTPConnectionPool(max_size=connections)
+    imap_pool = IMAPSessionPool(max_size=connections)
+    output_lock = threading.Lock()
+    counts = {}
+    # Read ahead only this far, so a huge input is never held in memory
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def run(number, job):
+        start_time = time.perf_counter()
+        op = job.get('op') if isinstance(job, dict) else None
+        result = {"id": job.get('id', number) if isinstance(job, dict) else number, "op": op}
+        try:
+            if isinstance(job, Exception):
+                raise job
+            metrics, extra = _run_job(job, config, smtp_pool, imap_pool)
+            result.update(ok=True, time=round(metrics[1], 6), bytes=metrics[2],
+                          packets_sent=metrics[3], packets_recv=metrics[4], **extra)
+        except Exception as e:
+            result.update(ok=False, time=round(time.perf_counter() - start_time, 6), bytes=0,
+                          packets_sent=0, packets_recv=0, error=str(e) or type(e).__name__)
+        line = json.dumps(result, default=str)
+        with output_lock:
+            output.write(line + "\n")
+            output.flush()
+            outcome = counts.setdefault(op or 'invalid', {"ok": 0, "failed": 0})
+            outcome["ok" if result['ok'] else "failed"] += 1
+
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for number, job in _read_jobs(lines):
+                slots.acquire()
+                executor.submit(run, number, job).add_done_callback(lambda _: slots.release())
+    finally:
+        smtp_pool.close_all()
+        imap_pool.close_all()
+
+    time_taken = time.perf_counter() - start_time
+    total = sum(c["ok"] + c["failed"] for c in counts.values())
+    print(f"[BATCH] {total} job(s) in {time_taken:.3f}s "
+          f"({total / time_taken if time_taken > 0 else 0:.1f} jobs/s): " +
+          (", ".join(f"{op} {c['ok']} ok/{c['failed']} failed" for op, c in sorted(counts.items()))
+           or "no jobs"))
+    return counts
+
+
+def batch_main(jobs_path, config_path=None, output_path=None, workers=BATCH_WORKERS,
+               connections=BATCH_CONNECTIONS, quiet=False, metrics_port=None):
+    """--batch entry point. Returns the exit status: 0 if every job succeeded, 1 if any
+    failed, 2 if the configuration or files could not be read.
+
+    Results go to output_path (default stdout); the usual console messages go
+    to stderr (nowhere with quiet), so stdout carries only the JSONL results.
+    """
+    try:
+        config = load_batch_config(config_path)
+        source = sys.stdin if jobs_path == '-' else open(jobs_path)
+        output = open(output_path, 'w') if output_path else sys.stdout
+    except (OSError, ValueError) as e:
+        print(f"[BATCH] ERROR: {e}", file=sys.stderr)
+        return 2
+
+    log = open(os.devnull, 'w') if quiet else sys.stderr
+    try:
+        with contextlib.redirect_stdout(log):
+            if metrics_port is not None:
+                start_metrics_server(metrics_port)
+            counts = run_batch(source, config, output, workers, connections)
+            _print_registry(default_registry)
+    finally:
+        for f in (source, output, log):
+            if f not in (sys.stdin, sys.stdout, sys.stderr):
+                f.close()
+    return 1 if any(c["failed"] for c in counts.values()) else 0
+
+
 # ==================== Main Program ====================
 
-def main():
+def watch_inbox(email_addr, password, imap_server, imap_port):
+    """Push new mail to the console until Ctrl+C."""
+    def on_message(email_data):
+        _print_email(email_data)
+        show_push_notification("New Email", f"{email_data['from']}: {email_data['subject']}",
+                               summary="{count} new emails")
+        send_notification("Email Received")
+
+    watcher = IMAPIdleWatcher(email_addr, password, imap_server, imap_port,
+                              on_message=on_message, cache=default_mail_cache()).start()
+    print("Watching for new mail. Press Ctrl+C to stop.")
+    try:
+        while watcher.running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    watcher.stop()
+    print("[IDLE] Stopped.")
+
+
+def browse_inbox(email_addr, password, imap_server, imap_port, page_size=20):
+    """Page through the inbox listing. Returns the metrics of the last page."""
+    start_time = time.perf_counter()
+    pager = MailboxPager(email_addr, password, imap_server, imap_port, page_size=page_size)
+    record = ('imap_list', imap_server, imap_port)
+    try:
+        pager.open()
+    except Exception as e:
+        print(f"[IMAP] ERROR: {e}")
+        pager.close()
+        return _metrics(False, start_time, pager.meter.stats(), 'recv', record=record)
+
+    number = 0
+    try:
+        while True:
+            start_time = time.perf_counter()  # time a failure from the request, not the prompt
+            messages = list(pager.page(number))[::-1]
+            _print_listing(messages)
+            metrics = pager.last_metrics
+            print(f"Page {number + 1}/{pager.pages} ({pager.exists} messages) - "
+                  f"{metrics[1] * 1000:.1f} ms, {metrics[2]} bytes")
+            choice = input("[n]ext, [p]revious, [r]efresh, [q]uit: ").strip().lower()
+            if choice == 'n' and number + 1 < pager.pages:
+                number += 1
+            elif choice == 'p' and number > 0:
+                number -= 1
+            elif choice == 'r':
+                start_time = time.perf_counter()
+                pager.refresh()
+            elif choice == 'q':
+                break
+        return OperationMetrics(metrics[:5], metrics.wire)
+    except Exception as e:
+        print(f"[IMAP] ERROR: {e}")
+        return _metrics(False, start_time, pager.meter.stats(), 'recv', record=record)
+    finally:
+        pager.close()
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve the metrics registry at http://host:port/metrics. Returns the server, or None."""
+    try:
+        server = MetricsServer(host, port).start()
+    except OSError as e:
+        print(f"[METRICS] ERROR: cannot listen on {host}:{port}: {e}")
+        return None
+    print(f"[METRICS] Serving http://{host}:{server.port}/metrics")
+    return server
+
+
+def main(metrics_port=None):
     """Main function with menu interface."""
     print("\n" + "="*50)
     print("EMAIL CLIENT - Computer Networks")
     print("="*50 + "\n")
 
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+
     # Initialize metrics: (success, time, bytes, packets_sent, packets_recv)
     smtp_metrics = (False, 0, 0, 0, 0)
     imap_metrics = (False, 0, 0, 0, 0)
@@ -289,12 +3017,27 @@ def main():
     imap_server = input("IMAP Server [mail.tm]: ").strip() or "mail.tm"
     imap_port = int(input("IMAP Port [993]: ").strip() or "993")
 
+    # Resume any mail this account left in the outbox
+    default_outbox_worker().set_credentials(sender_email, password)
+
+    # Connect and log in to both servers while the menu is up
+    threading.Thread(target=warm_up, args=(sender_email, password, smtp_server, smtp_port,
+                                           imap_server, imap_port), daemon=True).start()
+
     while True:
         print("\n" + "="*30)
         print("1. Send Email")
         print("2. Receive Email")
         print("3. View Performance")
-        print("4. Exit")
+        print("4. Watch Inbox (IDLE)")
+        print("5. Search Mail")
+        print("6. Sync Accounts")
+        print("7. Outbox")
+        print("8. List Inbox")
+        print("9. Download Attachments")
+        print("10. Export Mailbox")
+        print("11. Import Mailbox")
+        print("12. Exit")
         print("="*30)
 
         choice = input("Choice: ").strip()
@@ -303,19 +3046,28 @@ def main():
             recipient = input("Recipient: ").strip()
             subject = input("Subject: ").strip()
             body = input("Body: ").strip()
+            paths = input("Attachments (comma-separated paths, blank = none): ").strip()
+            attachments = [path.strip() for path in paths.split(",") if path.strip()]
+            missing = [path for path in attachments if not os.path.isfile(path)]
+            if missing:
+                print(f"[SMTP] ERROR: No such file: {', '.join(missing)}")
+                continue
 
-            smtp_metrics = send_email(sender_email, password, recipient, subject, body,
-                                       smtp_server, smtp_port)
-            if smtp_metrics[0]:
+            _, status, smtp_metrics = queue_email(sender_email, password, recipient, subject, body,
+                                                  smtp_server, smtp_port, attachments=attachments)
+            if status == 'sent':
                 show_push_notification("Email Sent", "Your email was sent successfully!")
                 tcp_metrics = send_notification("Email Sent")
-            else:
+            elif status == 'dead':
                 show_push_notification("Email Failed", "Failed to send email.")
+            else:
+                print("[SMTP] Not sent yet; it stays in the outbox and will be retried.")
 
         elif choice == '2':
-            result = receive_email(sender_email, password, imap_server, imap_port)
+            result = receive_email(sender_email, password, imap_server, imap_port,
+                                   cache=default_mail_cache(), lazy=True)
             # Extract metrics without email_data for storage
-            imap_metrics = (result[0], result[1], result[2], result[3], result[4])
+            imap_metrics = OperationMetrics(result[:5], result.wire)
             if imap_metrics[0]:
                 show_push_notification("Email Received", "New email fetched successfully!")
                 tcp_metrics = send_notification("Email Received")
@@ -323,12 +3075,90 @@ def main():
                 show_push_notification("Fetch Failed", "Failed to receive email.")
 
         elif choice == '3':
-            print_performance_summary(smtp_metrics, imap_metrics, tcp_metrics)
+            outbox_stats = _default_outbox_worker.stats() if _default_outbox_worker else None
+            print_performance_summary(smtp_metrics, imap_metrics, tcp_metrics, outbox_stats)
 
         elif choice == '4':
+            watch_inbox(sender_email, password, imap_server, imap_port)
+
+        elif choice == '5':
+            query = input("Search: ").strip()
+            if query:
+                results, _ = search_mail(query, sender_email, imap_server, imap_port)
+                _print_search_results(results)
+
+        elif choice == '6':
+            path = input("Accounts file (JSON, blank = this account): ").strip()
+            if path:
+                try:
+                    accounts = load_accounts(path)
+                except (OSError, ValueError) as e:
+                    print(f"[SYNC] ERROR: {e}")
+                    continue
+            else:
+                mailboxes = input("Mailboxes [INBOX]: ").strip() or "INBOX"
+                accounts = [{"email": sender_email, "password": password,
+                             "imap_server": imap_server, "imap_port": imap_port,
+                             "mailboxes": [m.strip() for m in mailboxes.split(",") if m.strip()]}]
+            total, per_account, _ = sync_accounts(accounts, lazy=True)
+            imap_metrics = OperationMetrics(total[:5], total.wire)
+            print_sync_summary(total, per_account)
+
+        elif choice == '7':
+            worker = default_outbox_worker()
+            worker.set_credentials(sender_email, password)
+            _print_outbox(worker)
+            if worker.outbox.depth()['dead'] and input("Retry dead letters? [y/N]: ").strip().lower() == 'y':
+                print(f"[SMTP] Requeued {worker.requeue()} message(s)")
+
+        elif choice == '8':
+            imap_metrics = browse_inbox(sender_email, password, imap_server, imap_port)
+
+        elif choice == '9':
+            uid = input("Message UID (see List Inbox): ").strip()
+            if uid.isdigit():
+                folder = input("Save to folder [.]: ").strip() or "."
+                result = download_attachment(sender_email, password, imap_server, imap_port,
+                                             int(uid), path=folder)
+                imap_metrics = OperationMetrics(result[:5], result.wire)
+
+        elif choice == '10':
+            folder = input("Mailbox [INBOX]: ").strip() or "INBOX"
+            path = input("Save to (file = mbox, folder/ = Maildir) [INBOX.mbox]: ").strip() or "INBOX.mbox"
+            result = export_mailbox(sender_email, password, imap_server, imap_port, folder, path)
+            imap_metrics = OperationMetrics(result[:5], result.wire)
+
+        elif choice == '11':
+            path = input("mbox file or Maildir folder: ").strip()
+            if not os.path.exists(path):
+                print(f"[IMAP] ERROR: No such file: {path}")
+                continue
+            folder = input("Into mailbox [INBOX]: ").strip() or "INBOX"
+            result = import_mailbox(sender_email, password, imap_server, imap_port, path, folder)
+            imap_metrics = OperationMetrics(result[:5], result.wire)
+
+        elif choice == '12':
             print("Goodbye!")
             break
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Console email client")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--batch", metavar="JOBS",
+                        help="run send/receive/notify jobs from a JSONL file ('-' = stdin) "
+                             "without prompting, writing JSONL results")
+    parser.add_argument("--config", help="batch mode: JSON file with email, password and servers "
+                                         "(EMAIL_CLIENT_* environment variables override it)")
+    parser.add_argument("--output", help="batch mode: write results here instead of stdout")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="batch mode: jobs run at once")
+    parser.add_argument("--connections", type=int, default=BATCH_CONNECTIONS,
+                        help="batch mode: pooled sessions per server")
+    parser.add_argument("--quiet", action="store_true", help="batch mode: no console messages")
+    args = parser.parse_args()
+    if args.batch:
+        sys.exit(batch_main(args.batch, args.config, args.output, args.workers,
+                            args.connections, args.quiet, args.metrics_port))
+    main(args.metrics_port)
@@ -5,29 +5,389 @@ Course: Computer Networks - Fall 2025
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import threading
-from email_client import send_email, receive_email, send_notification
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+import os
+import time
+import queue
+import logging
+import argparse
+import itertools
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
+from email_client import (default_outbox_worker, receive_email, send_notification,
+                          default_mail_cache, IMAPIdleWatcher, MailboxPager, search_mail,
+                          download_attachment, warm_up, start_metrics_server,
+                          show_push_notification)
+from mail_cache import account_key
+from wire_metrics import WireMeter
+
+
+POLL_MS = 50            # how often the Tk loop drains worker results
+MAX_EVENTS = 200        # results handled per drain, so a burst cannot freeze the UI
+FLUSH_MS = 100          # how often buffered output lines are written to the widget
+MAX_LOG_LINES = 5000    # lines kept in the output pane
+
+
+class BackgroundTask:
+    """One GUI operation running on the shared worker pool.
+
+    The worker reports progress through the task (set_phase(), plus the
+    phase marks and byte counts of its WireMeter); the Tk thread only reads
+    them to draw the task list. cancel() aborts the task's connection, so a
+    blocked network call fails straight away.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, timeout=None, meter=None):
+        self.id = str(next(self._ids))
+        self.name = name
+        self.meter = meter or WireMeter()
+        self.meter.on_phase = self._phase_done
+        self.phase = "starting"
+        self.phases = []
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout if timeout else None
+        self.state = "running"   # running, done, cancelled or timed out
+        self.error = None
+
+    def _phase_done(self, phase, seconds):
+        self.phases.append(f"{phase} {seconds * 1000:.0f} ms")
+        self.phase = f"{phase} done"
+
+    def set_phase(self, phase):
+        self.phase = phase
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    def cancel(self, state="cancelled"):
+        if self.running:
+            self.state = state
+            self.meter.abort()
+
+    def progress(self):
+        """One-line progress: current phase, bytes moved and finished phases."""
+        text = self.phase
+        moved = self.meter.bytes_sent + self.meter.bytes_recv
+        if moved:
+            text += f" | {moved / 1024:.0f} KB"
+        if self.phases:
+            text += " | " + ", ".join(self.phases[-4:])
+        return text
+
+
+class TaskRunner:
+    """Shared worker pool for the GUI.
+
+    Workers never touch Tk: results and callbacks go through a queue that
+    the Tk loop drains every POLL_MS, which is also when timeouts are
+    enforced and on_tick (progress redraw) runs.
+    """
+
+    def __init__(self, root, on_tick=None, max_workers=4):
+        self.root = root
+        self.on_tick = on_tick
+        self.events = queue.Queue()
+        self.tasks = []
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui")
+        self.root.after(POLL_MS, self._drain)
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the Tk thread. Safe to call from any thread."""
+        self.events.put((callback, args))
+
+    def submit(self, name, work, done, timeout=None, meter=None):
+        """Run work(task) on the pool, then done(task, result) on the Tk thread.
+
+        If work raises, result is None and the exception is in task.error.
+        """
+        task = BackgroundTask(name, timeout, meter)
+        self.tasks.append(task)
+        self.executor.submit(self._run, task, work, done)
+        return task
+
+    def run(self, function, *args):
+        """Fire-and-forget call on the pool (no task entry, no result)."""
+        self.executor.submit(function, *args)
+
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def _run(self, task, work, done):
+        result = None
+        try:
+            result = work(task)
+        except Exception as e:
+            task.error = e
+        self.post(self._finish, task, done, result)
+
+    def _finish(self, task, done, result):
+        self.tasks.remove(task)
+        if task.running:
+            task.state = "done"
+        done(task, result)
+
+    def _drain(self):
+        try:
+            for _ in range(MAX_EVENTS):
+                try:
+                    callback, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                callback(*args)
+            now = time.monotonic()
+            for task in self.tasks:
+                if task.deadline is not None and now > task.deadline:
+                    task.cancel("timed out")
+            if self.on_tick is not None:
+                self.on_tick()
+        finally:
+            self.root.after(POLL_MS, self._drain)
+
+
+class LogSink:
+    """Buffered, bounded writer for the output pane.
+
+    write() only appends to a buffer (safe from any thread); every FLUSH_MS
+    the Tk loop inserts everything buffered with a single insert and one
+    scroll, so thousands of lines per second cost a few widget updates. The
+    pane keeps the last max_lines lines (the oldest are deleted, like a ring
+    buffer), and it only scrolls if it was already at the bottom. With
+    log_file, every line is also written to a rotating file.
+    """
+
+    def __init__(self, widget, max_lines=MAX_LOG_LINES, log_file=None,
+                 max_bytes=1024 * 1024, backups=3):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.pending = deque()
+        self.lines = 0          # lines currently in the widget
+        self.file_log = None
+        if log_file:
+            handler = RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                          backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_log = logging.getLogger(f"email_client_gui.{id(self)}")
+            self.file_log.propagate = False
+            self.file_log.setLevel(logging.INFO)
+            self.file_log.addHandler(handler)
+        self.widget.after(FLUSH_MS, self._tick)
+
+    def write(self, msg):
+        self.pending.append(msg)
+
+    def clear(self):
+        self.pending.clear()
+        self.widget.delete(1.0, tk.END)
+        self.lines = 0
+
+    def flush(self):
+        """Write everything buffered to the widget (and file). Tk thread only."""
+        batch = []
+        while self.pending:
+            batch.append(self.pending.popleft())
+        if not batch:
+            return
+        text = "\n".join(batch)
+        if self.file_log is not None:
+            self.file_log.info(text)
+
+        lines = text.split("\n")[-self.max_lines:]
+        at_end = self.widget.yview()[1] >= 0.999
+        self.widget.insert(tk.END, "\n".join(lines) + "\n")
+        self.lines += len(lines)
+        if self.lines > self.max_lines:
+            self.widget.delete(1.0, f"{self.lines - self.max_lines + 1}.0")
+            self.lines = self.max_lines
+        if at_end:
+            self.widget.see(tk.END)
+
+    def close(self):
+        self.flush()
+        if self.file_log is not None:
+            for handler in self.file_log.handlers:
+                handler.close()
+
+    def _tick(self):
+        try:
+            self.flush()
+        finally:
+            self.widget.after(FLUSH_MS, self._tick)
+
+
+class VirtualMessageList:
+    """Message list over a MailCache mailbox that only holds the visible rows.
+
+    The Treeview has a fixed number of row slots; the scrollbar stands for
+    the whole (sorted, filtered) mailbox, and scrolling re-fills the slots
+    with one indexed query for the rows at the new offset. Nothing goes to
+    the network and memory does not depend on the mailbox size. Clicking a
+    column heading sorts by it (again to reverse); on_select(uid) is called
+    when the selection changes.
+    """
+
+    def __init__(self, parent, cache, on_select=None, height=8):
+        self.cache = cache
+        self.on_select = on_select
+        self.height = height
+        self.account = None
+        self.mailbox = None
+        self.query = None
+        self.order = "uid"
+        self.descending = True
+        self.total = 0
+        self.offset = 0
+        self.rows = []            # email_data of the visible slots
+        self.selected = None      # absolute position of the selected row
+        self._render_pending = False
+
+        self.frame = ttk.Frame(parent)
+        self.frame.columnconfigure(0, weight=1)
+        columns = ("from", "subject", "date", "size")
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings",
+                                 height=height, selectmode="browse")
+        for column, title, width in zip(columns, ("From", "Subject", "Date", "Size"), (180, 280, 150, 60)):
+            self.tree.heading(column, text=title, command=lambda column=column: self.sort(column))
+            self.tree.column(column, width=width, anchor="e" if column == "size" else "w")
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_click)
+        self.tree.bind("<MouseWheel>", lambda event: self._wheel(-1 if event.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda event: self._wheel(-1))
+        self.tree.bind("<Button-5>", lambda event: self._wheel(1))
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", -height), ("<Next>", height)):
+            self.tree.bind(key, lambda event, step=step: self._move(step))
+        self.tree.bind("<Home>", lambda event: self._move(-self.total))
+        self.tree.bind("<End>", lambda event: self._move(self.total))
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def show(self, account, mailbox="INBOX", query=None):
+        """Point the list at a cached mailbox, optionally filtered by a search
+        query (same syntax as MailCache.search)."""
+        query = (query or "").strip() or None
+        if (account, mailbox, query) != (self.account, self.mailbox, self.query):
+            self.account, self.mailbox, self.query = account, mailbox, query
+            self.offset, self.selected = 0, None
+        self.refresh()
+
+    def sort(self, column):
+        if self.order == column or (self.order == "uid" and column == "date"):
+            self.descending = not self.descending
+        else:
+            self.order, self.descending = column, column in ("date", "size")
+        self.offset, self.selected = 0, None
+        self.refresh()
 
+    def refresh(self):
+        """Re-count the mailbox (after a sync, or a filter/sort change) and redraw."""
+        if self.account is None:
+            return
+        self.total = self.cache.count_view(self.account, self.mailbox, self.query)
+        self.offset = max(0, min(self.offset, self.total - self.height))
+        self._render()
+
+    def scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.total - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            if not self._render_pending:
+                # Coalesce a burst of scroll events into one query
+                self._render_pending = True
+                self.tree.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        if self.account is None:
+            return
+        self.rows = self.cache.window(self.account, self.mailbox, self.offset, self.height,
+                                      self.order, self.descending, self.query)
+        for slot, email_data in enumerate(self.rows):
+            values = (email_data['from'], email_data['subject'], email_data['date'] or '',
+                      f"{(email_data['size'] or 0) // 1024 + 1} KB")
+            if self.tree.exists(str(slot)):
+                self.tree.item(str(slot), values=values)
+            else:
+                self.tree.insert("", tk.END, iid=str(slot), values=values)
+        for slot in range(len(self.rows), self.height):
+            if self.tree.exists(str(slot)):
+                self.tree.delete(str(slot))
+
+        slot = self.selected - self.offset if self.selected is not None else -1
+        if 0 <= slot < len(self.rows):
+            if self.tree.selection() != (str(slot),):
+                self.tree.selection_set(str(slot))
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        if self.total:
+            self.scrollbar.set(self.offset / self.total,
+                               (self.offset + len(self.rows)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
 
-def show_push_notification(title, message):
-    """Show a desktop push notification using Plyer."""
-    try:
-        from plyer import notification
-        notification.notify(title=title, message=message, app_name="Email Client", timeout=2)
-    except ImportError:
-        print("[!] Plyer not installed. Run: pip install plyer")
-    except Exception as e:
-        print(f"[!] Notification error: {e}")
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(amount) * self.total)
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * self.height)
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def _wheel(self, direction):
+        self.scroll_to(self.offset + 3 * direction)
+        return "break"
+
+    def _on_click(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        selected = self.offset + int(selection[0])
+        if selected != self.selected and int(selection[0]) < len(self.rows):
+            self.selected = selected
+            if self.on_select is not None:
+                self.on_select(self.rows[int(selection[0])]['uid'])
+
+    def _move(self, step):
+        """Keyboard navigation: move the selection, scrolling to keep it visible."""
+        if not self.total:
+            return "break"
+        current = self.selected if self.selected is not None else self.offset - (step > 0)
+        self.selected = max(0, min(current + step, self.total - 1))
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.height:
+            self.offset = self.selected - self.height + 1
+        self._render()
+        if not self.rows:
+            return "break"
+        # The cache may have shrunk (prune, reset) since total was counted
+        slot = min(self.selected - self.offset, len(self.rows) - 1)
+        if slot != self.selected - self.offset:
+            self.selected = self.offset + slot
+            self.tree.selection_set(str(slot))
+        if self.on_select is not None:
+            self.on_select(self.rows[slot]['uid'])
+        return "break"
 
 
 class EmailClientGUI:
     """Main GUI class for the email client."""
 
-    def __init__(self, root):
+    def __init__(self, root, log_file=None, max_log_lines=MAX_LOG_LINES):
         self.root = root
         self.root.title("Email Client - Computer Networks")
-        self.root.geometry("700x650")
+        self.root.geometry("760x1060")
 
         # Style
         self.style = ttk.Style()
@@ -40,7 +400,15 @@ class EmailClientGUI:
         root.rowconfigure(0, weight=1)
         self.main_frame.columnconfigure(1, weight=1)
 
+        self.watcher = None
+        self.warmed_up = None     # settings the last warm-up connected with
+        self.attachments = []
+        self.pager = None
+        self.page_number = 0
         self.create_widgets()
+        self.output = LogSink(self.output_text, max_log_lines, log_file)
+        self.runner = TaskRunner(root, on_tick=self.refresh_tasks)
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         """Create all GUI widgets."""
@@ -55,7 +423,9 @@ class EmailClientGUI:
 
         ttk.Label(cred_frame, text="Password:").grid(row=1, column=0, sticky="w", padx=5)
         self.password_var = tk.StringVar()
-        ttk.Entry(cred_frame, textvariable=self.password_var, show="*", width=50).grid(row=1, column=1, sticky="ew", padx=5)
+        password_entry = ttk.Entry(cred_frame, textvariable=self.password_var, show="*", width=50)
+        password_entry.grid(row=1, column=1, sticky="ew", padx=5)
+        password_entry.bind("<FocusOut>", lambda event: self.warm_up())
 
         # Server Settings Section
         server_frame = ttk.LabelFrame(self.main_frame, text="Server Settings", padding="5")
@@ -92,6 +462,14 @@ class EmailClientGUI:
         self.body_text = scrolledtext.ScrolledText(compose_frame, height=4, width=50)
         self.body_text.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
 
+        attach_frame = ttk.Frame(compose_frame)
+        attach_frame.grid(row=3, column=1, sticky="ew", padx=5)
+        attach_frame.columnconfigure(2, weight=1)
+        ttk.Button(attach_frame, text="Attach...", command=self.add_attachments).grid(row=0, column=0)
+        ttk.Button(attach_frame, text="Remove All", command=self.clear_attachments).grid(row=0, column=1, padx=5)
+        self.attach_var = tk.StringVar(value="No attachments")
+        ttk.Label(attach_frame, textvariable=self.attach_var).grid(row=0, column=2, sticky="w")
+
         # Buttons Section
         btn_frame = ttk.Frame(self.main_frame)
         btn_frame.grid(row=3, column=0, columnspan=2, pady=10)
@@ -102,26 +480,189 @@ class EmailClientGUI:
         self.receive_btn = ttk.Button(btn_frame, text="Receive Email", command=self.receive_email_thread)
         self.receive_btn.grid(row=0, column=1, padx=10)
 
-        ttk.Button(btn_frame, text="Clear", command=self.clear_output).grid(row=0, column=2, padx=10)
+        self.watch_btn = ttk.Button(btn_frame, text="Watch Inbox", command=self.toggle_watch)
+        self.watch_btn.grid(row=0, column=2, padx=10)
+
+        self.inbox_btn = ttk.Button(btn_frame, text="Load Inbox", command=self.load_inbox)
+        self.inbox_btn.grid(row=0, column=3, padx=10)
+
+        ttk.Button(btn_frame, text="Clear", command=self.clear_output).grid(row=0, column=4, padx=10)
+
+        # Search Section (local cache, no network)
+        search_frame = ttk.LabelFrame(self.main_frame, text="Search Cached Mail", padding="5")
+        search_frame.grid(row=4, column=0, columnspan=2, sticky="ew", pady=5)
+        search_frame.columnconfigure(0, weight=1)
+
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=50)
+        search_entry.grid(row=0, column=0, sticky="ew", padx=5)
+        search_entry.bind("<Return>", lambda event: self.do_search())
+        ttk.Button(search_frame, text="Search", command=self.do_search).grid(row=0, column=1, padx=5)
+
+        # Mail Section: server inbox (one FETCH per page) and cached mail (no network)
+        notebook = ttk.Notebook(self.main_frame)
+        notebook.grid(row=5, column=0, columnspan=2, sticky="nsew", pady=5)
+        inbox_frame = ttk.Frame(notebook, padding="5")
+        inbox_frame.columnconfigure(0, weight=1)
+        notebook.add(inbox_frame, text="Inbox (server)")
+
+        columns = ("from", "subject", "date", "size")
+        self.inbox_tree = ttk.Treeview(inbox_frame, columns=columns, show="headings", height=8)
+        for column, title, width in zip(columns, ("From", "Subject", "Date", "Size"), (180, 280, 150, 60)):
+            self.inbox_tree.heading(column, text=title)
+            self.inbox_tree.column(column, width=width, anchor="e" if column == "size" else "w")
+        self.inbox_tree.tag_configure("unseen", font=("TkDefaultFont", 9, "bold"))
+        self.inbox_tree.grid(row=0, column=0, columnspan=3, sticky="nsew", padx=5)
+        self.inbox_tree.bind("<Double-1>", lambda event: self.save_attachments())
+
+        self.newer_btn = ttk.Button(inbox_frame, text="< Newer", state='disabled',
+                                    command=lambda: self.show_page(self.page_number - 1))
+        self.newer_btn.grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        self.page_var = tk.StringVar(value="Not loaded")
+        ttk.Label(inbox_frame, textvariable=self.page_var).grid(row=1, column=1)
+        self.older_btn = ttk.Button(inbox_frame, text="Older >", state='disabled',
+                                    command=lambda: self.show_page(self.page_number + 1))
+        self.older_btn.grid(row=1, column=2, sticky="e", padx=5, pady=2)
+
+        cached_frame = ttk.Frame(notebook, padding="5")
+        cached_frame.columnconfigure(1, weight=1)
+        notebook.add(cached_frame, text="Cached Mail")
+
+        ttk.Label(cached_frame, text="Filter:").grid(row=0, column=0, sticky="w", padx=5)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(cached_frame, textvariable=self.filter_var)
+        filter_entry.grid(row=0, column=1, sticky="ew", padx=5)
+        filter_entry.bind("<Return>", lambda event: self.show_cached())
+        ttk.Button(cached_frame, text="Show", command=self.show_cached).grid(row=0, column=2, padx=5)
+        self.cached_var = tk.StringVar(value="")
+        ttk.Label(cached_frame, textvariable=self.cached_var).grid(row=0, column=3, padx=5)
+
+        self.message_list = VirtualMessageList(cached_frame, default_mail_cache(),
+                                               on_select=self.show_cached_message, height=6)
+        self.message_list.grid(row=1, column=0, columnspan=4, sticky="nsew", padx=5, pady=2)
+        self.preview_text = scrolledtext.ScrolledText(cached_frame, height=4)
+        self.preview_text.grid(row=2, column=0, columnspan=4, sticky="ew", padx=5)
+
+        # Tasks Section (operations running in the background)
+        tasks_frame = ttk.LabelFrame(self.main_frame, text="Tasks", padding="5")
+        tasks_frame.grid(row=6, column=0, columnspan=2, sticky="ew", pady=5)
+        tasks_frame.columnconfigure(0, weight=1)
+
+        columns = ("task", "progress", "elapsed")
+        self.tasks_tree = ttk.Treeview(tasks_frame, columns=columns, show="headings", height=3)
+        for column, title, width in zip(columns, ("Task", "Progress", "Elapsed"), (140, 470, 60)):
+            self.tasks_tree.heading(column, text=title)
+            self.tasks_tree.column(column, width=width, anchor="e" if column == "elapsed" else "w")
+        self.tasks_tree.grid(row=0, column=0, columnspan=4, sticky="ew", padx=5)
+
+        ttk.Button(tasks_frame, text="Cancel", command=self.cancel_tasks).grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        ttk.Label(tasks_frame, text="Timeout (s, 0 = none):").grid(row=1, column=2, sticky="e")
+        self.timeout_var = tk.StringVar(value="120")
+        ttk.Entry(tasks_frame, textvariable=self.timeout_var, width=6).grid(row=1, column=3, sticky="e", padx=5)
 
         # Output Section
         output_frame = ttk.LabelFrame(self.main_frame, text="Output", padding="5")
-        output_frame.grid(row=4, column=0, columnspan=2, sticky="nsew", pady=5)
+        output_frame.grid(row=7, column=0, columnspan=2, sticky="nsew", pady=5)
         output_frame.columnconfigure(0, weight=1)
         output_frame.rowconfigure(0, weight=1)
-        self.main_frame.rowconfigure(4, weight=1)
+        self.main_frame.rowconfigure(7, weight=1)
 
-        self.output_text = scrolledtext.ScrolledText(output_frame, height=12)
+        self.output_text = scrolledtext.ScrolledText(output_frame, height=10)
         self.output_text.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
 
+    def add_attachments(self):
+        """Pick files to attach; they are read from disk while sending."""
+        paths = filedialog.askopenfilenames(title="Attach files")
+        self.attachments.extend(path for path in paths if path not in self.attachments)
+        self.show_attachments()
+
+    def clear_attachments(self):
+        self.attachments = []
+        self.show_attachments()
+
+    def show_attachments(self):
+        if not self.attachments:
+            self.attach_var.set("No attachments")
+            return
+        size = sum(os.path.getsize(path) for path in self.attachments if os.path.exists(path))
+        names = ", ".join(os.path.basename(path) for path in self.attachments)
+        self.attach_var.set(f"{names} ({size / 1024:.0f} KB)")
+
     def log(self, msg):
-        """Add message to output."""
-        self.output_text.insert(tk.END, msg + "\n")
-        self.output_text.see(tk.END)
+        """Add message to output (buffered; shows up on the next flush)."""
+        self.output.write(msg)
+
+    def account(self):
+        """Snapshot of the credentials and server settings, read on the Tk thread."""
+        return {
+            "email": self.email_var.get().strip(),
+            "password": self.password_var.get().strip(),
+            "smtp_server": self.smtp_server_var.get().strip(),
+            "smtp_port": int(self.smtp_port_var.get().strip() or "465"),
+            "imap_server": self.imap_server_var.get().strip(),
+            "imap_port": int(self.imap_port_var.get().strip() or "993"),
+        }
+
+    def warm_up(self):
+        """Pre-connect in the background once the credentials are filled in."""
+        if not (self.email_var.get().strip() and self.password_var.get().strip()):
+            return
+        try:
+            account = self.account()
+        except ValueError:
+            return  # port not a number yet
+        if account == self.warmed_up:
+            return
+        self.warmed_up = account
+        default_outbox_worker().set_credentials(account['email'], account['password'])
+        self.runner.run(warm_up, account['email'], account['password'], account['smtp_server'],
+                        account['smtp_port'], account['imap_server'], account['imap_port'])
+
+    def timeout(self):
+        try:
+            return float(self.timeout_var.get()) or None
+        except ValueError:
+            return None
+
+    def notify(self, title, message, event=None, summary=None):
+        """Desktop notification (and TCP notification) without blocking the Tk loop."""
+        show_push_notification(title, message, summary=summary)  # only queued here
+        if event:
+            self.runner.run(send_notification, event)
+
+    def refresh_tasks(self):
+        """Redraw the task list from the running tasks (called every POLL_MS)."""
+        live = {task.id: task for task in self.runner.tasks}
+        for iid in self.tasks_tree.get_children():
+            if iid not in live:
+                self.tasks_tree.delete(iid)
+        for iid, task in live.items():
+            values = (task.name, task.progress() if task.running else task.state,
+                      f"{time.monotonic() - task.started:.1f}s")
+            if self.tasks_tree.exists(iid):
+                self.tasks_tree.item(iid, values=values)
+            else:
+                self.tasks_tree.insert("", tk.END, iid=iid, values=values)
+
+    def cancel_tasks(self):
+        """Cancel the selected tasks, or every running task if none is selected."""
+        selected = set(self.tasks_tree.selection())
+        for task in list(self.runner.tasks):
+            if not selected or task.id in selected:
+                task.cancel()
+
+    def on_close(self):
+        if self.watcher is not None:
+            self.watcher.stop(timeout=0)
+        if self.pager is not None:
+            self.runner.run(self.pager.close)
+        self.runner.shutdown()
+        self.output.close()
+        self.root.destroy()
 
     def clear_output(self):
         """Clear output area."""
-        self.output_text.delete(1.0, tk.END)
+        self.output.clear()
 
     def validate(self, need_recipient=False):
         """Validate required inputs."""
@@ -134,64 +675,103 @@ class EmailClientGUI:
         if need_recipient and not self.recipient_var.get().strip():
             messagebox.showerror("Error", "Enter recipient email.")
             return False
+        return self.validate_ports()
+
+    def validate_ports(self):
+        """Check the port fields (blank means the default)."""
+        for name, var in (("SMTP", self.smtp_port_var), ("IMAP", self.imap_port_var)):
+            port = var.get().strip()
+            if port and not (port.isdigit() and 0 < int(port) < 65536):
+                messagebox.showerror("Error", f"{name} port must be a number from 1 to 65535.")
+                return False
         return True
 
-    def set_buttons(self, state):
-        """Enable or disable buttons."""
-        self.send_btn.config(state=state)
-        self.receive_btn.config(state=state)
-
     def send_email_thread(self):
-        """Start sending email in background thread."""
+        """Queue the email and follow its first attempt in the background."""
         if not self.validate(need_recipient=True):
             return
-        self.set_buttons('disabled')
-        threading.Thread(target=self.do_send_email, daemon=True).start()
-
-    def do_send_email(self):
-        """Perform email sending."""
+        account = self.account()
+        message = {
+            "recipient": self.recipient_var.get().strip(),
+            "subject": self.subject_var.get().strip(),
+            "body": self.body_text.get(1.0, tk.END).strip(),
+            "attachments": list(self.attachments),
+        }
+        self.send_btn.config(state='disabled')
         self.log("\n" + "="*40 + "\nSENDING EMAIL...\n" + "="*40)
+        self.runner.submit("Send email", lambda task: self.do_send_email(task, account, message),
+                           self.send_done, self.timeout())
+
+    def do_send_email(self, task, account, message):
+        """Put the email in the outbox and wait for its first attempt (worker thread)."""
+        worker = default_outbox_worker()
+        task.set_phase("queueing")
+        message_id = worker.submit(account['email'], account['password'], message['recipient'],
+                                   message['subject'], message['body'], account['smtp_server'],
+                                   account['smtp_port'], message['attachments'])
+        task.set_phase(f"message {message_id} queued")
+        result = None
+        while result is None and task.running:
+            row = worker.outbox.get(message_id)
+            if row is not None and row['status'] == 'sending':
+                task.set_phase(f"message {message_id} sending")
+            result = worker.wait(message_id, 0.2)
+        return message_id, result
+
+    def send_done(self, task, outcome):
+        self.send_btn.config(state='normal')
+        if task.error is not None:
+            self.log(f"FAILED to send email: {task.error}")
+            return
+        message_id, result = outcome
+        if result is None:
+            if task.state == "cancelled" and default_outbox_worker().cancel(message_id):
+                self.log(f"Cancelled - message {message_id} removed from the outbox.")
+            elif task.state == "cancelled":
+                self.log(f"Message {message_id} was already being sent; it was not cancelled.")
+            else:
+                self.log(f"Not sent yet ({task.state}) - message {message_id} stays in the outbox and will be retried.")
+            return
 
-        port = int(self.smtp_port_var.get() or "465")
-        success, time_taken, bytes_sent, pkts_sent, pkts_recv = send_email(
-            self.email_var.get().strip(),
-            self.password_var.get().strip(),
-            self.recipient_var.get().strip(),
-            self.subject_var.get().strip(),
-            self.body_text.get(1.0, tk.END).strip(),
-            self.smtp_server_var.get().strip(),
-            port
-        )
-
-        if success:
+        status, detail = result
+        if status == 'sent':
+            success, time_taken, bytes_sent, pkts_sent, pkts_recv = detail
             self.log(f"SUCCESS! Time: {time_taken:.3f}s, Bytes: {bytes_sent}")
             self.log(f"Packets sent: {pkts_sent}, received: {pkts_recv}")
-            show_push_notification("Email Sent", "Email sent successfully!")
-            send_notification("Email Sent")
+            self.notify("Email Sent", "Email sent successfully!", "Email Sent")
+        elif status == 'dead':
+            self.log(f"FAILED to send email: {detail}")
+            self.notify("Failed", "Could not send email.")
         else:
-            self.log("FAILED to send email.")
-            show_push_notification("Failed", "Could not send email.")
-
-        self.root.after(0, lambda: self.set_buttons('normal'))
+            self.log(f"Not sent yet ({detail}) - message {message_id} stays in the outbox and will be retried.")
 
     def receive_email_thread(self):
-        """Start receiving email in background thread."""
+        """Fetch the latest email in the background."""
         if not self.validate():
             return
-        self.set_buttons('disabled')
-        threading.Thread(target=self.do_receive_email, daemon=True).start()
-
-    def do_receive_email(self):
-        """Perform email receiving."""
+        account = self.account()
+        self.receive_btn.config(state='disabled')
         self.log("\n" + "="*40 + "\nRECEIVING EMAIL...\n" + "="*40)
-
-        port = int(self.imap_port_var.get() or "993")
-        success, time_taken, bytes_received, pkts_sent, pkts_recv, email_data = receive_email(
-            self.email_var.get().strip(),
-            self.password_var.get().strip(),
-            self.imap_server_var.get().strip(),
-            port
-        )
+        self.runner.submit("Receive email", lambda task: receive_email(
+            account['email'],
+            account['password'],
+            account['imap_server'],
+            account['imap_port'],
+            cache=default_mail_cache(),
+            lazy=True,
+            meter=task.meter
+        ), self.receive_done, self.timeout())
+
+    def receive_done(self, task, metrics):
+        self.receive_btn.config(state='normal')
+        if task.state != "done":
+            self.log(f"Receive {task.state}.")
+            return
+        if task.error is not None:
+            self.log(f"FAILED to receive email: {task.error}")
+            return
+        success, time_taken, bytes_received, pkts_sent, pkts_recv, email_data = metrics
+        self.refresh_cached()
 
         if success:
             self.log(f"SUCCESS! Time: {time_taken:.3f}s, Bytes: {bytes_received}")
@@ -210,21 +790,220 @@ class EmailClientGUI:
             else:
                 self.log("No emails in inbox.")
                 
-            show_push_notification("Email Received", "Email fetched successfully!")
-            send_notification("Email Received")
+            self.notify("Email Received", "Email fetched successfully!", "Email Received")
         else:
             self.log("FAILED to receive email.")
-            show_push_notification("Failed", "Could not fetch email.")
-
-        self.root.after(0, lambda: self.set_buttons('normal'))
+            self.notify("Failed", "Could not fetch email.")
 
+    def do_search(self):
+        """Search the local cache (fast enough to run on the Tk thread)."""
+        query = self.search_var.get().strip()
+        if not query or not self.validate_ports():
+            return
+        account = self.account()
+        results, time_taken = search_mail(query, account['email'] or None, account['imap_server'],
+                                          account['imap_port'], cache=default_mail_cache())
+        self.log("\n" + "="*40 + f"\nSEARCH: {query}\n" + "="*40)
+        self.log(f"{len(results)} result(s) in {time_taken * 1000:.1f} ms")
+        for email_data in results:
+            self.log("-"*40)
+            self.log(f"From: {email_data['from']}")
+            self.log(f"Subject: {email_data['subject']}")
+            self.log(f"Date: {email_data['date'] or ''}")
+            self.log("  " + " ".join((email_data['snippet'] or "").split()))
+
+    def show_cached(self):
+        """Show this account's cached INBOX in the list (no network)."""
+        if not self.validate_ports():
+            return
+        account = self.account()
+        self.message_list.show(account_key(account['email'], account['imap_server'],
+                                           account['imap_port']),
+                               query=self.filter_var.get())
+        self.cached_var.set(f"{self.message_list.total} messages")
+
+    def refresh_cached(self):
+        """Pick up newly synced mail if the cached list is showing."""
+        if self.message_list.account is not None:
+            self.message_list.refresh()
+            self.cached_var.set(f"{self.message_list.total} messages")
+
+    def show_cached_message(self, uid):
+        """Load the selected message's body from the cache into the preview."""
+        view = self.message_list
+        email_data = view.cache.get(view.account, view.mailbox, uid)
+        self.preview_text.delete(1.0, tk.END)
+        if email_data is not None:
+            self.preview_text.insert(tk.END, f"From: {email_data['from']}\n"
+                                             f"Subject: {email_data['subject']}\n"
+                                             f"Date: {email_data['date'] or ''}\n\n"
+                                             f"{email_data['body'] or ''}")
+
+    def load_inbox(self):
+        """Open a listing session and show the newest page."""
+        if not self.validate():
+            return
+        if self.pager is not None:
+            self.runner.run(self.pager.close)
+        account = self.account()
+        self.pager = MailboxPager(
+            account['email'],
+            account['password'],
+            account['imap_server'],
+            account['imap_port']
+        )
+        self.page_number = 0
+        self.show_page(0)
+
+    def show_page(self, number):
+        """Fetch one page in the background; rows appear as they are streamed in."""
+        pager = self.pager
+        self.set_inbox_buttons('disabled')
+        self.inbox_tree.delete(*self.inbox_tree.get_children())
+        self.page_var.set("Loading...")
+        self.runner.submit(f"Inbox page {number + 1}",
+                           lambda task: self.do_show_page(task, pager, number),
+                           lambda task, result: self.page_loaded(task, pager, number),
+                           self.timeout(), meter=pager.meter)
+
+    def do_show_page(self, task, pager, number):
+        """Fetch a page (worker thread)."""
+        try:
+            if pager.mail is None:
+                task.set_phase("connecting")
+                pager.open()
+            task.set_phase("fetching envelopes")
+            for email_data in pager.page(number):
+                if not task.running:
+                    break
+                self.runner.post(self.add_inbox_row, pager, email_data)
+        except Exception:
+            pager.close()
+            pager.meter = WireMeter()  # the old one may have been aborted
+            raise
+
+    def add_inbox_row(self, pager, email_data):
+        """Insert one streamed row; pages arrive oldest first, so newest ends up on top."""
+        if pager is not self.pager:
+            return  # a row from a listing that has since been replaced
+        self.inbox_tree.insert("", 0, iid=str(email_data['uid']), values=(
+            email_data['from'], email_data['subject'],
+            (email_data['internaldate'] or '')[:20], f"{email_data['size'] // 1024 + 1} KB"
+        ), tags=() if email_data['seen'] else ("unseen",))
+
+    def save_attachments(self):
+        """Download the selected message's attachments into a chosen folder."""
+        selection = self.inbox_tree.selection()
+        if not selection or self.pager is None:
+            return
+        if not self.validate():
+            return
+        folder = filedialog.askdirectory(title="Save attachments to")
+        if not folder:
+            return
+        uid = int(selection[0])
+        account = self.account()
+        self.log(f"\nDownloading attachments of message {uid}...")
+        self.runner.submit(f"Attachments of {uid}", lambda task: download_attachment(
+            account['email'],
+            account['password'],
+            account['imap_server'],
+            account['imap_port'],
+            uid,
+            path=folder,
+            mailbox=self.pager.mailbox,
+            meter=task.meter
+        ), self.attachments_saved, self.timeout())
+
+    def attachments_saved(self, task, metrics):
+        if task.state != "done":
+            self.log(f"Download {task.state}; partial files were removed.")
+            return
+        if task.error is not None or not metrics[0]:
+            self.log("FAILED to download attachments.")
+            return
+        success, time_taken, bytes_received, _, _, saved = metrics
+        for item in saved:
+            self.log(f"Saved {item['path']} ({item['size']} bytes)")
+        rate = bytes_received / time_taken / 1e6 if time_taken > 0 else 0
+        self.log(f"{len(saved)} file(s) in {time_taken:.2f}s ({rate:.2f} MB/s)")
+
+    def page_loaded(self, task, pager, number):
+        if pager is not self.pager:
+            return  # superseded by Load Inbox
+        if task.state != "done":
+            status = f"Page load {task.state}"
+        elif task.error is not None:
+            status = "Failed to load inbox"
+            self.log(f"[IMAP] Inbox listing failed: {task.error}")
+        else:
+            self.page_number = number
+            metrics = pager.last_metrics
+            status = (f"Page {number + 1}/{pager.pages} ({pager.exists} messages) - "
+                      f"{metrics[1] * 1000:.0f} ms, {metrics[2]} bytes")
+        self.page_var.set(status)
+        self.set_inbox_buttons('normal')
+
+    def set_inbox_buttons(self, state):
+        """Enable the paging buttons that make sense for the current page."""
+        pages = self.pager.pages if self.pager is not None and self.pager.mail is not None else 1
+        self.inbox_btn.config(state=state)
+        self.newer_btn.config(state=state if self.page_number > 0 else 'disabled')
+        self.older_btn.config(state=state if self.page_number + 1 < pages else 'disabled')
+
+    def toggle_watch(self):
+        """Start or stop the IMAP IDLE watcher."""
+        if self.watcher is not None:
+            self.watcher.stop(timeout=0)
+            self.watcher = None
+            self.watch_btn.config(text="Watch Inbox")
+            self.log("[IDLE] Stopped watching.")
+            return
+        if not self.validate():
+            return
 
-def main():
+        account = self.account()
+        self.watcher = IMAPIdleWatcher(
+            account['email'],
+            account['password'],
+            account['imap_server'],
+            account['imap_port'],
+            on_message=lambda email_data: self.runner.post(self.on_new_email, email_data),
+            cache=default_mail_cache()
+        ).start()
+        self.watch_btn.config(text="Stop Watching")
+        self.log("[IDLE] Watching inbox for new mail...")
+
+    def on_new_email(self, email_data):
+        """Show an email pushed by the IDLE watcher (runs on the Tk thread)."""
+        self.refresh_cached()
+        self.log("\n" + "-"*40)
+        self.log("NEW EMAIL:")
+        self.log("-"*40)
+        self.log(f"From: {email_data['from']}")
+        self.log(f"Subject: {email_data['subject']}")
+        self.log("-"*40)
+        self.log(f"Body:\n{email_data['body'][:500]}")
+        self.log("-"*40)
+        self.notify("New Email", f"{email_data['from']}: {email_data['subject']}", "Email Received",
+                    summary="{count} new emails")
+
+
+def main(log_file=None, max_log_lines=MAX_LOG_LINES, metrics_port=None):
     """Start the GUI application."""
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
     root = tk.Tk()
-    EmailClientGUI(root)
+    EmailClientGUI(root, log_file, max_log_lines)
     root.mainloop()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Email client GUI")
+    parser.add_argument("--log-file", help="also write the output pane to this (rotating) file")
+    parser.add_argument("--log-lines", type=int, default=MAX_LOG_LINES,
+                        help="lines kept in the output pane")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+    main(args.log_file, args.log_lines, args.metrics_port)
@@ -0,0 +1,327 @@
+"""
+Notification Server Load Test
+Measures connections per second and p50/p99 latency of the notification server,
+and (--fanout) publish/subscribe delivery throughput and per-subscriber lag.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+from notification_server import (encode_frame, subscribe, HEADER, SUBSCRIBER_QUEUE,
+                                 DROP_OLDEST, DISCONNECT)
+from metrics_registry import percentile
+
+
+async def _one_connection(host, port, payload, timeout):
+    """Connect, send one framed message, half-close and wait for the server to close."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(payload)
+        await writer.drain()
+        writer.write_eof()
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return time.perf_counter() - start
+
+
+async def run_load(host='127.0.0.1', port=9999, connections=2000, concurrency=200,
+                   message_size=64, timeout=10):
+    """Open `connections` short-lived connections, `concurrency` at a time."""
+    payload = encode_frame(b"x" * message_size)
+    latencies = []
+    errors = 0
+    remaining = connections
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                latencies.append(await _one_connection(host, port, payload, timeout))
+            except (OSError, asyncio.TimeoutError):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, connections))))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "connections": connections,
+        "concurrency": concurrency,
+        "message_size": message_size,
+        "completed": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "conn_per_sec": len(latencies) / elapsed if elapsed > 0 else 0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0,
+    }
+
+
+async def _publisher(host, port, number, messages, message_size, rate, timeout):
+    """Publish `messages` frames on one connection, `rate` per second (0 = as
+    fast as possible). Returns the time it took.
+
+    Each message carries its sequence number and send time so subscribers
+    can count gaps (dropped notifications) and measure delivery lag.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    padding = "x" * message_size
+    start = time.perf_counter()
+    try:
+        for seq in range(messages):
+            writer.write(encode_frame(f"PUBLISH bench.{number} {seq} {time.time():.6f} {padding}"))
+            if rate and seq % 10 == 9:
+                await writer.drain()
+                await asyncio.sleep(max(0, start + (seq + 1) / rate - time.perf_counter()))
+            elif seq % 100 == 99:
+                await writer.drain()
+        await writer.drain()
+    finally:
+        writer.close()
+    return time.perf_counter() - start
+
+
+async def _subscriber(host, port, slow_delay, stop, timeout):
+    """Read notifications until the server closes, or `stop` is set and
+    nothing arrived for a second.
+
+    A slow subscriber has a small receive buffer, reads about one
+    notification at a time and sleeps slow_delay (seconds) after each read
+    until `stop`; then it reads what is left at full speed, so gaps left by
+    dropped notifications are still counted.
+    """
+    reader, writer = await subscribe(host, port, ['bench.*'], timeout,
+                                     rcvbuf=4096 if slow_delay else None)
+    result = {"slow": slow_delay > 0, "received": 0, "dropped": 0, "disconnected": False,
+              "lags": [], "last": time.perf_counter()}
+    last_seq = {}
+    buffer = b""
+    try:
+        while True:
+            slow = slow_delay and not stop.is_set()
+            # Fast subscribers read whatever is buffered and split the frames
+            # here; one read per frame would make the client the bottleneck
+            try:
+                data = await asyncio.wait_for(reader.read(HEADER.size + 256 if slow else 65536), 1.0)
+            except asyncio.TimeoutError:
+                if stop.is_set():
+                    break
+                continue
+            if not data:
+                result["disconnected"] = True  # the server only closes slow subscribers
+                break
+            buffer += data
+            now = time.time()
+            while len(buffer) >= HEADER.size:
+                length = HEADER.unpack_from(buffer)[0]
+                if len(buffer) < HEADER.size + length:
+                    break
+                topic, seq, sent = buffer[HEADER.size:HEADER.size + length].split(b' ', 3)[:3]
+                buffer = buffer[HEADER.size + length:]
+                result["lags"].append(now - float(sent))
+                result["received"] += 1
+                result["dropped"] += int(seq) - last_seq.get(topic, -1) - 1
+                last_seq[topic] = int(seq)
+            result["last"] = time.perf_counter()
+            if slow:
+                await asyncio.sleep(slow_delay)
+    except (ConnectionError, OSError):
+        result["disconnected"] = True
+    finally:
+        writer.close()
+    return result
+
+
+async def run_fanout(host='127.0.0.1', port=9999, subscribers=20, slow=2, publishers=4,
+                     messages=2500, message_size=64, rate=5000, slow_delay=0.005, drain=3.0,
+                     timeout=10):
+    """Publish `messages` per publisher to `subscribers` subscribers, `slow` of
+    which sleep slow_delay after every read.
+
+    rate is the total publish rate (messages/s, 0 = unpaced); the achieved
+    rate shows whether slow subscribers hold publishers back. Subscribers
+    get `drain` seconds after the last publish to catch up. Lag is the time
+    from publish to receipt.
+    """
+    stop = asyncio.Event()
+    readers = [asyncio.create_task(_subscriber(host, port, slow_delay if n < slow else 0, stop, timeout))
+               for n in range(subscribers)]
+    await asyncio.sleep(0.2)  # let every subscription land before publishing
+
+    start = time.perf_counter()
+    publish_times = await asyncio.gather(*(_publisher(host, port, n, messages, message_size,
+                                                      rate / publishers, timeout)
+                                           for n in range(publishers)))
+    published = time.perf_counter()
+    await asyncio.sleep(drain)
+    stop.set()
+    results = await asyncio.gather(*readers)
+
+    delivered = sum(r["received"] for r in results)
+    end = max([published] + [r["last"] for r in results])
+    rows = {}
+    for kind in ("fast", "slow"):
+        group = [r for r in results if r["slow"] == (kind == "slow")]
+        if not group:
+            continue
+        lags = [lag for r in group for lag in r["lags"]]
+        rows[kind] = {
+            "subscribers": len(group),
+            "received": sum(r["received"] for r in group),
+            "dropped": sum(r["dropped"] for r in group),
+            "disconnected": sum(r["disconnected"] for r in group),
+            # Never seen: lost at the end of a disconnected subscription
+            "missing": sum(publishers * messages - r["received"] - r["dropped"] for r in group),
+            "lag_p50_ms": percentile(lags, 50) * 1000,
+            "lag_p99_ms": percentile(lags, 99) * 1000,
+            "lag_max_ms": max(lags) * 1000 if lags else 0,
+        }
+    return {
+        "publishers": publishers,
+        "messages": publishers * messages,
+        "publish_s": max(publish_times),
+        "publish_per_sec": publishers * messages / max(publish_times) if publish_times else 0,
+        "expected": publishers * messages * subscribers,
+        "delivered": delivered,
+        "delivered_per_sec": delivered / (end - start) if end > start else 0,
+        "subscribers": rows,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server_process(blocking=False, port=None, extra_args=()):
+    """Launch notification_server.py in a subprocess. Returns (process, port)."""
+    port = port or _free_port()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "notification_server.py")
+    args = [sys.executable, script, "--port", str(port), "--quiet"] + list(extra_args)
+    if blocking:
+        args.append("--blocking")
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("notification server did not start")
+
+
+def print_results(results):
+    """Print one row per run."""
+    print("\n" + "="*75)
+    print("NOTIFICATION SERVER LOAD TEST")
+    print("="*75)
+    print(f"{'Server':<10} {'Conns':<8} {'Errors':<8} {'Conn/s':<10} {'p50(ms)':<10} {'p99(ms)':<10} {'max(ms)':<10}")
+    print("-"*75)
+    for name, r in results.items():
+        print(f"{name:<10} {r['completed']:<8} {r['errors']:<8} {r['conn_per_sec']:<10.1f} "
+              f"{r['p50_ms']:<10.2f} {r['p99_ms']:<10.2f} {r['max_ms']:<10.2f}")
+    print("="*75 + "\n")
+
+
+def print_fanout(results):
+    """Print publish and delivery rates, then one row per subscriber kind."""
+    print("\n" + "="*75)
+    print("PUBLISH/SUBSCRIBE FAN-OUT")
+    print("="*75)
+    print(f"Published {results['messages']} in {results['publish_s']:.2f}s "
+          f"({results['publish_per_sec']:.0f}/s from {results['publishers']} publisher(s))")
+    print(f"Delivered {results['delivered']} of {results['expected']} "
+          f"({results['delivered_per_sec']:.0f}/s)")
+    print("-"*75)
+    print(f"{'Subs':<5} {'Count':<6} {'Received':<9} {'Dropped':<8} {'Missing':<8} {'Discon.':<8} "
+          f"{'p50 lag':<9} {'p99 lag':<9} {'max lag':<9}")
+    for kind, r in results["subscribers"].items():
+        print(f"{kind:<5} {r['subscribers']:<6} {r['received']:<9} {r['dropped']:<8} {r['missing']:<8} "
+              f"{r['disconnected']:<8} {r['lag_p50_ms']:<9.1f} {r['lag_p99_ms']:<9.1f} "
+              f"{r['lag_max_ms']:<9.1f}")
+    print("(lag in ms from publish to receipt)")
+    print("="*75 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the notification server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int,
+                        help="test an already running server instead of starting both")
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--message-size", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--json", help="also write results to this JSON file")
+    parser.add_argument("--fanout", action="store_true",
+                        help="measure publish/subscribe delivery instead of connections")
+    parser.add_argument("--subscribers", type=int, default=20)
+    parser.add_argument("--slow", type=int, default=2, help="subscribers that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.005,
+                        help="seconds a slow subscriber waits after each read")
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2500, help="messages per publisher")
+    parser.add_argument("--rate", type=float, default=5000,
+                        help="total messages/s published (0 = as fast as possible)")
+    parser.add_argument("--queue-size", type=int, default=SUBSCRIBER_QUEUE)
+    parser.add_argument("--slow-policy", choices=(DROP_OLDEST, DISCONNECT), default=DROP_OLDEST)
+    args = parser.parse_args()
+
+    if args.fanout:
+        fanout = dict(subscribers=args.subscribers, slow=args.slow, slow_delay=args.slow_delay,
+                      publishers=args.publishers, messages=args.messages, rate=args.rate,
+                      message_size=args.message_size, timeout=args.timeout)
+        if args.port:
+            results = asyncio.run(run_fanout(args.host, args.port, **fanout))
+        else:
+            process, port = start_server_process(extra_args=[
+                "--queue-size", str(args.queue_size), "--slow-policy", args.slow_policy])
+            try:
+                results = asyncio.run(run_fanout('127.0.0.1', port, **fanout))
+            finally:
+                process.terminate()
+                process.wait()
+        print_fanout(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    load = dict(connections=args.connections, concurrency=args.concurrency,
+                message_size=args.message_size, timeout=args.timeout)
+    results = {}
+    if args.port:
+        results["target"] = asyncio.run(run_load(args.host, args.port, **load))
+    else:
+        # Compare the asyncio server with the original blocking one
+        for name, blocking in (("asyncio", False), ("blocking", True)):
+            process, port = start_server_process(blocking)
+            try:
+                results[name] = asyncio.run(run_load('127.0.0.1', port, **load))
+            finally:
+                process.terminate()
+                process.wait()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
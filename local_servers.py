@@ -0,0 +1,979 @@
+"""
+Local Stand-in Servers
+In-process IMAP and SMTP servers used to exercise the email client without mail.tm.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import re
+import ssl
+import time
+import base64
+import bisect
+import select
+import socket
+import tempfile
+import threading
+import subprocess
+import socketserver
+from datetime import datetime
+from email import message_from_bytes
+from email.utils import getaddresses, formatdate
+from wire_metrics import DeflateSocket
+
+
+# ==================== TLS Helpers ====================
+
+def make_self_signed_cert(directory=None):
+    """Create a throwaway self-signed cert for localhost. Returns (certfile, keyfile)."""
+    directory = directory or tempfile.mkdtemp(prefix="email_client_")
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                    "-days", "1", "-subj", "/CN=localhost",
+                    "-keyout", keyfile, "-out", certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def server_ssl_context(certfile=None, keyfile=None):
+    """Server-side SSLContext, using a fresh self-signed cert if none is given."""
+    if certfile is None:
+        certfile, keyfile = make_self_signed_cert()
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+# ==================== IMAP Wire Helpers ====================
+
+def _quote(value):
+    """Encode a value as an IMAP string (NIL, quoted or literal)."""
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode('utf-8', errors='surrogateescape')
+    if re.search(rb'[\x00\r\n\x80-\xff]', value):
+        return b"{%d}\r\n" % len(value) + value
+    return b'"' + value.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def _crlf(data):
+    """Normalize line endings to CRLF."""
+    return re.sub(rb'\r?\n', b'\r\n', data)
+
+
+def _split_message(raw):
+    """Split raw message bytes into (header, body) at the first blank line."""
+    match = re.search(rb'\r?\n\r?\n', raw)
+    if not match:
+        return raw, b""
+    return raw[:match.end()], raw[match.end():]
+
+
+def _part_body(part):
+    """Encoded body bytes of a MIME part, as sent on the wire."""
+    if part.is_multipart():
+        return _split_message(_crlf(part.as_bytes()))[1]
+    payload = part.get_payload()
+    if isinstance(payload, bytes):
+        return _crlf(payload)
+    # 8-bit payloads come back decoded with the part's charset; undo that
+    charset = part.get_content_charset() or 'ascii'
+    return _crlf(payload.encode(charset, errors='surrogateescape'))
+
+
+def _header_fields(header, names, exclude=False):
+    """Select header lines (with continuations) by field name."""
+    wanted = {name.upper() for name in names}
+    out = []
+    keep = False
+    for line in re.split(rb'(?<=\n)', header):
+        if not line.strip():
+            continue
+        if line[:1] in (b' ', b'\t'):
+            if keep:
+                out.append(line)
+            continue
+        name = line.split(b':', 1)[0].strip().decode('ascii', errors='replace').upper()
+        keep = (name in wanted) != exclude
+        if keep:
+            out.append(line)
+    return _crlf(b"".join(out)) + b"\r\n"
+
+
+def _address_list(value):
+    if not value:
+        return b"NIL"
+    items = []
+    for name, addr in getaddresses([value]):
+        mailbox, _, host = addr.partition('@')
+        items.append(b"(" + b" ".join([_quote(name or None), b"NIL",
+                                      _quote(mailbox or None), _quote(host or None)]) + b")")
+    return b"(" + b"".join(items) + b")" if items else b"NIL"
+
+
+def envelope(msg):
+    """ENVELOPE structure for a parsed message."""
+    sender = msg['From']
+    fields = [
+        _quote(msg['Date']), _quote(msg['Subject']),
+        _address_list(sender), _address_list(msg['Sender'] or sender),
+        _address_list(msg['Reply-To'] or sender), _address_list(msg['To']),
+        _address_list(msg['Cc']), _address_list(msg['Bcc']),
+        _quote(msg['In-Reply-To']), _quote(msg['Message-ID']),
+    ]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def bodystructure(part):
+    """BODYSTRUCTURE for a parsed message or MIME part."""
+    if part.is_multipart() and part.get_content_maintype() == 'multipart':
+        children = b"".join(bodystructure(p) for p in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype().upper()) + b")"
+
+    maintype = part.get_content_maintype().upper()
+    subtype = part.get_content_subtype().upper()
+    params = part.get_params() or []
+    params = [(k, v) for k, v in params[1:]]
+    param_list = b"NIL"
+    if params:
+        param_list = b"(" + b" ".join(_quote(k.upper()) + b" " + _quote(str(v))
+                                      for k, v in params) + b")"
+    body = _part_body(part)
+    encoding = (part.get('Content-Transfer-Encoding') or '7BIT').upper()
+    fields = [_quote(maintype), _quote(subtype), param_list, _quote(part.get('Content-ID')),
+              _quote(part.get('Content-Description')), _quote(encoding), b"%d" % len(body)]
+    if maintype == 'MESSAGE' and subtype == 'RFC822':
+        inner = part.get_payload()[0]
+        fields += [envelope(inner), bodystructure(inner), b"%d" % body.count(b"\n")]
+    elif maintype == 'TEXT':
+        fields.append(b"%d" % body.count(b"\n"))
+
+    # Extension data: MD5 and disposition
+    disposition = b"NIL"
+    if part.get('Content-Disposition'):
+        disp = part.get_content_disposition() or 'attachment'
+        filename = part.get_filename()
+        disp_params = b"(" + _quote("FILENAME") + b" " + _quote(filename) + b")" if filename else b"NIL"
+        disposition = b"(" + _quote(disp.upper()) + b" " + disp_params + b")"
+    fields += [b"NIL", disposition]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _tokenize(args):
+    """Split command arguments into atoms, quoted strings and (...) groups."""
+    tokens = []
+    i = 0
+    while i < len(args):
+        ch = args[i]
+        if ch == ' ':
+            i += 1
+        elif ch == '"':
+            j = i + 1
+            value = []
+            while j < len(args) and args[j] != '"':
+                if args[j] == '\\':
+                    j += 1
+                value.append(args[j])
+                j += 1
+            tokens.append(''.join(value))
+            i = j + 1
+        else:
+            depth = 0
+            j = i
+            while j < len(args):
+                if args[j] in '([':
+                    depth += 1
+                elif args[j] in ')]':
+                    depth -= 1
+                elif args[j] == ' ' and depth == 0:
+                    break
+                j += 1
+            tokens.append(args[i:j])
+            i = j
+    return tokens
+
+
+FETCH_MACROS = {
+    'ALL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE'],
+    'FAST': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE'],
+    'FULL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE', 'BODY'],
+}
+
+
+def _fetch_items(spec):
+    spec = spec.strip()
+    if spec.upper() in FETCH_MACROS:
+        return FETCH_MACROS[spec.upper()]
+    if spec.startswith('(') and spec.endswith(')'):
+        spec = spec[1:-1]
+    return _tokenize(spec)
+
+
+# ==================== Mailbox Store ====================
+
+class StoredMessage:
+    """One message held by the stand-in server."""
+
+    def __init__(self, uid, raw, flags=(), internaldate=None, modseq=1):
+        self.uid = uid
+        self.raw = _crlf(raw)
+        self.flags = set(flags)
+        self.internaldate = internaldate or time.time()
+        self.modseq = modseq
+        self._parsed = None
+        self.last_section = None  # (section, bytes) of the last large section rendered
+
+    @property
+    def msg(self):
+        if self._parsed is None:
+            self._parsed = message_from_bytes(self.raw)
+        return self._parsed
+
+
+class Mailbox:
+    """Ordered message list with UIDs, guarded by a condition for IDLE waiters."""
+
+    def __init__(self, uidvalidity=None):
+        self.uidvalidity = uidvalidity or int(time.time())
+        self.uids = []
+        self.messages = {}
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.cond = threading.Condition()
+
+    def append(self, raw, flags=(), internaldate=None):
+        """Deliver a message and wake IDLE sessions. Returns its UID."""
+        with self.cond:
+            uid = self.uidnext
+            self.uidnext += 1
+            self.highestmodseq += 1
+            self.messages[uid] = StoredMessage(uid, raw, flags, internaldate, self.highestmodseq)
+            self.uids.append(uid)
+            self.cond.notify_all()
+        return uid
+
+    def expunge(self, uids):
+        """Remove messages by UID and wake IDLE sessions."""
+        with self.cond:
+            for uid in uids:
+                if self.messages.pop(uid, None) is not None:
+                    self.uids.remove(uid)
+            self.highestmodseq += 1
+            self.cond.notify_all()
+
+    def resolve(self, sequence_set, by_uid):
+        """Return the sorted UIDs matched by a sequence or UID set."""
+        uids = self.uids
+        if not uids:
+            return []
+        top = uids[-1] if by_uid else len(uids)
+        matched = set()
+        for item in sequence_set.split(','):
+            lo, _, hi = item.partition(':')
+            lo = top if lo == '*' else int(lo)
+            hi = lo if not hi else (top if hi == '*' else int(hi))
+            lo, hi = min(lo, hi), max(lo, hi)
+            if by_uid:
+                start = bisect.bisect_left(uids, lo)
+                end = bisect.bisect_right(uids, hi)
+                matched.update(uids[start:end])
+            else:
+                matched.update(uids[max(lo, 1) - 1:hi])
+        return sorted(matched)
+
+
+# ==================== IMAP Stand-in ====================
+
+class IMAPHandler(socketserver.BaseRequestHandler):
+    """One IMAP session."""
+
+    def setup(self):
+        self.server.sessions.add(self)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = self.request
+        if self.server.implicit_tls:
+            self.sock = self.server.ssl_context.wrap_socket(self.sock, server_side=True)
+        self.rfile = self.sock.makefile('rb')
+        self.user = None
+        self.selected = None
+        self.view = []          # UIDs the client knows about, in sequence order
+        self.condstore = False
+        self.compressed = False
+
+    def finish(self):
+        self.server.sessions.discard(self)
+
+    # ---------- I/O ----------
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def line(self, text):
+        self.send(text.encode() + b"\r\n")
+
+    def capabilities(self):
+        caps = ["IMAP4rev1", "LITERAL+", "IDLE", "ENABLE", "UIDPLUS", "MULTIAPPEND"]
+        if self.server.condstore:
+            caps.append("CONDSTORE")
+        if self.server.compress and self.user and not self.compressed:
+            caps.append("COMPRESS=DEFLATE")  # like most servers, only once logged in
+        if self.server.ssl_context and not isinstance(self.sock, ssl.SSLSocket) and not self.compressed:
+            caps.append("STARTTLS")
+        return " ".join(caps)
+
+    # ---------- Main loop ----------
+
+    def handle(self):
+        self.line(f"* OK [CAPABILITY {self.capabilities()}] IMAP stand-in ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.rstrip(b"\r\n").decode('utf-8', errors='replace')
+            tag, _, rest = line.partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            if command == 'UID':
+                sub, _, args = args.partition(' ')
+                command = 'UID ' + sub.upper()
+
+            handler = getattr(self, 'do_' + command.replace(' ', '_'), None)
+            if handler is None:
+                self.line(f"{tag} BAD Unknown command {command}")
+                continue
+            if self.server.delay:
+                time.sleep(self.server.delay)  # simulated round trip
+            try:
+                if handler(tag, args) is False:
+                    return
+            except (ConnectionError, ssl.SSLError, OSError):
+                return
+            except Exception as e:
+                self.line(f"{tag} BAD {e}")
+
+    # ---------- Session commands ----------
+
+    def do_CAPABILITY(self, tag, args):
+        self.line(f"* CAPABILITY {self.capabilities()}")
+        self.line(f"{tag} OK CAPABILITY completed")
+
+    def do_NOOP(self, tag, args):
+        self.report_changes()
+        self.line(f"{tag} OK NOOP completed")
+
+    def do_LOGOUT(self, tag, args):
+        self.line("* BYE logging out")
+        self.line(f"{tag} OK LOGOUT completed")
+        return False
+
+    def do_STARTTLS(self, tag, args):
+        self.line(f"{tag} OK Begin TLS negotiation now")
+        self.sock = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+        self.rfile = self.sock.makefile('rb')
+
+    def do_COMPRESS(self, tag, args):
+        if not self.server.compress or self.user is None or args.upper() != 'DEFLATE':
+            self.line(f"{tag} BAD COMPRESS not available")
+            return
+        if self.compressed:
+            self.line(f"{tag} NO [COMPRESSIONACTIVE] Already compressed")
+            return
+        self.line(f"{tag} OK DEFLATE active")
+        self.sock = DeflateSocket(self.sock)
+        self.rfile = self.sock.makefile('rb')
+        self.compressed = True
+
+    def do_LOGIN(self, tag, args):
+        user, password = _tokenize(args)[:2]
+        if self.server.users.get(user) != password:
+            self.line(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+            return
+        self.user = user
+        self.line(f"{tag} OK [CAPABILITY {self.capabilities()}] LOGIN completed")
+
+    def do_ENABLE(self, tag, args):
+        enabled = [cap for cap in args.upper().split() if cap == 'CONDSTORE' and self.server.condstore]
+        self.condstore = self.condstore or bool(enabled)
+        self.line("* ENABLED " + " ".join(enabled))
+        self.line(f"{tag} OK ENABLE completed")
+
+    def mailbox(self, name):
+        """The named mailbox (INBOX in any case), or None."""
+        return self.server.mailboxes.get(name.upper() if name.upper() == 'INBOX' else name)
+
+    def do_SELECT(self, tag, args, readonly=False):
+        mailbox = self.mailbox(_tokenize(args)[0])
+        if mailbox is None:
+            self.line(f"{tag} NO Mailbox does not exist")
+            return
+        if 'CONDSTORE' in args.upper():
+            self.condstore = True
+        self.selected = mailbox
+        with mailbox.cond:
+            self.view = list(mailbox.uids)
+            self.line("* FLAGS (\\Seen \\Answered \\Flagged \\Deleted \\Draft)")
+            self.line(f"* {len(self.view)} EXISTS")
+            self.line("* 0 RECENT")
+            self.line(f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid")
+            self.line(f"* OK [UIDNEXT {mailbox.uidnext}] Predicted next UID")
+            if self.condstore:
+                self.line(f"* OK [HIGHESTMODSEQ {mailbox.highestmodseq}] Highest")
+        mode = "READ-ONLY" if readonly else "READ-WRITE"
+        self.line(f"{tag} OK [{mode}] {'EXAMINE' if readonly else 'SELECT'} completed")
+
+    def do_EXAMINE(self, tag, args):
+        self.do_SELECT(tag, args, readonly=True)
+
+    def do_CLOSE(self, tag, args):
+        self.selected = None
+        self.line(f"{tag} OK CLOSE completed")
+
+    def do_CREATE(self, tag, args):
+        name = _tokenize(args)[0]
+        if self.mailbox(name) is not None:
+            self.line(f"{tag} NO [ALREADYEXISTS] Mailbox exists")
+            return
+        self.server.mailboxes[name] = Mailbox()
+        self.line(f"{tag} OK CREATE completed")
+
+    # ---------- Append ----------
+
+    APPEND_MESSAGE = re.compile(r'\s*(\([^)]*\))?\s*("[^"]*")?\s*\{(\d+)(\+?)\}$')
+
+    def do_APPEND(self, tag, args):
+        """APPEND, with any number of messages (MULTIAPPEND) and LITERAL+ literals.
+
+        The messages are stored together once the whole command has been
+        read, so a failure stores none of them.
+        """
+        match = re.match(r'("(?:[^"\\]|\\.)*"|\S+) (.*)$', args)
+        if not match:
+            self.line(f"{tag} BAD APPEND needs a mailbox and a message")
+            return
+        mailbox = self.mailbox(_tokenize(match.group(1))[0])
+        rest = match.group(2)
+        messages = []
+        while rest:
+            item = self.APPEND_MESSAGE.match(rest)
+            if not item:
+                self.line(f"{tag} BAD Invalid APPEND arguments")
+                return
+            flags, date, size, non_sync = item.groups()
+            if not non_sync:
+                if mailbox is None:
+                    self.line(f"{tag} NO [TRYCREATE] Mailbox does not exist")
+                    return
+                self.line("+ Ready for literal data")
+            raw = self.rfile.read(int(size))
+            if len(raw) < int(size):
+                return False
+            internaldate = None
+            if date:
+                internaldate = datetime.strptime(date.strip('"').strip(),
+                                                 "%d-%b-%Y %H:%M:%S %z").timestamp()
+            messages.append((raw, (flags or '()')[1:-1].split(), internaldate))
+            rest = self.rfile.readline().rstrip(b"\r\n").decode('utf-8', errors='replace')
+        if not messages:
+            self.line(f"{tag} BAD APPEND needs a message")
+        elif mailbox is None:
+            self.line(f"{tag} NO [TRYCREATE] Mailbox does not exist")
+        else:
+            uids = [mailbox.append(raw, flags, internaldate) for raw, flags, internaldate in messages]
+            uid_set = str(uids[0]) if len(uids) == 1 else f"{uids[0]}:{uids[-1]}"
+            self.line(f"{tag} OK [APPENDUID {mailbox.uidvalidity} {uid_set}] APPEND completed")
+
+    # ---------- Mailbox changes ----------
+
+    def report_changes(self):
+        """Send EXPUNGE/EXISTS for changes since the client's last view."""
+        if self.selected is None:
+            return
+        with self.selected.cond:
+            current = list(self.selected.uids)
+        present = set(current)
+        for seq in range(len(self.view), 0, -1):
+            if self.view[seq - 1] not in present:
+                self.line(f"* {seq} EXPUNGE")
+                del self.view[seq - 1]
+        if len(current) != len(self.view):
+            self.line(f"* {len(current)} EXISTS")
+        self.view = current
+
+    def do_IDLE(self, tag, args):
+        self.line("+ idling")
+        mailbox = self.selected
+        seen = None  # changes the client has not been told about are sent at once
+        while True:
+            pending = getattr(self.sock, 'pending', None)  # TLS or inflate buffers
+            readable = pending is not None and pending()
+            if not readable:
+                readable = select.select([self.sock], [], [], 0.05)[0]
+            if readable:
+                done = self.rfile.readline()
+                if not done:
+                    return False
+                break
+            if mailbox and mailbox.highestmodseq != seen:
+                seen = mailbox.highestmodseq
+                self.report_changes()
+        self.line(f"{tag} OK IDLE terminated")
+
+    # ---------- Search / fetch ----------
+
+    def do_SEARCH(self, tag, args, by_uid=False):
+        mailbox = self.selected
+        criteria = args.split()
+        with mailbox.cond:
+            if not criteria or criteria[0].upper() == 'ALL':
+                uids = list(mailbox.uids)
+            elif criteria[0].upper() == 'UID':
+                uids = mailbox.resolve(criteria[1], by_uid=True)
+            else:
+                uids = mailbox.resolve(criteria[0], by_uid=False)
+            if by_uid:
+                result = uids
+            else:
+                index = {uid: seq for seq, uid in enumerate(mailbox.uids, 1)}
+                result = [index[uid] for uid in uids]
+        self.line("* SEARCH" + "".join(f" {n}" for n in result))
+        self.line(f"{tag} OK SEARCH completed")
+
+    def do_UID_SEARCH(self, tag, args):
+        self.do_SEARCH(tag, args, by_uid=True)
+
+    def do_FETCH(self, tag, args, by_uid=False):
+        mailbox = self.selected
+        sequence_set, _, spec = args.partition(' ')
+        items = [item.upper() for item in _fetch_items(spec)]
+        if by_uid and 'UID' not in items:
+            items.insert(0, 'UID')
+        with mailbox.cond:
+            uids = mailbox.resolve(sequence_set, by_uid)
+            index = {uid: seq for seq, uid in enumerate(mailbox.uids, 1)}
+            messages = [(index[uid], mailbox.messages[uid]) for uid in uids]
+        for seq, stored in messages:
+            parts = [self.fetch_item(stored, item) for item in items]
+            self.send(b"* %d FETCH (" % seq + b" ".join(parts) + b")\r\n")
+        self.line(f"{tag} OK FETCH completed")
+
+    def do_UID_FETCH(self, tag, args):
+        self.do_FETCH(tag, args, by_uid=True)
+
+    def fetch_item(self, stored, item):
+        """Render one FETCH data item as "NAME value"."""
+        if item == 'UID':
+            return b"UID %d" % stored.uid
+        if item == 'FLAGS':
+            return b"FLAGS (" + " ".join(sorted(stored.flags)).encode() + b")"
+        if item == 'INTERNALDATE':
+            date = time.strftime("%d-%b-%Y %H:%M:%S +0000", time.gmtime(stored.internaldate))
+            return b'INTERNALDATE "' + date.encode() + b'"'
+        if item == 'RFC822.SIZE':
+            return b"RFC822.SIZE %d" % len(stored.raw)
+        if item == 'MODSEQ':
+            return b"MODSEQ (%d)" % stored.modseq
+        if item == 'ENVELOPE':
+            return b"ENVELOPE " + envelope(stored.msg)
+        if item in ('BODYSTRUCTURE', 'BODY'):
+            return item.encode() + b" " + bodystructure(stored.msg)
+        if item == 'RFC822':
+            stored.flags.add('\\Seen')
+            return b"RFC822 " + _quote_literal(stored.raw)
+        if item == 'RFC822.HEADER':
+            return b"RFC822.HEADER " + _quote_literal(_split_message(stored.raw)[0])
+        if item == 'RFC822.TEXT':
+            return b"RFC822.TEXT " + _quote_literal(_split_message(stored.raw)[1])
+
+        match = re.match(r'BODY(\.PEEK)?\[(.*)\](?:<(\d+)(?:\.(\d+))?>)?$', item)
+        if not match:
+            raise ValueError(f"unsupported FETCH item {item}")
+        peek, section, offset, length = match.groups()
+        if not peek:
+            stored.flags.add('\\Seen')
+        if stored.last_section and stored.last_section[0] == section:
+            data = stored.last_section[1]
+        else:
+            data = self.section(stored, section)
+            if len(data) > 1024 * 1024:
+                # Partial FETCHes of one large part come in a row; render it once
+                stored.last_section = (section, data)
+        name = b"BODY[" + section.encode() + b"]"
+        if offset is not None:
+            offset = int(offset)
+            data = data[offset:offset + int(length)] if length else data[offset:]
+            name += b"<%d>" % offset
+        return name + b" " + _quote_literal(data)
+
+    def section(self, stored, section):
+        """Resolve a BODY[section] specifier to bytes."""
+        match = re.match(r'((?:\d+\.)*\d+)?\.?(.*)$', section)
+        path, text = match.groups()
+        part = stored.msg
+        header, body = _split_message(stored.raw)
+        if path:
+            for number in map(int, path.split('.')):
+                if part.get_content_maintype() == 'multipart':
+                    part = part.get_payload()[number - 1]
+                elif part.get_content_type() == 'message/rfc822':
+                    inner = part.get_payload()[0]
+                    part = inner.get_payload()[number - 1] if inner.is_multipart() else inner
+                elif number != 1:
+                    raise ValueError(f"no such section {section}")
+            if part is not stored.msg:
+                header = _split_message(_crlf(part.as_bytes()))[0]
+            body = _part_body(part)
+
+        if not text:
+            return stored.raw if not path else body
+        if text.startswith('HEADER.FIELDS'):
+            fields = text[text.index('(') + 1:text.rindex(')')].split()
+            return _header_fields(header, fields, exclude='.NOT' in text)
+        if text in ('HEADER', 'MIME'):
+            return header
+        if text == 'TEXT':
+            return body
+        raise ValueError(f"unsupported section {section}")
+
+
+def _quote_literal(data):
+    return b"{%d}\r\n" % len(data) + data
+
+
+class IMAPStandIn(socketserver.ThreadingTCPServer):
+    """Threaded in-process IMAP server holding messages in memory.
+
+    Plain TCP with STARTTLS by default; pass implicit_tls=True for an
+    IMAPS-style listener. Messages are added with deliver(). delay (seconds)
+    is slept before every command to simulate network latency. COMPRESS=DEFLATE
+    is offered after login unless compress=False.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, users=None, ssl_context=None,
+                 implicit_tls=False, condstore=True, delay=0.0, compress=True):
+        self.users = users or {"user@example.com": "password"}
+        self.delay = delay
+        self.compress = compress
+        self.ssl_context = ssl_context or server_ssl_context()
+        self.implicit_tls = implicit_tls
+        self.condstore = condstore
+        self.mailboxes = {"INBOX": Mailbox()}
+        self.sessions = set()
+        super().__init__((host, port), IMAPHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def deliver(self, raw, mailbox="INBOX", flags=()):
+        """Add a message (bytes or str) to a mailbox. Returns its UID."""
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+        return self.mailboxes.setdefault(mailbox, Mailbox()).append(raw, flags)
+
+    def drop_connections(self):
+        """Abruptly close every open session (simulates a network drop)."""
+        for session in list(self.sessions):
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        """Serve from a daemon thread. Returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# ==================== SMTP Stand-in ====================
+
+class SMTPHandler(socketserver.BaseRequestHandler):
+    """One SMTP session (EHLO, STARTTLS, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, BDAT)."""
+
+    def setup(self):
+        self.server.sessions.add(self)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = self.request
+        if self.server.implicit_tls:
+            self.sock = self.server.ssl_context.wrap_socket(self.sock, server_side=True)
+        self.rfile = self.sock.makefile('rb')
+        self.user = None
+        self.reset()
+
+    def finish(self):
+        self.server.sessions.discard(self)
+
+    def reset(self):
+        self.sender = None
+        self.recipients = []
+        self.chunks = bytearray()  # BDAT data received so far
+
+    def line(self, text):
+        self.sock.sendall(text.encode() + b"\r\n")
+
+    def readline(self):
+        raw = self.rfile.readline()
+        if not raw:
+            raise ConnectionError("client closed the connection")
+        return raw
+
+    def extensions(self):
+        extensions = ["PIPELINING", "8BITMIME", f"SIZE {self.server.max_size}"]
+        if self.server.chunking:
+            extensions.append("CHUNKING")
+        if isinstance(self.sock, ssl.SSLSocket):
+            extensions.append("AUTH PLAIN LOGIN")  # only offered over TLS
+        elif self.server.ssl_context:
+            extensions.append("STARTTLS")
+        return extensions
+
+    # ---------- Main loop ----------
+
+    def handle(self):
+        self.line("220 localhost ESMTP stand-in ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.rstrip(b"\r\n").decode('utf-8', errors='replace')
+            command, _, args = line.partition(' ')
+            handler = getattr(self, 'do_' + command.upper(), None)
+            if handler is None:
+                self.line("502 5.5.2 Command not recognized")
+                continue
+            if self.server.delay:
+                time.sleep(self.server.delay)  # simulated round trip
+            try:
+                if handler(args) is False:
+                    return
+            except (ConnectionError, ssl.SSLError, OSError):
+                return
+            except Exception as e:
+                self.line(f"501 5.5.4 {e}")
+
+    # ---------- Commands ----------
+
+    def do_EHLO(self, args):
+        lines = ["localhost"] + self.extensions()
+        reply = [f"250-{line}\r\n" for line in lines[:-1]] + [f"250 {lines[-1]}\r\n"]
+        self.sock.sendall("".join(reply).encode())
+
+    def do_HELO(self, args):
+        self.line("250 localhost")
+
+    def do_STARTTLS(self, args):
+        if isinstance(self.sock, ssl.SSLSocket):
+            self.line("503 5.5.1 TLS already active")
+            return
+        self.line("220 2.0.0 Ready to start TLS")
+        self.sock = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+        self.rfile = self.sock.makefile('rb')
+        self.user = None
+        self.reset()
+
+    def do_AUTH(self, args):
+        mechanism, _, initial = args.partition(' ')
+        mechanism = mechanism.upper()
+        if mechanism == 'PLAIN':
+            if not initial:
+                self.line("334 ")
+                initial = self.readline().strip().decode()
+            _, user, password = base64.b64decode(initial).decode('utf-8').split('\0')
+        elif mechanism == 'LOGIN':
+            self.line("334 VXNlcm5hbWU6")
+            user = base64.b64decode(self.readline().strip()).decode('utf-8')
+            self.line("334 UGFzc3dvcmQ6")
+            password = base64.b64decode(self.readline().strip()).decode('utf-8')
+        else:
+            self.line("504 5.5.4 Unrecognized authentication type")
+            return
+        if self.server.users.get(user) != password:
+            self.line("535 5.7.8 Authentication credentials invalid")
+            return
+        self.user = user
+        self.line("235 2.7.0 Authentication successful")
+
+    def do_MAIL(self, args):
+        if self.user is None:
+            self.line("530 5.7.0 Authentication required")
+            return
+        match = re.match(r'FROM:\s*<([^>]*)>', args, re.IGNORECASE)
+        if not match:
+            self.line("501 5.5.4 Syntax: MAIL FROM:<address>")
+            return
+        size = re.search(r'\bSIZE=(\d+)', args, re.IGNORECASE)
+        if size and int(size.group(1)) > self.server.max_size:
+            self.line("552 5.3.4 Message size exceeds fixed limit")
+            return
+        self.reset()
+        self.sender = match.group(1)
+        self.line("250 2.1.0 OK")
+
+    def do_RCPT(self, args):
+        if self.sender is None:
+            self.line("503 5.5.1 Need MAIL before RCPT")
+            return
+        match = re.match(r'TO:\s*<([^>]+)>', args, re.IGNORECASE)
+        if not match:
+            self.line("501 5.5.4 Syntax: RCPT TO:<address>")
+            return
+        if match.group(1) in self.server.refuse:
+            self.line(self.server.refuse[match.group(1)])
+            return
+        self.recipients.append(match.group(1))
+        self.line("250 2.1.5 OK")
+
+    def do_DATA(self, args):
+        if not self.recipients:
+            self.line("503 5.5.1 Need RCPT before DATA")
+            return
+        self.line("354 End data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.readline()
+            if line == b".\r\n":
+                break
+            if line.startswith(b"."):
+                line = line[1:]  # undo dot-stuffing
+            lines.append(line)
+        data = b"".join(lines)
+        if len(data) > self.server.max_size:
+            self.line("552 5.3.4 Message size exceeds fixed limit")
+        else:
+            queue_id = self.server.accept(self.sender, self.recipients, data)
+            self.line(f"250 2.0.0 OK queued as {queue_id}")
+        self.reset()
+
+    def do_BDAT(self, args):
+        size, _, last = args.partition(' ')
+        data = self.rfile.read(int(size))  # the chunk is read even if it is refused
+        if len(data) < int(size):
+            raise ConnectionError("client closed the connection")
+        if not self.recipients:
+            self.line("503 5.5.1 Need RCPT before BDAT")
+            return
+        self.chunks += data
+        if len(self.chunks) > self.server.max_size:
+            self.line("552 5.3.4 Message size exceeds fixed limit")
+            self.reset()
+        elif last.strip().upper() == 'LAST':
+            queue_id = self.server.accept(self.sender, self.recipients, bytes(self.chunks))
+            self.line(f"250 2.0.0 OK queued as {queue_id}")
+            self.reset()
+        else:
+            self.line(f"250 2.0.0 {len(data)} octets received")
+
+    def do_RSET(self, args):
+        self.reset()
+        self.line("250 2.0.0 OK")
+
+    def do_NOOP(self, args):
+        self.line("250 2.0.0 OK")
+
+    def do_QUIT(self, args):
+        self.line("221 2.0.0 Bye")
+        return False
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Threaded in-process SMTP submission server.
+
+    Plain TCP with STARTTLS by default; pass implicit_tls=True for an
+    SMTPS-style listener. Accepted messages are kept in .messages (unless
+    keep_messages=False) and, with deliver_to=<IMAPStandIn>, also appear
+    in that server's INBOX. CHUNKING (BDAT) is offered unless chunking=False.
+    refuse maps recipients to the reply RCPT gets for them (e.g.
+    "451 4.3.0 Try again later"). delay works as for IMAPStandIn.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, users=None, ssl_context=None,
+                 implicit_tls=False, deliver_to=None, keep_messages=True,
+                 max_size=50 * 1024 * 1024, delay=0.0, chunking=True):
+        self.users = users or {"user@example.com": "password"}
+        self.chunking = chunking
+        self.delay = delay
+        self.ssl_context = ssl_context or server_ssl_context()
+        self.implicit_tls = implicit_tls
+        self.deliver_to = deliver_to
+        self.keep_messages = keep_messages
+        self.max_size = max_size
+        self.messages = []          # (sender, recipients, data)
+        self.refuse = {}            # recipient -> RCPT reply
+        self.accepted = 0
+        self.bytes_accepted = 0
+        self.sessions = set()
+        self._lock = threading.Lock()
+        super().__init__((host, port), SMTPHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def drop_connections(self):
+        """Abruptly close every open session (simulates a network drop)."""
+        for session in list(self.sessions):
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def accept(self, sender, recipients, data):
+        """Take a message off the wire. Returns its queue id."""
+        with self._lock:
+            self.accepted += 1
+            self.bytes_accepted += len(data)
+            queue_id = self.accepted
+            if self.keep_messages:
+                self.messages.append((sender, list(recipients), data))
+        if self.deliver_to is not None:
+            self.deliver_to.deliver(data)
+        return queue_id
+
+    def start(self):
+        """Serve from a daemon thread. Returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def sample_message(n, sender="alice@example.com", recipient="user@example.com",
+                   body=None, subject=None):
+    """Build a small plain-text RFC822 message for tests and benchmarks."""
+    body = body if body is not None else f"Message body number {n}.\n"
+    return (f"From: {sender}\r\nTo: {recipient}\r\n"
+            f"Subject: {subject or f'Test message {n}'}\r\n"
+            f"Date: {formatdate(localtime=False)}\r\nMessage-ID: <{n}.{time.time()}@example.com>\r\n"
+            f"MIME-Version: 1.0\r\nContent-Type: text/plain; charset=\"utf-8\"\r\n"
+            f"Content-Transfer-Encoding: 7bit\r\n\r\n{body}").encode('utf-8')
+
+
+if __name__ == "__main__":
+    print("\nStarting local IMAP and SMTP stand-ins...")
+    context = server_ssl_context()
+    server = IMAPStandIn(port=1143, ssl_context=context)
+    for n in range(1, 6):
+        server.deliver(sample_message(n))
+    SMTPStandIn(port=1587, ssl_context=context, deliver_to=server, keep_messages=False).start()
+    print("IMAP (STARTTLS) on 127.0.0.1:1143, login user@example.com / password")
+    print("SMTP (STARTTLS) on 127.0.0.1:1587, delivering to the IMAP INBOX")
+    print("Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[*] Server closed.")
@@ -0,0 +1,217 @@
+"""
+Mail Archive Formats
+Streaming mbox (mboxrd) and Maildir readers and writers, plus the checkpoint
+file used to resume an interrupted export or import.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import re
+import json
+import time
+import calendar
+import socket
+import shutil
+import itertools
+import threading
+
+
+MBOX = 'mbox'
+MAILDIR = 'maildir'
+
+# IMAP system flags and their Maildir info letters (kept in ASCII order)
+MAILDIR_FLAGS = {'\\Draft': 'D', '\\Flagged': 'F', '\\Answered': 'R', '\\Seen': 'S', '\\Deleted': 'T'}
+# mbox keeps \Seen in "Status:" and the rest in "X-Status:" (mutt's letters)
+X_STATUS_FLAGS = {'\\Answered': 'A', '\\Flagged': 'F', '\\Draft': 'T', '\\Deleted': 'D'}
+
+FROM_QUOTED = re.compile(rb'^>*From ')
+
+
+def _to_lf(raw):
+    return raw.replace(b'\r\n', b'\n')
+
+
+def _to_crlf(raw):
+    return re.sub(rb'\r?\n', b'\r\n', raw)
+
+
+def archive_format(path):
+    """Maildir for a directory (or a path ending in a slash), mbox otherwise."""
+    return MAILDIR if os.path.isdir(path) or path.endswith(('/', os.sep)) else MBOX
+
+
+# ==================== mbox ====================
+
+def write_mbox_message(out, raw, flags=(), internaldate=None):
+    """Append one message to an open binary file in mboxrd format.
+
+    The message gets a "From " separator line dated internaldate, its flags
+    as Status/X-Status headers, LF line endings, and every line starting
+    with ">*From " quoted with one more '>'.
+    """
+    flags = set(flags)
+    stamp = time.asctime(time.gmtime(internaldate or time.time()))
+    out.write(b"From MAILER-DAEMON " + stamp.encode('ascii') + b"\n")
+    out.write(b"Status: " + (b"RO" if '\\Seen' in flags else b"O") + b"\n")
+    x_status = "".join(letter for flag, letter in X_STATUS_FLAGS.items() if flag in flags)
+    if x_status:
+        out.write(b"X-Status: " + x_status.encode('ascii') + b"\n")
+    for line in _to_lf(raw).splitlines(True):
+        if FROM_QUOTED.match(line):
+            out.write(b">")
+        out.write(line)
+    if not raw.endswith(b"\n"):
+        out.write(b"\n")
+    out.write(b"\n")
+
+
+def read_mbox(path):
+    """Yield (raw, flags, internaldate) for each message of an mbox file.
+
+    The file is read line by line, so only the current message is held in
+    memory. raw has CRLF line endings with mboxrd quoting and the
+    Status/X-Status headers removed (they become flags).
+    """
+    with open(path, 'rb') as f:
+        lines = None
+        stamp = None
+        previous_blank = True
+        for line in f:
+            if previous_blank and line.startswith(b"From "):
+                if lines is not None:
+                    yield _mbox_message(lines, stamp)
+                lines = []
+                stamp = line[5:].split(None, 1)[1:] or [b""]
+                stamp = stamp[0].strip()
+                previous_blank = False
+                continue
+            previous_blank = line in (b"\n", b"\r\n")
+            if lines is not None:
+                lines.append(line[1:] if line.startswith(b">") and FROM_QUOTED.match(line) else line)
+        if lines is not None:
+            yield _mbox_message(lines, stamp)
+
+
+def _mbox_message(lines, stamp):
+    if lines and lines[-1] in (b"\n", b"\r\n"):
+        lines.pop()  # the separator before the next "From "
+    flags = set()
+    body_start = next((i for i, line in enumerate(lines) if line in (b"\n", b"\r\n")), len(lines))
+    headers = []
+    for line in lines[:body_start]:
+        name, _, value = line.partition(b":")
+        if name.lower() == b"status":
+            if b"R" in value:
+                flags.add('\\Seen')
+        elif name.lower() == b"x-status":
+            flags.update(flag for flag, letter in X_STATUS_FLAGS.items() if letter.encode() in value)
+        else:
+            headers.append(line)
+    try:
+        # The separator line is written in UTC
+        internaldate = calendar.timegm(time.strptime(stamp.decode('ascii'), "%a %b %d %H:%M:%S %Y"))
+    except (ValueError, UnicodeDecodeError):
+        internaldate = None
+    return _to_crlf(b"".join(headers + lines[body_start:])), sorted(flags), internaldate
+
+
+# ==================== Maildir ====================
+
+class MaildirWriter:
+    """Writes messages into a Maildir (tmp/, new/, cur/ are created as needed).
+
+    Each message is written under tmp/ and renamed into cur/ with its flags
+    in the ":2," info, as Maildir requires. name makes the file name stable,
+    so writing the same message again (a resumed export) replaces it.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for sub in ('tmp', 'new', 'cur'):
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+        self.host = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, raw, flags=(), internaldate=None, name=None):
+        internaldate = internaldate or time.time()
+        if name is None:
+            with self._lock:
+                name = f"{int(internaldate)}.P{os.getpid()}Q{next(self._counter)}"
+        base = f"{name}.{self.host}"
+        info = "".join(sorted(letter for flag, letter in MAILDIR_FLAGS.items() if flag in flags))
+        temp = os.path.join(self.path, 'tmp', base)
+        with open(temp, 'wb') as f:
+            f.write(_to_lf(raw))
+        os.utime(temp, (internaldate, internaldate))
+        os.replace(temp, os.path.join(self.path, 'cur', f"{base}:2,{info}"))
+
+
+def read_maildir(path):
+    """Yield (raw, flags, internaldate) for each message in new/ and cur/.
+
+    Files are listed with scandir and read one at a time; the file's
+    modification time stands in for the internal date.
+    """
+    letters = {letter: flag for flag, letter in MAILDIR_FLAGS.items()}
+    for sub in ('new', 'cur'):
+        directory = os.path.join(path, sub)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                info = entry.name.rpartition(':2,')[2] if ':2,' in entry.name else ''
+                with open(entry.path, 'rb') as f:
+                    raw = f.read()
+                yield (_to_crlf(raw), sorted(letters[c] for c in info if c in letters),
+                       entry.stat().st_mtime)
+
+
+def read_archive(path):
+    """read_mbox or read_maildir, depending on what path is."""
+    return read_maildir(path) if os.path.isdir(path) else read_mbox(path)
+
+
+def append_file(target, source):
+    """Append the contents of one file to an open binary file, in blocks."""
+    with open(source, 'rb') as f:
+        shutil.copyfileobj(f, target, 1024 * 1024)
+
+
+# ==================== Checkpoints ====================
+
+class Checkpoint:
+    """Small JSON state file, replaced atomically on every save.
+
+    load() returns the saved state only if every key in `expect` matches
+    (e.g. the same mailbox and UIDVALIDITY), so a checkpoint from another
+    run is ignored instead of resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, **expect):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if any(state.get(key) != value for key, value in expect.items()):
+            return None
+        return state
+
+    def save(self, state):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,308 @@
+"""
+Local Mail Cache
+An on-disk SQLite cache of fetched messages, keyed by UIDVALIDITY/UID,
+with a local full-text index (FTS5) for searching without the network.
+Course: Computer Networks - Fall 2025
+"""
+
+import re
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mailboxes (
+    account       TEXT NOT NULL,
+    mailbox       TEXT NOT NULL,
+    uidvalidity   INTEGER NOT NULL,
+    last_uid      INTEGER NOT NULL DEFAULT 0,
+    highestmodseq INTEGER,
+    PRIMARY KEY (account, mailbox)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    account     TEXT NOT NULL,
+    mailbox     TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uid         INTEGER NOT NULL,
+    sender      TEXT,
+    subject     TEXT,
+    date        TEXT,
+    body        TEXT,
+    size        INTEGER,
+    PRIMARY KEY (account, mailbox, uidvalidity, uid)
+);
+CREATE INDEX IF NOT EXISTS messages_by_uid ON messages (account, mailbox, uid);
+CREATE INDEX IF NOT EXISTS messages_by_sender ON messages (account, mailbox, sender COLLATE NOCASE, uid);
+CREATE INDEX IF NOT EXISTS messages_by_subject ON messages (account, mailbox, subject COLLATE NOCASE, uid);
+CREATE INDEX IF NOT EXISTS messages_by_size ON messages (account, mailbox, size, uid);
+"""
+
+# External-content FTS5 index over messages, kept in step by triggers.
+# INSERT OR REPLACE only fires the delete trigger with recursive_triggers on.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    sender, subject, date, body,
+    content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, sender, subject, date, body)
+    VALUES (new.rowid, new.sender, new.subject, new.date, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, date, body)
+    VALUES ('delete', old.rowid, old.sender, old.subject, old.date, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, date, body)
+    VALUES ('delete', old.rowid, old.sender, old.subject, old.date, old.body);
+    INSERT INTO messages_fts (rowid, sender, subject, date, body)
+    VALUES (new.rowid, new.sender, new.subject, new.date, new.body);
+END;
+"""
+
+# Field prefixes accepted by search(), mapped to index columns
+SEARCH_FIELDS = {"from": "sender", "subject": "subject", "date": "date", "body": "body"}
+
+# Sort keys accepted by window(), each backed by one of the indexes above.
+# Date headers are free text, so "date" sorts by UID (arrival order).
+SORT_COLUMNS = {"uid": "uid", "date": "uid", "from": "sender COLLATE NOCASE",
+                "subject": "subject COLLATE NOCASE", "size": "size"}
+
+
+def account_key(email_addr, server, port):
+    """Cache key for one login on one server."""
+    return f"{email_addr}@{server}:{port}"
+
+
+class MailCache:
+    """SQLite-backed message cache shared by all IMAP operations.
+
+    One connection is shared between threads and guarded by a lock, so the
+    same cache can be used from the GUI worker threads. Every stored message
+    is also added to a full-text index (see search()); if this SQLite build
+    has no FTS5, search() falls back to a LIKE scan.
+    """
+
+    def __init__(self, path="mail_cache.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.executescript(SCHEMA)
+            self.fts = self._create_index()
+
+    def _create_index(self):
+        """Create the FTS5 index (backfilling it for an older cache). Returns False without FTS5."""
+        exists = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        try:
+            self._db.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError:
+            return False  # SQLite built without FTS5
+        self._db.execute("PRAGMA recursive_triggers = ON")
+        if not exists:
+            with self._db:
+                self._db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ---------- Sync state ----------
+
+    def get_state(self, account, mailbox):
+        """Return (uidvalidity, last_uid, highestmodseq) or None if never synced."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uidvalidity, last_uid, highestmodseq FROM mailboxes "
+                "WHERE account = ? AND mailbox = ?", (account, mailbox)).fetchone()
+        return tuple(row) if row else None
+
+    def set_state(self, account, mailbox, uidvalidity, last_uid, highestmodseq=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO mailboxes "
+                "(account, mailbox, uidvalidity, last_uid, highestmodseq) VALUES (?, ?, ?, ?, ?)",
+                (account, mailbox, uidvalidity, last_uid, highestmodseq))
+
+    def reset_mailbox(self, account, mailbox):
+        """Forget everything cached for a mailbox (UIDVALIDITY changed)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM messages WHERE account = ? AND mailbox = ?",
+                             (account, mailbox))
+            self._db.execute("DELETE FROM mailboxes WHERE account = ? AND mailbox = ?",
+                             (account, mailbox))
+
+    # ---------- Messages ----------
+
+    def store(self, account, mailbox, uidvalidity, uid, email_data, size=None):
+        """Store one parsed message ({from, subject, date, body})."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages "
+                "(account, mailbox, uidvalidity, uid, sender, subject, date, body, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, mailbox, uidvalidity, uid, email_data.get('from'),
+                 email_data.get('subject'), email_data.get('date'),
+                 email_data.get('body'), size))
+
+    def prune(self, account, mailbox, uidvalidity, keep_uids):
+        """Drop cached messages whose UID is no longer on the server."""
+        keep = set(keep_uids)
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT uid FROM messages WHERE account = ? AND mailbox = ? AND uidvalidity = ?",
+                (account, mailbox, uidvalidity)).fetchall()
+            gone = [(account, mailbox, uidvalidity, r[0]) for r in rows if r[0] not in keep]
+            self._db.executemany(
+                "DELETE FROM messages WHERE account = ? AND mailbox = ? "
+                "AND uidvalidity = ? AND uid = ?", gone)
+        return len(gone)
+
+    def count(self, account, mailbox):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM messages WHERE account = ? AND mailbox = ?",
+                (account, mailbox)).fetchone()[0]
+
+    def latest(self, account, mailbox, limit=1):
+        """Return the newest cached messages as email_data dicts, newest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid, sender, subject, date, body, size FROM messages "
+                "WHERE account = ? AND mailbox = ? ORDER BY uid DESC LIMIT ?",
+                (account, mailbox, limit)).fetchall()
+        return [self._to_email_data(r) for r in rows]
+
+    # ---------- Search ----------
+
+    def search(self, query, account=None, mailbox=None, limit=20):
+        """Search cached mail without touching the network.
+
+        Words are matched in from/subject/date/body (the last word also as a
+        prefix, for search-as-you-type); "from:alice" or "subject:report"
+        restricts a word to one field. Results are email_data dicts, best
+        match first, with a 'snippet' and the 'mailbox' they were found in.
+        """
+        terms = _parse_query(query)
+        if not terms:
+            return []
+        where, params = [], []
+        if account is not None:
+            where.append("m.account = ?")
+            params.append(account)
+        if mailbox is not None:
+            where.append("m.mailbox = ?")
+            params.append(mailbox)
+
+        with self._lock:
+            if self.fts:
+                sql = ("SELECT m.uid, m.mailbox, m.sender, m.subject, m.date, m.body, m.size, "
+                       "snippet(messages_fts, 3, '[', ']', '...', 12) AS snippet "
+                       "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                       "WHERE messages_fts MATCH ? " + "".join(" AND " + w for w in where) +
+                       " ORDER BY rank LIMIT ?")
+                rows = self._db.execute(sql, [_fts_query(terms)] + params + [limit]).fetchall()
+            else:
+                conditions, like_params = _like_conditions(terms, "m.")
+                where += conditions
+                params += like_params
+                sql = ("SELECT m.uid, m.mailbox, m.sender, m.subject, m.date, m.body, m.size, "
+                       "substr(m.body, 1, 80) AS snippet FROM messages m" +
+                       (" WHERE " + " AND ".join(where) if where else "") +
+                       " ORDER BY m.uid DESC LIMIT ?")
+                rows = self._db.execute(sql, params + [limit]).fetchall()
+        return [dict(self._to_email_data(r), mailbox=r["mailbox"], snippet=r["snippet"])
+                for r in rows]
+
+    # ---------- List view ----------
+
+    def _view_filter(self, account, mailbox, query):
+        """WHERE clause and parameters for one mailbox, optionally filtered by a search query."""
+        where, params = ["account = ?", "mailbox = ?"], [account, mailbox]
+        terms = _parse_query(query)
+        if terms and self.fts:
+            where.append("rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append(_fts_query(terms))
+        elif terms:
+            conditions, like_params = _like_conditions(terms)
+            where += conditions
+            params += like_params
+        return " AND ".join(where), params
+
+    def count_view(self, account, mailbox, query=None):
+        """Number of rows window() can return for this mailbox and filter."""
+        where, params = self._view_filter(account, mailbox, query)
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages WHERE " + where,
+                                    params).fetchone()[0]
+
+    def window(self, account, mailbox, offset, limit, order="uid", descending=True, query=None):
+        """Rows offset..offset+limit of a sorted (and optionally filtered) mailbox.
+
+        Only the list columns are read (no body), and the sort uses an index,
+        so a window costs the same whatever the mailbox size. Rows are
+        email_data dicts with body None; use get() for the whole message.
+        """
+        where, params = self._view_filter(account, mailbox, query)
+        direction = "DESC" if descending else "ASC"
+        order_by = f"uid {direction}"
+        if SORT_COLUMNS[order] != "uid":
+            order_by = f"{SORT_COLUMNS[order]} {direction}, " + order_by
+        # The offset is skipped inside the index (inner query reads only the
+        # index); table rows are read for the window alone
+        sql = ("SELECT uid, sender, subject, date, NULL AS body, size FROM messages "
+               "WHERE rowid IN (SELECT rowid FROM messages WHERE " + where +
+               f" ORDER BY {order_by} LIMIT ? OFFSET ?) ORDER BY {order_by}")
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit, offset]).fetchall()
+        return [self._to_email_data(r) for r in rows]
+
+    def get(self, account, mailbox, uid):
+        """One cached message as email_data (with body), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uid, sender, subject, date, body, size FROM messages "
+                "WHERE account = ? AND mailbox = ? AND uid = ?",
+                (account, mailbox, uid)).fetchone()
+        return self._to_email_data(row) if row else None
+
+    @staticmethod
+    def _to_email_data(row):
+        return {"uid": row["uid"], "from": row["sender"], "subject": row["subject"],
+                "date": row["date"], "body": row["body"], "size": row["size"]}
+
+
+def _parse_query(query):
+    """Split a search string into (column or None, word, prefix) terms."""
+    terms = []
+    words = re.findall(r'(\w+:)?("[^"]*"|\S+)', query or "")
+    for i, (field, word) in enumerate(words):
+        column = SEARCH_FIELDS.get(field[:-1].lower()) if field else None
+        if field and column is None:
+            word = field + word  # "re:" etc. is part of the word, not a field
+        word = word.strip('"')
+        if word:
+            terms.append((column, word, i == len(words) - 1))
+    return terms
+
+
+def _like_conditions(terms, alias=""):
+    """LIKE conditions (one per term) for SQLite builds without FTS5."""
+    conditions, params = [], []
+    for column, word, _ in terms:
+        columns = [column] if column else list(SEARCH_FIELDS.values())
+        conditions.append("(" + " OR ".join(f"{alias}{c} LIKE ?" for c in columns) + ")")
+        params += [f"%{word}%"] * len(columns)
+    return conditions, params
+
+
+def _fts_query(terms):
+    """Build an FTS5 MATCH expression with every word quoted (no query syntax errors)."""
+    parts = []
+    for column, word, prefix in terms:
+        phrase = '"' + word.replace('"', '""') + '"' + ("*" if prefix else "")
+        parts.append(f"{column} : {phrase}" if column else phrase)
+    return " AND ".join(parts)
@@ -0,0 +1,212 @@
+"""
+Metrics Registry
+Records every SMTP/IMAP/TCP operation into histograms and serves them in the
+Prometheus text format over HTTP.
+Course: Computer Networks - Fall 2025
+"""
+
+import bisect
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Bucket upper bounds (Prometheus "le"); +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+THROUGHPUT_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+PREFIX = "email_client"
+PERCENTILES = (50, 95, 99)
+
+
+# ==================== Histograms ====================
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Histogram:
+    """Cumulative-bucket histogram plus a window of recent samples.
+
+    The buckets, sum and count cover every observation since the start and
+    are what /metrics exports. Percentiles are exact over the last `window`
+    observations, so they follow the current behaviour rather than the
+    whole history.
+    """
+
+    def __init__(self, buckets, window=1000):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, pct):
+        return percentile(list(self.recent), pct)
+
+    def cumulative(self):
+        """(le, count) pairs in Prometheus order, ending with +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class OperationSeries:
+    """Everything recorded for one (operation, server) pair."""
+
+    def __init__(self, window=1000):
+        self.ok = 0
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS, window)
+        self.bytes = Histogram(BYTES_BUCKETS, window)
+        self.throughput = Histogram(THROUGHPUT_BUCKETS, window)
+
+
+# ==================== Registry ====================
+
+class MetricsRegistry:
+    """Thread-safe collection of operation metrics keyed by (operation, server).
+
+    observe() takes the metrics tuples the client already returns
+    (success, time, bytes, packets_sent, packets_recv, ...). Latency, bytes
+    and throughput histograms only count successful operations; failures
+    are counted per server.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, operation, server, metrics):
+        success, seconds, wire_bytes = metrics[0], metrics[1], metrics[2]
+        with self._lock:
+            series = self._series.get((operation, server))
+            if series is None:
+                series = self._series[(operation, server)] = OperationSeries(self.window)
+            if not success:
+                series.errors += 1
+                return
+            series.ok += 1
+            series.latency.observe(seconds)
+            series.bytes.observe(wire_bytes)
+            if seconds > 0 and wire_bytes:
+                series.throughput.observe(wire_bytes / seconds)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def summary(self):
+        """One dict per (operation, server), sorted, with p50/p95/p99 of each histogram."""
+        rows = []
+        with self._lock:
+            for (operation, server), series in sorted(self._series.items()):
+                row = {"operation": operation, "server": server,
+                       "ok": series.ok, "errors": series.errors,
+                       "bytes_total": series.bytes.sum}
+                for name in ("latency", "bytes", "throughput"):
+                    histogram = getattr(series, name)
+                    for pct in PERCENTILES:
+                        row[f"{name}_p{pct}"] = histogram.percentile(pct)
+                rows.append(row)
+        return rows
+
+    def render(self):
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+        lines = [f"# HELP {PREFIX}_operations_total Operations by outcome.",
+                 f"# TYPE {PREFIX}_operations_total counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for (operation, server), s in series:
+                labels = _labels(operation=operation, server=server)
+                lines.append(f'{PREFIX}_operations_total{{{labels},result="ok"}} {s.ok}')
+                lines.append(f'{PREFIX}_operations_total{{{labels},result="error"}} {s.errors}')
+            for name, attribute, help_text in (
+                    ("operation_duration_seconds", "latency", "Time taken by successful operations."),
+                    ("operation_bytes", "bytes", "Wire bytes moved by successful operations."),
+                    ("operation_throughput_bytes_per_second", "throughput",
+                     "Wire throughput of successful operations.")):
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (operation, server), s in series:
+                    histogram = getattr(s, attribute)
+                    labels = _labels(operation=operation, server=server)
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{metric}_bucket{{{labels},le="{_number(bound)}"}} {count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {_number(histogram.sum)}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    """Label pairs with backslash, quote and newline escaped."""
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+default_registry = MetricsRegistry()
+
+
+# ==================== HTTP Exporter ====================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the console
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves GET /metrics from a daemon thread. port=0 picks a free port."""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=9464, registry=None):
+        self.registry = registry or default_registry
+        super().__init__((host, port), _MetricsHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve from a daemon thread. Returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,124 @@
+"""
+Streaming MIME
+Builds outgoing messages lazily: headers and text up front, attachments
+base64-encoded from disk a block at a time while the message is sent.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import base64
+import mimetypes
+from email import policy
+from email.message import EmailMessage
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from wire_metrics import local_hostname
+
+
+# base64 lines carry 57 input bytes (76 characters); reading whole lines
+# keeps every block boundary on a line boundary
+LINE_BYTES = 57
+BLOCK_BYTES = LINE_BYTES * 1149  # ~64 KB of file per block
+
+
+def _headers(message):
+    """Serialize just the header block (ending in the blank line) of a message."""
+    return message.as_bytes(policy=policy.SMTP).split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+
+
+def _base64_size(size):
+    """Length of base64-with-CRLF-lines output for `size` input bytes."""
+    full, rest = divmod(size, LINE_BYTES)
+    return full * 78 + (4 * -(-rest // 3) + 2 if rest else 0)
+
+
+class MessageStream:
+    """An outgoing multipart/mixed message that is generated, not stored.
+
+    Iterating yields the message as CRLF-terminated bytes chunks; each
+    attachment is read and encoded one block at a time, so memory use does
+    not depend on attachment size. The stream can be iterated more than once
+    (e.g. to retry a send). size is exact and known up front, and
+    bytes_generated counts what the last iteration produced.
+    """
+
+    def __init__(self, sender, recipient, subject, body, attachments=()):
+        self.attachments = [os.fspath(path) for path in attachments or ()]
+        self.boundary = "==" + make_msgid(domain=local_hostname()).strip("<>").replace("@", ".") + "=="
+        self.bytes_generated = 0
+
+        top = EmailMessage(policy=policy.SMTP)
+        top['From'] = sender
+        top['To'] = recipient
+        top['Subject'] = subject
+        top['Date'] = formatdate(localtime=True)
+        top['Message-ID'] = make_msgid(domain=local_hostname())
+        top['MIME-Version'] = '1.0'
+        top['Content-Type'] = f'multipart/mixed; boundary="{self.boundary}"'
+        self._head = _headers(top)
+
+        text = MIMEText(body, 'plain')
+        del text['MIME-Version']
+        self._text = text.as_bytes(policy=policy.SMTP)
+
+        self._parts = []  # (header bytes, path, file size)
+        for path in self.attachments:
+            ctype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            part = EmailMessage(policy=policy.SMTP)
+            part['Content-Type'] = ctype
+            part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(path))
+            part['Content-Transfer-Encoding'] = 'base64'
+            self._parts.append((_headers(part), path, os.path.getsize(path)))
+
+    @property
+    def size(self):
+        """Exact length of the generated message in bytes."""
+        boundary = len(self.boundary)
+        size = len(self._head) + boundary + 4 + len(self._text)  # "--boundary\r\n"
+        for headers, _, file_size in self._parts:
+            size += boundary + 6 + len(headers) + _base64_size(file_size)  # "\r\n--boundary\r\n"
+        return size + boundary + 8  # "\r\n--boundary--\r\n"
+
+    def __iter__(self):
+        self.bytes_generated = 0
+        for chunk in self._generate():
+            self.bytes_generated += len(chunk)
+            yield chunk
+
+    def _generate(self):
+        boundary = b"--" + self.boundary.encode()
+        yield self._head + boundary + b"\r\n" + self._text
+        for headers, path, _ in self._parts:
+            yield b"\r\n" + boundary + b"\r\n" + headers
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(BLOCK_BYTES)
+                    if not block:
+                        break
+                    yield base64.encodebytes(block).replace(b"\n", b"\r\n")
+        yield b"\r\n" + boundary + b"--\r\n"
+
+
+def dot_stuff(chunks):
+    """Apply SMTP DATA dot-stuffing to a stream of chunks, across chunk borders."""
+    at_line_start = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        stuffed = chunk.replace(b"\n.", b"\n..")
+        if at_line_start and chunk.startswith(b"."):
+            stuffed = b"." + stuffed
+        at_line_start = chunk.endswith(b"\n")
+        yield stuffed
+
+
+def rechunk(chunks, size):
+    """Regroup a stream of chunks into pieces of about `size` bytes (for BDAT)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
@@ -1,14 +1,415 @@
 """
 TCP Notification Server
-A simple TCP server that receives notifications from the email client.
+An asyncio TCP server that receives notifications from the email client and
+fans them out to subscribed connections.
 Course: Computer Networks - Fall 2025
 """
 
+import re
+import time
+import asyncio
+import argparse
+import fnmatch
+import signal
 import socket
+import struct
+import threading
+from collections import deque
 
 
-def start_server(host='127.0.0.1', port=9999):
+# Every notification is framed as a 4-byte big-endian length followed by
+# that many bytes of UTF-8 text. A connection may carry many frames.
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+# A frame "SUBSCRIBE <pattern> ..." makes the connection a subscriber: the
+# server answers "SUBSCRIBED <patterns>" and then pushes every notification
+# whose topic matches one of the (fnmatch) patterns as "<topic> <message>".
+# "PUBLISH <topic> <message>" publishes under an explicit topic; any other
+# frame is a notification whose topic is its text in lower case with dots
+# for spaces ("Email Sent" -> "email.sent").
+SUBSCRIBE = 'SUBSCRIBE'
+PUBLISH = 'PUBLISH'
+SUBSCRIBER_QUEUE = 1000         # notifications a subscriber may fall behind by
+DROP_OLDEST = 'drop-oldest'     # full queue: discard its oldest notification
+DISCONNECT = 'disconnect'       # full queue: close the subscriber
+SUBSCRIBER_SNDBUF = 64 * 1024   # kernel send buffer per subscriber, so the queue is what grows
+
+
+def encode_frame(message):
+    """Frame a notification (str or bytes) for the wire."""
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    return HEADER.pack(len(message)) + message
+
+
+async def read_header(reader):
+    """Read a frame header. Returns the payload length, or None on a clean EOF."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("connection closed inside a frame header")
+        return None
+    return HEADER.unpack(header)[0]
+
+
+async def read_frame(reader, max_size=MAX_MESSAGE_SIZE):
+    """Read one frame. Returns the payload bytes, or None on a clean EOF."""
+    length = await read_header(reader)
+    if length is None:
+        return None
+    if length > max_size:
+        raise ValueError(f"frame of {length} bytes exceeds limit of {max_size}")
+    return await reader.readexactly(length)
+
+
+def parse_notification(message):
+    """Split a published frame into (topic, message)."""
+    if message.startswith(PUBLISH + ' '):
+        parts = message.split(' ', 2)
+        if len(parts) == 3 and parts[1]:
+            return parts[1], parts[2]
+    topic = re.sub(r'\s+', '.', message.strip().lower()) or 'notification'
+    return topic, message
+
+
+class Subscriber:
+    """One subscribed connection: topic patterns, a bounded queue and a writer task.
+
+    Publishing only appends to the queue, so a slow reader never blocks the
+    publisher; the writer task drains the queue into the socket at whatever
+    pace the reader allows. When the queue is full the policy either drops
+    its oldest notification or disconnects the subscriber.
+    """
+
+    def __init__(self, writer, patterns, max_queue=SUBSCRIBER_QUEUE, policy=DROP_OLDEST):
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.patterns = list(patterns)
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()            # (time queued, frame)
+        self.delivered = 0
+        self.dropped = 0
+        self.lag = 0.0                  # queueing delay of the last frame written
+        self.max_lag = 0.0
+        self.closed = False
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Left to autotune, the kernel would buffer megabytes for a slow
+            # reader and the queue policy would never apply
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SUBSCRIBER_SNDBUF)
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._pump())
+
+    def matches(self, topic):
+        return any(fnmatch.fnmatchcase(topic, pattern) for pattern in self.patterns)
+
+    def offer(self, frame):
+        """Queue a frame. Returns False if the subscriber had to be disconnected."""
+        if len(self.queue) >= self.max_queue:
+            if self.policy == DISCONNECT:
+                self.close(abort=True)
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append((time.monotonic(), frame))
+        self._ready.set()
+        return True
+
+    def close(self, abort=False):
+        if self.closed:
+            return
+        self.closed = True
+        self._task.cancel()
+        if abort:
+            self.writer.transport.abort()  # also ends the connection's reader
+
+    def stats(self):
+        return {"address": self.address, "patterns": self.patterns, "queued": len(self.queue),
+                "delivered": self.delivered, "dropped": self.dropped,
+                "lag_ms": self.lag * 1000, "max_lag_ms": self.max_lag * 1000}
+
+    async def _pump(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.queue:
+                    now = time.monotonic()
+                    self.lag = now - self.queue[0][0]
+                    self.max_lag = max(self.max_lag, self.lag)
+                    frames = [self.queue.popleft()[1] for _ in range(min(256, len(self.queue)))]
+                    self.writer.write(b"".join(frames))
+                    self.delivered += len(frames)
+                    await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.closed = True
+
+
+class NotificationServer:
+    """asyncio notification server.
+
+    Each connection is served by its own coroutine, so thousands of clients
+    can be connected at once. Every notification is also fanned out to the
+    matching subscribers (queue_size and slow_policy apply to each one).
+    stop() may be called from any thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9999, backlog=1024,
+                 max_message_size=MAX_MESSAGE_SIZE, verbose=True, on_message=None,
+                 queue_size=SUBSCRIBER_QUEUE, slow_policy=DROP_OLDEST):
+        if slow_policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"unknown slow_policy {slow_policy!r}")
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_message_size = max_message_size
+        self.verbose = verbose
+        self.on_message = on_message
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+        self.connections = 0
+        self.messages = 0
+        self.fanned_out = 0     # frames queued for subscribers
+        self.disconnected = 0   # subscribers closed for falling behind
+        self.subscribers = set()
+        self._server = None
+        self._loop = None
+        self._stopping = None
+        self._clients = set()
+        self._idle = set()      # clients waiting for their next frame
+
+    async def start(self):
+        """Bind and start accepting connections."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port,
+            backlog=self.backlog, reuse_address=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve(self, shutdown_timeout=5):
+        """Serve until stop() is called, then close every connection."""
+        if self._server is None:
+            await self.start()
+        await self._stopping.wait()
+
+        self._server.close()
+        # Idle clients are closed now; in-flight messages get a grace period.
+        # This has to happen before wait_closed(), which on Python 3.12.1+
+        # waits for every connection to close.
+        for task in list(self._idle):
+            task.cancel()
+        if self._clients:
+            await asyncio.wait(list(self._clients), timeout=shutdown_timeout)
+        for task in list(self._clients):
+            task.cancel()
+        if self._clients:
+            await asyncio.wait(list(self._clients))
+        await self._server.wait_closed()
+
+    def stop(self):
+        """Request shutdown (thread-safe)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def publish(self, topic, message):
+        """Queue a notification for every subscriber whose patterns match its topic.
+
+        Must run on the server's event loop. Returns the number of subscribers
+        it was queued for.
+        """
+        frame = None
+        count = 0
+        for subscriber in list(self.subscribers):
+            if subscriber.closed or not subscriber.matches(topic):
+                continue
+            frame = frame or encode_frame(f"{topic} {message}")
+            if subscriber.offer(frame):
+                count += 1
+            else:
+                self.subscribers.discard(subscriber)
+                self.disconnected += 1
+                if self.verbose:
+                    print(f"[!] Subscriber {subscriber.address} too slow, disconnected")
+        self.fanned_out += count
+        return count
+
+    def stats(self):
+        """Server counters plus one stats() dict per subscriber."""
+        return {"connections": self.connections, "messages": self.messages,
+                "fanned_out": self.fanned_out, "disconnected": self.disconnected,
+                "subscribers": [s.stats() for s in list(self.subscribers)]}
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        self.connections += 1
+        address = writer.get_extra_info('peername')
+        subscriber = None
+        if self.verbose:
+            print(f"[+] Connection from {address}")
+
+        try:
+            while not self._stopping.is_set():
+                self._idle.add(task)
+                try:
+                    length = await read_header(reader)
+                finally:
+                    self._idle.discard(task)
+                if length is None:
+                    break
+                if length > self.max_message_size:
+                    raise ValueError(f"frame of {length} bytes exceeds limit of {self.max_message_size}")
+                payload = await reader.readexactly(length)
+                message = payload.decode('utf-8', errors='replace')
+                words = message.split()
+                if words and words[0] == SUBSCRIBE:
+                    patterns = words[1:] or ['*']
+                    if subscriber is None:
+                        subscriber = Subscriber(writer, patterns, self.queue_size, self.slow_policy)
+                        self.subscribers.add(subscriber)
+                    else:
+                        subscriber.patterns.extend(patterns)
+                    subscriber.offer(encode_frame(f"SUBSCRIBED {' '.join(subscriber.patterns)}"))
+                    if self.verbose:
+                        print(f"[+] {address} subscribed to {' '.join(patterns)}")
+                    continue
+                self.messages += 1
+                topic, message = parse_notification(message)
+                if self.on_message:
+                    self.on_message(message)
+                if self.verbose:
+                    print(f"[NOTIFICATION] {message}")
+                    print("-"*30)
+                self.publish(topic, message)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            if self.verbose:
+                print(f"[!] Error from {address}: {e}")
+        except asyncio.CancelledError:
+            pass  # closed by serve() during shutdown
+        finally:
+            self._clients.discard(task)
+            if subscriber is not None:
+                subscriber.close()
+                self.subscribers.discard(subscriber)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+async def subscribe(host='127.0.0.1', port=9999, patterns=('*',), timeout=10, rcvbuf=None):
+    """Connect as a subscriber. Returns (reader, writer) once the server confirmed.
+
+    rcvbuf sets SO_RCVBUF before connecting (a small one makes a slow reader
+    push back on the server sooner).
+    """
+    sock = None
+    if rcvbuf:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.setblocking(False)
+        await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (host, port)), timeout)
+    connect = asyncio.open_connection(sock=sock) if sock else asyncio.open_connection(host, port)
+    reader, writer = await asyncio.wait_for(connect, timeout)
+    writer.write(encode_frame(' '.join([SUBSCRIBE] + list(patterns))))
+    reply = await asyncio.wait_for(read_frame(reader), timeout)
+    if not reply or not reply.startswith(b'SUBSCRIBED'):
+        writer.close()
+        raise ConnectionError(f"subscription refused: {reply!r}")
+    return reader, writer
+
+
+async def read_notification(reader):
+    """Next pushed notification as (topic, message), or None when the server closed."""
+    payload = await read_frame(reader)
+    if payload is None:
+        return None
+    topic, _, message = payload.decode('utf-8', errors='replace').partition(' ')
+    return topic, message
+
+
+def watch(host='127.0.0.1', port=9999, patterns=('*',)):
+    """Print the notifications matching patterns until Ctrl+C."""
+    async def main():
+        reader, writer = await subscribe(host, port, patterns)
+        print(f"Subscribed to {' '.join(patterns)} on {host}:{port}. Press Ctrl+C to stop.")
+        try:
+            while True:
+                notification = await read_notification(reader)
+                if notification is None:
+                    print("[*] Server closed the connection.")
+                    break
+                print(f"[{notification[0]}] {notification[1]}")
+        finally:
+            writer.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    except (OSError, asyncio.TimeoutError) as e:
+        print(f"[!] Cannot subscribe: {e}")
+
+
+def run_in_thread(host='127.0.0.1', port=0, **kwargs):
+    """Run a NotificationServer on a background event loop. Returns the server once bound."""
+    server = NotificationServer(host, port, **kwargs)
+    ready = threading.Event()
+
+    async def main():
+        await server.start()
+        ready.set()
+        await server.serve()
+
+    threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+    ready.wait()
+    return server
+
+
+def start_server(host='127.0.0.1', port=9999, backlog=1024, verbose=True,
+                 queue_size=SUBSCRIBER_QUEUE, slow_policy=DROP_OLDEST):
     """Start the TCP notification server."""
+    server = NotificationServer(host, port, backlog=backlog, verbose=verbose,
+                                queue_size=queue_size, slow_policy=slow_policy)
+
+    async def main():
+        await server.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, server.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C arrives as KeyboardInterrupt
+
+        print("="*40)
+        print("TCP NOTIFICATION SERVER")
+        print("="*40)
+        print(f"Listening on {host}:{server.port} (backlog {backlog})")
+        print(f"Subscribers: queue {queue_size}, slow policy {slow_policy}")
+        print("Press Ctrl+C to stop.")
+        print("="*40 + "\n")
+        await server.serve()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"[!] Server error: {e}")
+    finally:
+        print("\n[*] Shutting down...")
+        print(f"[*] Server closed. {server.connections} connection(s), {server.messages} message(s).")
+        print(f"[*] {server.fanned_out} notification(s) fanned out, "
+              f"{server.disconnected} slow subscriber(s) disconnected.")
+
+
+def start_blocking_server(host='127.0.0.1', port=9999, backlog=5, verbose=True):
+    """Original one-client-at-a-time server, kept as a load-test baseline."""
     # Create TCP socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -16,24 +417,21 @@ def start_server(host='127.0.0.1', port=9999):
     try:
         # Bind and listen
         server_socket.bind((host, port))
-        server_socket.listen(5)
+        server_socket.listen(backlog)
 
-        print("="*40)
-        print("TCP NOTIFICATION SERVER")
-        print("="*40)
-        print(f"Listening on {host}:{port}")
-        print("Press Ctrl+C to stop.")
-        print("="*40 + "\n")
+        if verbose:
+            print(f"Blocking server listening on {host}:{port}")
 
         while True:
             # Accept connection
             client_socket, address = server_socket.accept()
-            print(f"[+] Connection from {address}")
+            if verbose:
+                print(f"[+] Connection from {address}")
 
             try:
-                # Receive message
-                message = client_socket.recv(1024).decode('utf-8')
-                if message:
+                # Receive message (single recv, frame header skipped)
+                message = client_socket.recv(1024)[HEADER.size:].decode('utf-8', errors='replace')
+                if message and verbose:
                     print(f"[NOTIFICATION] {message}")
                     print("-"*30)
             except Exception as e:
@@ -51,5 +449,28 @@ def start_server(host='127.0.0.1', port=9999):
 
 
 if __name__ == "__main__":
-    print("\nStarting Notification Server...")
-    start_server()
+    parser = argparse.ArgumentParser(description="TCP notification server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--backlog", type=int, help="listen() backlog (default 1024, blocking: 5)")
+    parser.add_argument("--blocking", action="store_true",
+                        help="run the original one-client-at-a-time server")
+    parser.add_argument("--quiet", action="store_true", help="do not print each notification")
+    parser.add_argument("--queue-size", type=int, default=SUBSCRIBER_QUEUE,
+                        help="notifications a subscriber may fall behind by")
+    parser.add_argument("--slow-policy", choices=(DROP_OLDEST, DISCONNECT), default=DROP_OLDEST,
+                        help="what to do with a subscriber whose queue is full")
+    parser.add_argument("--subscribe", nargs="*", metavar="PATTERN",
+                        help="connect to a running server and print the matching notifications "
+                             "(topic patterns like 'email.*'; default all)")
+    args = parser.parse_args()
+
+    if args.subscribe is not None:
+        watch(args.host, args.port, args.subscribe or ['*'])
+    elif args.blocking:
+        print("\nStarting Notification Server...")
+        start_blocking_server(args.host, args.port, args.backlog or 5, verbose=not args.quiet)
+    else:
+        print("\nStarting Notification Server...")
+        start_server(args.host, args.port, args.backlog or 1024, verbose=not args.quiet,
+                     queue_size=args.queue_size, slow_policy=args.slow_policy)
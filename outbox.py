@@ -0,0 +1,176 @@
+"""
+Outbound Spool
+A durable SQLite queue of messages waiting to be sent, with retry state.
+Course: Computer Networks - Fall 2025
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender       TEXT NOT NULL,
+    recipient    TEXT NOT NULL,
+    subject      TEXT,
+    body         TEXT,
+    smtp_server  TEXT NOT NULL,
+    smtp_port    INTEGER NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'queued',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error   TEXT,
+    created      REAL NOT NULL,
+    attachments  TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+# Message states: queued -> sending -> (deleted once sent) | queued (retry) | dead
+QUEUED = 'queued'
+SENDING = 'sending'
+DEAD = 'dead'
+
+
+class Outbox:
+    """SQLite-backed outbound queue.
+
+    Messages survive restarts: anything left in 'sending' by a crash is put
+    back in the queue when the outbox is opened. Passwords are never stored;
+    the sending worker keeps credentials in memory only. Sent messages are
+    removed; messages that failed permanently stay as dead letters until
+    requeued.
+    """
+
+    def __init__(self, path="outbox.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+            if 'attachments' not in columns:  # outbox.db from before attachments
+                self._db.execute("ALTER TABLE outbox ADD COLUMN attachments TEXT")
+            self._db.execute("UPDATE outbox SET status = ? WHERE status = ?", (QUEUED, SENDING))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def enqueue(self, sender, recipient, subject, body, smtp_server, smtp_port, attachments=None):
+        """Add a message to the queue. Returns its id.
+
+        attachments is a list of file paths (the files are not copied).
+        """
+        now = time.time()
+        attachments = json.dumps([str(path) for path in attachments]) if attachments else None
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (sender, recipient, subject, body, smtp_server, smtp_port, "
+                "next_attempt, created, attachments) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sender, recipient, subject, body, smtp_server, smtp_port, now, now, attachments))
+        return cursor.lastrowid
+
+    @staticmethod
+    def _sender_filter(senders):
+        """SQL condition and parameters limiting a query to the given senders."""
+        if senders is None:
+            return "", []
+        senders = list(senders)
+        return f" AND sender IN ({', '.join('?' * len(senders))})", senders
+
+    def claim_due(self, limit=10, senders=None, now=None):
+        """Mark up to `limit` due messages as sending and return them (oldest first).
+
+        senders restricts the claim to accounts the caller can send for.
+        """
+        now = now or time.time()
+        condition, params = self._sender_filter(senders)
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_attempt <= ?" + condition +
+                " ORDER BY next_attempt, id LIMIT ?", [QUEUED, now] + params + [limit]).fetchall()
+            self._db.executemany("UPDATE outbox SET status = ? WHERE id = ?",
+                                 [(SENDING, row["id"]) for row in rows])
+        return [self._to_dict(row) for row in rows]
+
+    def next_due(self, senders=None):
+        """Time of the earliest queued attempt, or None if the queue is empty."""
+        condition, params = self._sender_filter(senders)
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = ?" + condition,
+                                   [QUEUED] + params).fetchone()
+        return row[0]
+
+    def mark_sent(self, message_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    def mark_retry(self, message_id, error, next_attempt):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "next_attempt = ? WHERE id = ?", (QUEUED, error, next_attempt, message_id))
+
+    def mark_dead(self, message_id, error):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ? "
+                "WHERE id = ?", (DEAD, error, message_id))
+
+    def release(self, message_id, next_attempt=None):
+        """Put a claimed message back without counting an attempt (e.g. rate limited)."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE outbox SET status = ?, next_attempt = ? WHERE id = ?",
+                             (QUEUED, next_attempt or time.time(), message_id))
+
+    def requeue(self, message_id=None):
+        """Move one dead letter (or all of them) back into the queue. Returns the count."""
+        sql = "UPDATE outbox SET status = ?, attempts = 0, next_attempt = ? WHERE status = ?"
+        params = [QUEUED, time.time(), DEAD]
+        if message_id is not None:
+            sql += " AND id = ?"
+            params.append(message_id)
+        with self._lock, self._db:
+            return self._db.execute(sql, params).rowcount
+
+    def cancel(self, message_id):
+        """Remove a message that is not being sent right now. Returns True if removed."""
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM outbox WHERE id = ? AND status != ?",
+                                    (message_id, SENDING)).rowcount > 0
+
+    def get(self, message_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def dead_letters(self, limit=50):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM outbox WHERE status = ? ORDER BY id LIMIT ?",
+                                    (DEAD, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def depth(self):
+        """Message counts by status, plus the age of the oldest queued message."""
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            oldest = self._db.execute("SELECT MIN(created) FROM outbox WHERE status != ?",
+                                      (DEAD,)).fetchone()[0]
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "sending": counts.get(SENDING, 0),
+            "dead": counts.get(DEAD, 0),
+            "oldest_age_s": time.time() - oldest if oldest else 0,
+        }
+
+    @staticmethod
+    def _to_dict(row):
+        message = dict(row)
+        message["attachments"] = json.loads(message["attachments"]) if message["attachments"] else []
+        return message
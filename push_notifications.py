@@ -0,0 +1,168 @@
+"""
+Push Notification Dispatcher
+Shows desktop notifications from a background thread, coalescing bursts.
+Course: Computer Networks - Fall 2025
+"""
+
+import time
+import atexit
+import threading
+
+
+APP_NAME = "Email Client"
+COALESCE_WINDOW = 2.0   # seconds: notifications within this are shown as one
+
+
+# ==================== Backends ====================
+
+class PlyerBackend:
+    """Desktop notifications through plyer (imported once, here)."""
+
+    name = "plyer"
+
+    def __init__(self, timeout=2):
+        from plyer import notification  # ImportError if plyer is missing
+        self.notification = notification
+        self.timeout = timeout
+
+    def show(self, title, message):
+        self.notification.notify(title=title, message=message, app_name=APP_NAME,
+                                 timeout=self.timeout)
+
+
+class HeadlessBackend:
+    """No desktop: remembers the last notifications shown instead.
+
+    delay (seconds) is slept per notification to stand in for the cost of a
+    real desktop call in tests and benchmarks.
+    """
+
+    name = "headless"
+
+    def __init__(self, delay=0.0, keep=100):
+        self.delay = delay
+        self.keep = keep
+        self.shown = []
+
+    def show(self, title, message):
+        if self.delay:
+            time.sleep(self.delay)
+        self.shown.append((title, message))
+        del self.shown[:-self.keep]
+
+
+def resolve_backend():
+    """plyer if it is installed, otherwise the headless backend."""
+    try:
+        return PlyerBackend()
+    except ImportError:
+        print("[!] Plyer not installed, desktop notifications are off. Run: pip install plyer")
+        return HeadlessBackend()
+
+
+# ==================== Dispatcher ====================
+
+class NotificationDispatcher:
+    """Queue of desktop notifications shown by one background thread.
+
+    notify() only records the notification and returns. The first one after
+    a quiet spell is shown straight away; anything arriving within `window`
+    seconds of a notification being shown is held and merged with others
+    of the same key, so a burst of twelve new messages becomes a single
+    "12 new emails". Backend errors are reported once and counted.
+    """
+
+    def __init__(self, backend=None, window=COALESCE_WINDOW):
+        self.backend = backend
+        self.window = window
+        self.submitted = 0
+        self.shown = 0              # notifications that reached the desktop
+        self.coalesced = 0          # merged into another one
+        self.errors = 0
+        self._pending = {}          # key -> [title, message, count, summary]
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = False          # a batch is being shown
+        self._flushing = False
+        self._error_reported = False
+
+    def notify(self, title, message, key=None, summary=None):
+        """Queue a notification without waiting for it to be shown.
+
+        Notifications with the same key (default: the title) are coalesced;
+        summary is the title used when several were merged, formatted with
+        {count} (default "{count} x <title>").
+        """
+        with self._cond:
+            self.submitted += 1
+            entry = self._pending.get(key or title)
+            if entry is None:
+                self._pending[key or title] = [title, message, 1, summary]
+            else:
+                entry[1] = message
+                entry[2] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self, timeout=5):
+        """Wait until everything queued so far has been shown. Returns True if it was."""
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+            finally:
+                self._flushing = False
+
+    def stats(self):
+        with self._cond:
+            return {"backend": getattr(self.backend, 'name', None), "submitted": self.submitted,
+                    "shown": self.shown, "coalesced": self.coalesced, "errors": self.errors,
+                    "pending": sum(entry[2] for entry in self._pending.values())}
+
+    def _run(self):
+        if self.backend is None:
+            self.backend = resolve_backend()
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = list(self._pending.values()), {}
+                self._busy = True
+            for title, message, count, summary in batch:
+                if count > 1:
+                    title = (summary or "{count} x " + title).replace("{count}", str(count))
+                try:
+                    self.backend.show(title, message)
+                    shown, errors = 1, 0
+                except Exception as e:
+                    shown, errors = 0, 1
+                    if not self._error_reported:
+                        self._error_reported = True
+                        print(f"[!] Notification error: {e}")
+                with self._cond:
+                    self.shown += shown
+                    self.errors += errors
+                    self.coalesced += count - 1
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                if self.window:
+                    # Hold whatever arrives next for the window, to be merged
+                    self._cond.wait_for(lambda: self._flushing, self.window)
+
+
+_default_dispatcher = None
+_default_lock = threading.Lock()
+
+
+def default_dispatcher():
+    """The process-wide dispatcher (backend resolved on first use)."""
+    global _default_dispatcher
+    with _default_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = NotificationDispatcher()
+            atexit.register(_default_dispatcher.flush, 1)  # show what is still queued
+        return _default_dispatcher
@@ -0,0 +1,32 @@
+"""
+Shared fixtures: the in-process IMAP/SMTP stand-ins from local_servers.
+Course: Computer Networks - Fall 2025
+"""
+
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the project
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_servers import IMAPStandIn, SMTPStandIn  # noqa: E402
+
+USER = "user@example.com"
+PASSWORD = "password"
+
+
+@pytest.fixture
+def imap_server():
+    server = IMAPStandIn().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def smtp_server(imap_server):
+    """SMTP stand-in that delivers into imap_server's INBOX."""
+    server = SMTPStandIn(deliver_to=imap_server).start()
+    yield server
+    server.stop()
@@ -0,0 +1,80 @@
+"""
+Tests for streaming attachment download: _StreamDecoder and download_attachment().
+Course: Computer Networks - Fall 2025
+"""
+
+import base64
+import binascii
+import os
+import random
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import _StreamDecoder, download_attachment
+
+CHUNK_SIZES = [1, 2, 3, 4, 5, 7, 76, 77, 78, 1000, 4096]
+
+
+def _decode_in_chunks(encoding, data, size):
+    decoder = _StreamDecoder(encoding)
+    out = b"".join(decoder.feed(data[i:i + size]) for i in range(0, len(data), size))
+    return out + decoder.flush()
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_base64_any_chunk_boundary(size):
+    payload = random.Random(size).randbytes(5000)
+    encoded = base64.encodebytes(payload).replace(b"\n", b"\r\n")
+    assert _decode_in_chunks('base64', encoded, size) == payload
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_quoted_printable_any_chunk_boundary(size):
+    text = ("café = naïve \t\n" * 50 + "x" * 200 + " trailing \n").encode('utf-8')
+    encoded = binascii.b2a_qp(text, istext=False).replace(b"\n", b"\r\n")
+    assert _decode_in_chunks('quoted-printable', encoded, size) == binascii.a2b_qp(encoded)
+
+
+def test_quoted_printable_long_line_keeps_escapes():
+    # No line breaks at all: the decoder has to cut mid-line without
+    # splitting an "=XY" escape or eating whitespace before the cut
+    encoded = b"ab=3D \t" * 20000
+    expected = binascii.a2b_qp(encoded)
+    for size in (65536, 65537, 65538, 70001):
+        assert _decode_in_chunks('quoted-printable', encoded, size) == expected
+
+
+def test_identity_encodings_pass_through():
+    data = b"line one\r\nline two\r\n"
+    assert _decode_in_chunks('7bit', data, 3) == data
+    assert _decode_in_chunks(None, data, 5) == data
+
+
+def test_base64_truncated_tail_is_padded():
+    decoder = _StreamDecoder('base64')
+    assert decoder.feed(b"QUJD" + b"RA") == b"ABC"
+    assert decoder.flush() == b"D"
+
+
+def test_download_attachment_in_small_chunks(imap_server, tmp_path):
+    payload = random.Random(1).randbytes(300 * 1024)
+    message = MIMEMultipart()
+    message['Subject'] = "attachment"
+    message.attach(MIMEText("see attached"))
+    message.attach(MIMEApplication(payload, Name="data.bin"))
+    message.get_payload()[1].add_header('Content-Disposition', 'attachment', filename="data.bin")
+    uid = imap_server.deliver(message.as_bytes())
+
+    # 4999 is neither a multiple of 4 nor of a base64 line
+    result = download_attachment(USER, PASSWORD, "127.0.0.1", imap_server.port, uid,
+                                 path=str(tmp_path), chunk_size=4999, pipeline=3)
+    assert result[0]
+    [saved] = result[5]
+    assert saved['size'] == len(payload)
+    with open(saved['path'], 'rb') as f:
+        assert f.read() == payload
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
@@ -0,0 +1,117 @@
+"""
+Tests for the headless --batch mode (JSONL jobs in, JSONL results out).
+Course: Computer Networks - Fall 2025
+"""
+
+import io
+import json
+import socket
+import time
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import BATCH_ENV, batch_main, load_batch_config, run_batch
+from local_servers import sample_message
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def config(imap_server, smtp_server):
+    return {'email': USER, 'password': PASSWORD,
+            'smtp_server': "127.0.0.1", 'smtp_port': smtp_server.port,
+            'imap_server': "127.0.0.1", 'imap_port': imap_server.port,
+            'notify_host': "127.0.0.1", 'notify_port': _closed_port()}
+
+
+def _results(output):
+    return {result['id']: result for result in map(json.loads, output.getvalue().splitlines())}
+
+
+def test_bad_lines_fail_without_stopping_the_batch(config, smtp_server):
+    lines = [json.dumps({'op': "send", 'id': "ok", 'recipient': USER, 'subject': "hi"}),
+             "not json",
+             "",
+             "[1, 2]",
+             json.dumps({'op': "fetch", 'id': "unknown"}),
+             json.dumps({'op': "send", 'id': "no-recipient"}),
+             json.dumps({'op': "notify", 'id': "no-server", 'message': "hello"})]
+    output = io.StringIO()
+    counts = run_batch(lines, config, output, workers=2, connections=1)
+
+    results = _results(output)
+    assert results["ok"]['ok'] and results["ok"]['bytes'] > 0
+    assert not results[2]['ok'] and results[2]['op'] is None
+    assert "line 2" in results[2]['error']
+    assert "JSON object" in results[4]['error']
+    assert "unknown op 'fetch'" in results["unknown"]['error']
+    assert "recipient" in results["no-recipient"]['error']
+    assert not results["no-server"]['ok']
+    assert counts == {"send": {"ok": 1, "failed": 1}, "invalid": {"ok": 0, "failed": 2},
+                      "fetch": {"ok": 0, "failed": 1}, "notify": {"ok": 0, "failed": 1}}
+    assert len(smtp_server.messages) == 1
+
+
+def test_dropped_pool_sessions_are_replaced(config, imap_server, smtp_server):
+    imap_server.deliver(sample_message(1, subject="latest"))
+    output = io.StringIO()
+
+    def lines():
+        yield json.dumps({'op': "receive", 'id': 1})
+        yield json.dumps({'op': "send", 'id': 2, 'recipient': USER})
+        # Jobs are read as they are needed: drop every session once both are done
+        deadline = time.monotonic() + 5
+        while output.getvalue().count("\n") < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        imap_server.drop_connections()
+        smtp_server.drop_connections()
+        yield json.dumps({'op': "receive", 'id': 3, 'uid': 1})
+        yield json.dumps({'op': "send", 'id': 4, 'recipient': USER})
+
+    counts = run_batch(lines(), config, output, workers=1, connections=1)
+
+    results = _results(output)
+    assert [results[n]['ok'] for n in (1, 2, 3, 4)] == [True] * 4
+    assert results[1]['email']['subject'] == results[3]['email']['subject'] == "latest"
+    assert counts == {"receive": {"ok": 2, "failed": 0}, "send": {"ok": 2, "failed": 0}}
+
+
+def test_failed_login_fails_each_job(config):
+    config['password'] = "wrong"
+    lines = [json.dumps({'op': "receive"}), json.dumps({'op': "send", 'recipient': USER})]
+    output = io.StringIO()
+    counts = run_batch(lines, config, output, workers=2, connections=1)
+    assert not any(result['ok'] for result in _results(output).values())
+    assert counts == {"receive": {"ok": 0, "failed": 1}, "send": {"ok": 0, "failed": 1}}
+
+
+def test_environment_overrides_config_file(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({'email': "file@example.com", 'password': "x", 'imap_port': "143"}))
+    config = load_batch_config(str(path), {BATCH_ENV['email']: "env@example.com"})
+    assert (config['email'], config['password'], config['imap_port']) == ("env@example.com", "x", 143)
+
+    with pytest.raises(ValueError, match=BATCH_ENV['password']):
+        load_batch_config(None, {BATCH_ENV['email']: "env@example.com"})
+
+
+def test_batch_main_exit_status(config, tmp_path, monkeypatch):
+    for name in BATCH_ENV.values():
+        monkeypatch.delenv(name, raising=False)
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    jobs = tmp_path / "jobs.jsonl"
+    results = tmp_path / "results.jsonl"
+
+    jobs.write_text(json.dumps({'op': "send", 'recipient': USER}) + "\n")
+    assert batch_main(str(jobs), str(config_path), str(results), quiet=True) == 0
+    jobs.write_text(json.dumps({'op': "send"}) + "\n")
+    assert batch_main(str(jobs), str(config_path), str(results), quiet=True) == 1
+    assert batch_main(str(tmp_path / "missing.jsonl"), str(config_path), quiet=True) == 2
+    assert len(results.read_text().splitlines()) == 1
@@ -0,0 +1,94 @@
+"""
+Tests for IMAP COMPRESS=DEFLATE: negotiation, decoding and byte accounting.
+Course: Computer Networks - Fall 2025
+"""
+
+import zlib
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import _imap_connect, _imap_login
+from local_servers import IMAPHandler, sample_message
+from wire_metrics import DeflateSocket, WireMeter
+
+
+@pytest.fixture
+def message(imap_server):
+    raw = sample_message(1, body="All work and no play makes a compressible message.\r\n" * 2000)
+    imap_server.deliver(raw)
+    return raw
+
+
+def _session(imap_server, compress):
+    meter = WireMeter()
+    mail = _imap_connect("127.0.0.1", imap_server.port, meter)
+    return mail, meter, _imap_login(mail, USER, PASSWORD, compress=compress)
+
+
+def _fetch(mail):
+    status, _ = mail.select('INBOX', readonly=True)
+    assert status == 'OK'
+    status, data = mail.uid('FETCH', '1', '(BODY.PEEK[])')
+    assert status == 'OK'
+    return data[0][1]
+
+
+def test_compressed_fetch(imap_server, message):
+    mail, meter, compressed = _session(imap_server, compress=True)
+    try:
+        assert compressed and isinstance(mail.sock, DeflateSocket)
+        assert _fetch(mail) == message
+    finally:
+        mail.logout()
+
+    # Everything after COMPRESS is counted both as sent over the wire and inflated
+    assert meter.uncompressed_recv > len(message)
+    assert 0 < meter.compressed_recv < meter.uncompressed_recv / 10
+    assert 0 < meter.compressed_sent and meter.uncompressed_sent > 0
+    assert meter.stats()['wire_bytes_recv'] < len(message)
+
+
+def test_uncompressed_fetch(imap_server, message):
+    mail, meter, compressed = _session(imap_server, compress=False)
+    try:
+        assert not compressed and not isinstance(mail.sock, DeflateSocket)
+        assert _fetch(mail) == message
+    finally:
+        mail.logout()
+    assert meter.uncompressed_recv == meter.compressed_recv == 0
+    assert meter.stats()['wire_bytes_recv'] > len(message)
+
+
+def test_not_offered_means_not_compressed(imap_server, message):
+    imap_server.compress = False
+    mail, meter, compressed = _session(imap_server, compress=True)
+    try:
+        assert not compressed
+        assert _fetch(mail) == message
+    finally:
+        mail.logout()
+
+
+def test_data_read_with_the_compress_reply_is_inflated(imap_server, message, monkeypatch):
+    # The server's first compressed bytes arrive in the same segment as the
+    # plain-text tagged OK, so imaplib's reader has already buffered them
+    alert = b"* OK [ALERT] compressed from the first byte\r\n"
+
+    def do_COMPRESS(self, tag, args):
+        self.sock = DeflateSocket(self.sock)
+        packed = self.sock._deflate.compress(alert) + self.sock._deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.sock.sock.sendall(f"{tag} OK DEFLATE active\r\n".encode() + packed)
+        self.rfile = self.sock.makefile('rb')
+        self.compressed = True
+
+    monkeypatch.setattr(IMAPHandler, 'do_COMPRESS', do_COMPRESS)
+    mail, meter, compressed = _session(imap_server, compress=True)
+    try:
+        assert compressed
+        assert mail.noop()[0] == 'OK'
+        assert b"[ALERT] compressed from the first byte" in mail.response('OK')[1]
+        assert _fetch(mail) == message
+    finally:
+        mail.logout()
+    assert meter.uncompressed_recv > len(message) + len(alert)
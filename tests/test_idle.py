@@ -0,0 +1,122 @@
+"""
+Tests for the IMAP IDLE push watcher.
+Course: Computer Networks - Fall 2025
+"""
+
+import imaplib
+import threading
+import time
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import IMAPIdleWatcher
+from local_servers import sample_message
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Everything the client sends, and a hook run before a DONE goes out."""
+    log = []
+    hooks = []
+    send = imaplib.IMAP4.send
+
+    def recording_send(self, data):
+        if data == b"DONE\r\n":
+            for hook in hooks:
+                hook()
+        log.append(data)
+        return send(self, data)
+
+    monkeypatch.setattr(imaplib.IMAP4, 'send', recording_send)
+    recording_send.log = log
+    recording_send.before_done = hooks
+    return recording_send
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _idling(sent):
+    return any(data.endswith(b" IDLE\r\n") for data in sent.log)
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_new_message_reaches_callback(imap_server, sent, compress):
+    imap_server.compress = compress
+    received = []
+    arrived = threading.Event()
+
+    def on_message(email_data):
+        received.append(email_data)
+        arrived.set()
+
+    imap_server.deliver(sample_message(1, subject="before"))
+    watcher = IMAPIdleWatcher(USER, PASSWORD, "127.0.0.1", imap_server.port,
+                              on_message=on_message).start()
+    try:
+        _wait_for(lambda: _idling(sent))
+        imap_server.deliver(sample_message(2, subject="pushed"))
+        assert arrived.wait(5)
+    finally:
+        watcher.stop()
+    assert [email_data['subject'] for email_data in received] == ["pushed"]
+    assert watcher.last_uid == 2
+
+
+def test_stop_returns_within_poll_timeout(imap_server, sent):
+    watcher = IMAPIdleWatcher(USER, PASSWORD, "127.0.0.1", imap_server.port).start()
+    _wait_for(lambda: _idling(sent))
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    watcher.stop()
+    assert not watcher.running
+    assert time.monotonic() - started < 1.5
+
+
+def test_partial_line_does_not_hold_up_done(imap_server, sent):
+    watcher = IMAPIdleWatcher(USER, PASSWORD, "127.0.0.1", imap_server.port).start()
+    _wait_for(lambda: _idling(sent))
+    [session] = imap_server.sessions
+
+    # Half a response line, whose end only comes after the client's DONE
+    session.send(b"* 1 EXI")
+    done_while_partial = []
+
+    def finish_line():
+        done_while_partial.append(True)
+        session.send(b"STS\r\n")
+
+    sent.before_done.append(finish_line)
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    watcher.stop()
+    assert done_while_partial
+    assert not watcher.running
+    assert time.monotonic() - started < 1.5
+
+
+def test_dropped_connection_reconnects_and_catches_up(imap_server, sent):
+    received = []
+    arrived = threading.Event()
+
+    def on_message(email_data):
+        received.append(email_data['subject'])
+        arrived.set()
+
+    watcher = IMAPIdleWatcher(USER, PASSWORD, "127.0.0.1", imap_server.port,
+                              on_message=on_message).start()
+    try:
+        _wait_for(lambda: _idling(sent))
+        imap_server.drop_connections()
+        imap_server.deliver(sample_message(1, subject="while away"))
+        assert arrived.wait(5)
+    finally:
+        watcher.stop()
+    assert received == ["while away"]
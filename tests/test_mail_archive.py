@@ -0,0 +1,141 @@
+"""
+Tests for mailbox export/import: the mbox format and resuming from checkpoints.
+Course: Computer Networks - Fall 2025
+"""
+
+import json
+import os
+
+import pytest
+
+import email_client
+from conftest import USER, PASSWORD
+from email_client import export_mailbox, import_mailbox
+from mail_archive import Checkpoint, read_archive, read_mbox, write_mbox_message
+
+COUNT = 35
+DATE = 1760000000
+
+
+def _message(n):
+    body = b"Hello\r\nFrom here on, a line mbox has to quote\r\n>From an already quoted line\r\n"
+    return (f"From: sender{n}@example.com\r\nTo: {USER}\r\nSubject: message {n}\r\n\r\n"
+            .encode('ascii') + body + b"x" * (n * 37) + b"\r\n")
+
+
+def _flags(n):
+    return [['\\Seen'], ['\\Seen', '\\Flagged'], [], ['\\Answered']][n % 4]
+
+
+@pytest.fixture
+def full_mailbox(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    for n in range(COUNT):
+        inbox.append(_message(n), _flags(n), DATE + n * 3600)
+    return imap_server
+
+
+def test_mbox_write_read_round_trip(tmp_path):
+    path = tmp_path / "out.mbox"
+    with open(path, 'wb') as f:
+        for n in range(5):
+            write_mbox_message(f, _message(n), _flags(n), DATE + n)
+    messages = list(read_mbox(str(path)))
+    assert [raw for raw, _, _ in messages] == [_message(n) for n in range(5)]
+    assert [flags for _, flags, _ in messages] == [sorted(_flags(n)) for n in range(5)]
+    assert [date for _, _, date in messages] == [DATE + n for n in range(5)]
+
+
+@pytest.mark.parametrize("connections", [1, 3])
+def test_export_import_round_trip(full_mailbox, tmp_path, connections):
+    path = str(tmp_path / "INBOX.mbox")
+    result = export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path,
+                            connections=connections, chunk_size=8)
+    assert result[0] and result[5] == COUNT
+    assert not os.path.exists(path + '.export.json')
+    assert [raw for raw, _, _ in read_archive(path)] == [_message(n) for n in range(COUNT)]
+
+    result = import_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path,
+                            mailbox="Restored")
+    assert result[0] and result[5] == COUNT
+    restored = full_mailbox.mailboxes["Restored"]
+    stored = [restored.messages[uid] for uid in restored.uids]
+    assert [message.raw for message in stored] == [_message(n) for n in range(COUNT)]
+    assert [sorted(message.flags) for message in stored] == [sorted(_flags(n)) for n in range(COUNT)]
+    assert [int(message.internaldate) for message in stored] == [DATE + n * 3600 for n in range(COUNT)]
+
+
+def test_export_resumes_from_checkpoint(full_mailbox, tmp_path, monkeypatch):
+    reference = str(tmp_path / "reference.mbox")
+    assert export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=reference,
+                          connections=1, chunk_size=10)[0]
+
+    # Fail on the third chunk: the first two are committed and checkpointed
+    export_range = email_client._export_range
+    calls = []
+    fail_on = [3]
+
+    def recording_range(mail, lo, hi, write):
+        calls.append((lo, hi))
+        if len(calls) in fail_on:
+            raise OSError("connection reset")
+        return export_range(mail, lo, hi, write)
+
+    path = str(tmp_path / "INBOX.mbox")
+    monkeypatch.setattr(email_client, '_export_range', recording_range)
+    assert not export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path,
+                              connections=1, chunk_size=10)[0]
+    with open(path + '.export.json') as f:
+        state = json.load(f)
+    assert state['next_uid'] == 21 and state['exported'] == 20
+    assert state['mbox_size'] == os.path.getsize(path)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+    # The second run only fetches the remaining UIDs and ends with the same file
+    calls.clear()
+    fail_on.clear()
+    result = export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path,
+                            connections=1, chunk_size=10)
+    assert result[0] and result[5] == COUNT
+    assert calls == [(21, 30), (31, 35)]
+    with open(path, 'rb') as a, open(reference, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_export_restarts_when_mbox_is_missing(full_mailbox, tmp_path):
+    path = str(tmp_path / "INBOX.mbox")
+    uidvalidity = full_mailbox.mailboxes["INBOX"].uidvalidity
+    Checkpoint(path + '.export.json').save({"mailbox": "INBOX", "uidvalidity": uidvalidity,
+                                            "format": "mbox", "next_uid": 21, "exported": 20,
+                                            "mbox_size": 5000})
+    result = export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path)
+    assert result[0] and result[5] == COUNT
+    with open(path, 'rb') as f:
+        assert b"\0" not in f.read()
+    assert [raw for raw, _, _ in read_mbox(path)] == [_message(n) for n in range(COUNT)]
+
+
+@pytest.mark.parametrize("literal_plus", [True, False])
+def test_import_skips_checkpointed_messages(full_mailbox, tmp_path, monkeypatch, literal_plus):
+    path = str(tmp_path / "INBOX.mbox")
+    assert export_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path)[0]
+    if not literal_plus:
+        monkeypatch.setattr(email_client.imaplib.IMAP4, '_get_capabilities', _without_literal_plus)
+    Checkpoint(path + '.import.json').save({"source": os.path.abspath(path),
+                                            "mailbox": "Restored", "imported": 12})
+
+    result = import_mailbox(USER, PASSWORD, "127.0.0.1", full_mailbox.port, path=path,
+                            mailbox="Restored")
+    assert result[0] and result[5] == COUNT
+    restored = full_mailbox.mailboxes["Restored"]
+    assert [restored.messages[uid].raw for uid in restored.uids] == \
+        [_message(n) for n in range(12, COUNT)]
+    assert not os.path.exists(path + '.import.json')
+
+
+_get_capabilities = email_client.imaplib.IMAP4._get_capabilities
+
+
+def _without_literal_plus(self):
+    _get_capabilities(self)
+    self.capabilities = tuple(cap for cap in self.capabilities if cap != 'LITERAL+')
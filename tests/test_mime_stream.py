@@ -0,0 +1,78 @@
+"""
+Tests for streaming MIME generation: MessageStream, dot_stuff and rechunk.
+Course: Computer Networks - Fall 2025
+"""
+
+import random
+import re
+from email import message_from_bytes
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import send_email
+from mime_stream import BLOCK_BYTES, LINE_BYTES, MessageStream, dot_stuff, rechunk
+
+ATTACHMENT_SIZES = [0, 1, 2, 3, LINE_BYTES - 1, LINE_BYTES, LINE_BYTES + 1,
+                    BLOCK_BYTES - 1, BLOCK_BYTES, BLOCK_BYTES + 1, 3 * BLOCK_BYTES + 100]
+
+
+def _attachment(tmp_path, size, name="file.bin"):
+    path = tmp_path / name
+    path.write_bytes(random.Random(size).randbytes(size))
+    return path
+
+
+@pytest.mark.parametrize("size", ATTACHMENT_SIZES)
+def test_size_matches_streamed_bytes(tmp_path, size):
+    path = _attachment(tmp_path, size)
+    stream = MessageStream("a@example.com", "b@example.com", "Subject", "Body", [path])
+    data = b"".join(stream)
+    assert len(data) == stream.size == stream.bytes_generated
+
+    part = message_from_bytes(data).get_payload()[1]
+    assert part.get_payload(decode=True) == path.read_bytes()
+
+
+def test_size_with_several_attachments_and_no_body(tmp_path):
+    paths = [_attachment(tmp_path, size, f"f{size}.bin") for size in (10, 100000, 57 * 3)]
+    stream = MessageStream("a@example.com", "b@example.com", "", "", paths)
+    assert len(b"".join(stream)) == stream.size
+    # Iterating again (a retry) produces the same length
+    assert len(b"".join(stream)) == stream.size
+
+
+def _reference_stuffing(data):
+    return re.sub(rb'(^|\n)\.', rb'\1..', data)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_dot_stuff_across_chunk_borders(size):
+    data = b".leading\r\n..two\r\nmid.dle\r\n.\r\n\r\n.end\r\n" * 20
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    assert b"".join(dot_stuff(chunks)) == _reference_stuffing(data)
+
+
+def test_dot_stuff_skips_empty_chunks():
+    assert b"".join(dot_stuff([b"a\r\n", b"", b".b\r\n"])) == b"a\r\n..b\r\n"
+
+
+def test_rechunk_sizes():
+    pieces = list(rechunk([b"abc", b"defgh", b"", b"ij"], 4))
+    assert pieces == [b"abcd", b"efgh", b"ij"]
+
+
+@pytest.mark.parametrize("chunking", [True, False])
+def test_dotted_body_survives_smtp(imap_server, smtp_server, tmp_path, chunking):
+    smtp_server.chunking = chunking  # BDAT, or dot-stuffed DATA
+    body = ".hidden line\n.\n..double\nplain\n"
+    path = _attachment(tmp_path, 70000)
+    result = send_email(USER, PASSWORD, USER, "dots", body, "127.0.0.1", smtp_server.port,
+                        attachments=[str(path)])
+    assert result[0]
+
+    [(_, _, data)] = smtp_server.messages
+    message = message_from_bytes(data)
+    text, attachment = message.get_payload()
+    assert text.get_payload(decode=True).decode().replace("\r\n", "\n") == body
+    assert attachment.get_payload(decode=True) == path.read_bytes()
@@ -0,0 +1,42 @@
+"""
+Tests for the shared notification channels.
+Course: Computer Networks - Fall 2025
+"""
+
+import socket
+
+import pytest
+
+import email_client
+from email_client import get_notification_channel
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    """A TCP socket that accepts notification connections (and reads nothing)."""
+    monkeypatch.setattr(email_client, '_channels', {})
+    sock = socket.create_server(('127.0.0.1', 0))
+    yield sock.getsockname()[1]
+    for channel in email_client._channels.values():
+        channel.close()
+    sock.close()
+
+
+def test_channels_are_shared_per_batch_window(listener):
+    plain = get_notification_channel('127.0.0.1', listener)
+    assert get_notification_channel('127.0.0.1', listener) is plain
+    assert get_notification_channel('127.0.0.1', listener, 0.0) is plain
+
+    batched = get_notification_channel('127.0.0.1', listener, batch_window=0.05)
+    assert batched is not plain
+    assert get_notification_channel('127.0.0.1', listener, batch_window=0.05) is batched
+    assert (plain.batch_window, batched.batch_window) == (0.0, 0.05)
+
+
+def test_batched_caller_leaves_unbatched_channel_alone(listener):
+    plain = get_notification_channel('127.0.0.1', listener)
+    get_notification_channel('127.0.0.1', listener, batch_window=0.5)
+
+    _, wire = plain.send("written at once")
+    assert wire is not None  # not queued for a flusher
+    assert plain.writes == 1
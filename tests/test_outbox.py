@@ -0,0 +1,114 @@
+"""
+Tests for the outbound spool: retry with backoff, dead letters and rate limiting.
+Course: Computer Networks - Fall 2025
+"""
+
+import time
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import OutboxWorker, SMTPConnectionPool, TokenBucket
+from outbox import DEAD, QUEUED, Outbox
+
+
+@pytest.fixture
+def make_worker(tmp_path):
+    made = []
+
+    def make_worker(**options):
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        pool = SMTPConnectionPool()
+        worker = OutboxWorker(outbox, pool, **options).start()
+        made.append(worker)
+        return worker
+
+    yield make_worker
+    for worker in made:
+        worker.stop()
+        worker.pool.close_all()
+        worker.outbox.close()
+
+
+def _submit(worker, smtp_server, recipient=USER, subject="queued"):
+    return worker.submit(USER, PASSWORD, recipient, subject, "body", "127.0.0.1", smtp_server.port)
+
+
+def test_temporary_failure_is_retried_with_backoff(make_worker, smtp_server):
+    worker = make_worker(base_delay=0.2, max_attempts=5)
+    smtp_server.refuse[USER] = "451 4.3.0 Try again later"
+    message_id = _submit(worker, smtp_server)
+
+    status, error = worker.wait(message_id, timeout=5)
+    failed_at = time.time()
+    assert status == 'retry' and "Try again later" in error
+    row = worker.outbox.get(message_id)
+    assert (row['status'], row['attempts']) == (QUEUED, 1)
+    # base_delay, with up to half of it taken off as jitter
+    assert 0.1 - 0.05 <= row['next_attempt'] - failed_at <= 0.2
+
+    status, error = worker.wait(message_id, timeout=5)
+    assert status == 'retry'
+    row = worker.outbox.get(message_id)
+    assert row['attempts'] == 2
+    assert 0.2 - 0.05 <= row['next_attempt'] - time.time() <= 0.4  # doubled
+
+    del smtp_server.refuse[USER]
+    status, _ = worker.wait(message_id, timeout=5)
+    assert status == 'sent'
+    assert time.time() - failed_at >= 0.1 + 0.2
+    assert worker.outbox.get(message_id) is None
+    stats = worker.stats()
+    assert (stats['sent'], stats['retries'], stats['dead_lettered']) == (1, 2, 0)
+    assert len(smtp_server.messages) == 1
+
+
+def test_retries_stop_at_max_attempts(make_worker, smtp_server):
+    worker = make_worker(base_delay=0.05, max_attempts=2)
+    smtp_server.refuse[USER] = "421 4.7.0 Too many connections"
+    message_id = _submit(worker, smtp_server)
+    assert worker.wait(message_id, timeout=5)[0] == 'retry'
+    assert worker.wait(message_id, timeout=5)[0] == 'dead'
+    assert worker.outbox.get(message_id)['status'] == DEAD
+
+
+def test_permanent_failure_is_dead_lettered(make_worker, smtp_server):
+    worker = make_worker(base_delay=0.05)
+    smtp_server.refuse["nobody@example.com"] = "550 5.1.1 No such user"
+    message_id = _submit(worker, smtp_server, recipient="nobody@example.com")
+
+    status, error = worker.wait(message_id, timeout=5)
+    assert status == 'dead' and "No such user" in error
+    [letter] = worker.outbox.dead_letters()
+    assert (letter['id'], letter['attempts']) == (message_id, 1)
+    assert worker.wait(message_id, timeout=0.3) is None  # never tried again
+    stats = worker.stats()
+    assert (stats['sent'], stats['retries'], stats['dead_lettered'], stats['dead']) == (0, 0, 1, 1)
+
+    # A requeued dead letter goes out once the problem is fixed
+    del smtp_server.refuse["nobody@example.com"]
+    assert worker.requeue(message_id) == 1
+    assert worker.wait(message_id, timeout=5)[0] == 'sent'
+
+
+def test_token_bucket_limits_the_send_rate(make_worker, smtp_server):
+    worker = make_worker(rate=10, burst=2)
+    started = time.monotonic()
+    ids = [_submit(worker, smtp_server, subject=f"message {n}") for n in range(6)]
+    for message_id in ids:
+        assert worker.wait(message_id, timeout=5)[0] == 'sent'
+
+    # Two go out at once, the other four wait for a token each (0.1 s apart)
+    assert time.monotonic() - started >= 4 / 10 - 0.05
+    assert worker.stats()['sent'] == 6
+    assert len(smtp_server.messages) == 6
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=4, capacity=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    wait = bucket.take()
+    assert 0.2 <= wait <= 0.25
+    time.sleep(wait)
+    assert bucket.take() == 0
@@ -0,0 +1,102 @@
+"""
+Tests for the paged inbox listing: MailboxPager, _stream_fetch and browse_inbox.
+Course: Computer Networks - Fall 2025
+"""
+
+import time
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import MailboxPager, browse_inbox, list_messages
+from local_servers import sample_message
+
+
+@pytest.fixture
+def pager(imap_server):
+    for n in range(1, 46):
+        imap_server.deliver(sample_message(n, subject=f"message {n}"))
+    pager = MailboxPager(USER, PASSWORD, "127.0.0.1", imap_server.port, page_size=20).open()
+    yield pager
+    pager.close()
+
+
+def _uids(rows):
+    return [row['uid'] for row in rows]
+
+
+def test_pages_run_newest_first(pager):
+    assert (pager.exists, pager.pages) == (45, 3)
+    assert _uids(pager.page(0)) == list(range(26, 46))
+    assert _uids(pager.page(1)) == list(range(6, 26))
+    assert _uids(pager.page(2)) == list(range(1, 6))
+    assert _uids(pager.page(3)) == []
+    assert pager.last_metrics[0] and pager.last_metrics[5] == 0
+
+
+def test_envelope_fields(pager):
+    [row] = pager.uid_range(7, 7)
+    assert (row['uid'], row['subject'], row['from']) == (7, "message 7", "alice@example.com")
+    assert not row['seen']
+    assert pager.last_metrics[0] and pager.last_metrics[5] == 1
+    assert pager.last_metrics[2] > 0
+
+
+def test_refresh_picks_up_new_and_expunged_mail(pager, imap_server):
+    for n in range(46, 49):
+        imap_server.deliver(sample_message(n))
+    assert pager.refresh() == 48
+    assert _uids(pager.page(0)) == list(range(29, 49))
+
+    imap_server.mailboxes['INBOX'].expunge([48, 47])
+    assert pager.refresh() == 46
+    assert pager.pages == 3
+    assert _uids(pager.page(0))[-1] == 46
+
+
+def test_abandoned_page_leaves_the_session_usable(pager):
+    rows = pager.page(0)
+    assert _uids([next(rows), next(rows)]) == [26, 27]
+    rows.close()  # stop reading in the middle of the FETCH
+    assert _uids(pager.page(1)) == list(range(6, 26))
+    assert pager.refresh() == 45
+
+
+def test_list_messages(imap_server):
+    for n in range(1, 8):
+        imap_server.deliver(sample_message(n))
+    result = list_messages(USER, PASSWORD, "127.0.0.1", imap_server.port, count=5)
+    assert result[0]
+    assert _uids(result[5]) == [7, 6, 5, 4, 3]
+    result = list_messages(USER, PASSWORD, "127.0.0.1", imap_server.port, uid_range=(2, 3))
+    assert _uids(result[5]) == [3, 2]
+
+
+def test_browse_inbox_times_failures(imap_server, monkeypatch):
+    def slow_failure(self):
+        time.sleep(0.1)
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(MailboxPager, 'open', slow_failure)
+    result = browse_inbox(USER, PASSWORD, "127.0.0.1", imap_server.port)
+    assert not result[0]
+    assert result[1] >= 0.1
+
+
+def test_browse_inbox_times_a_failed_page_from_its_request(imap_server, monkeypatch):
+    imap_server.deliver(sample_message(1))
+    choices = iter(["r", "q"])
+
+    def answer(prompt):
+        time.sleep(0.2)  # the user reading the page
+        return next(choices)
+
+    def failing_refresh(self):
+        time.sleep(0.05)
+        raise OSError("connection reset")
+
+    monkeypatch.setattr('builtins.input', answer)
+    monkeypatch.setattr(MailboxPager, 'refresh', failing_refresh)
+    result = browse_inbox(USER, PASSWORD, "127.0.0.1", imap_server.port)
+    assert not result[0]
+    assert 0.05 <= result[1] < 0.2
@@ -0,0 +1,78 @@
+"""
+Tests for pooled SMTP sessions: reconnecting after a drop, and send_many results.
+Course: Computer Networks - Fall 2025
+"""
+
+import pytest
+
+from conftest import USER, PASSWORD
+from email_client import SMTPConnectionPool, _send_pooled, send_many
+
+
+@pytest.fixture
+def pool():
+    pool = SMTPConnectionPool(max_size=2)
+    yield pool
+    pool.close_all()
+
+
+def _send(pool, smtp_server, subject):
+    return _send_pooled(pool, USER, PASSWORD, USER, subject, "body", "127.0.0.1", smtp_server.port)
+
+
+def _connections(pool, monkeypatch):
+    opened = []
+    connect = pool._connect
+
+    def counting_connect(*args):
+        server = connect(*args)
+        opened.append(server)
+        return server
+
+    monkeypatch.setattr(pool, '_connect', counting_connect)
+    return opened
+
+
+def test_idle_session_is_reused(smtp_server, pool, monkeypatch):
+    opened = _connections(pool, monkeypatch)
+    assert _send(pool, smtp_server, "one")[0]
+    assert _send(pool, smtp_server, "two")[0]
+    assert len(opened) == 1
+    assert len(smtp_server.messages) == 2
+
+
+def test_session_dropped_while_idle_is_replaced(smtp_server, pool, monkeypatch):
+    opened = _connections(pool, monkeypatch)
+    assert _send(pool, smtp_server, "one")[0]
+    smtp_server.drop_connections()
+
+    assert _send(pool, smtp_server, "two")[0]
+    assert len(opened) == 2
+    assert [data.count(b"Subject: two") for _, _, data in smtp_server.messages] == [0, 1]
+
+
+def test_session_dropped_after_health_check_is_retried(smtp_server, pool, monkeypatch):
+    opened = _connections(pool, monkeypatch)
+    assert _send(pool, smtp_server, "one")[0]
+
+    # NOOP passes, then the connection goes away before MAIL FROM
+    def alive_then_dropped(server):
+        smtp_server.drop_connections()
+        return True
+
+    monkeypatch.setattr(pool, '_is_alive', alive_then_dropped)
+    assert _send(pool, smtp_server, "two")[0]
+    assert len(opened) == 2
+    assert len(smtp_server.messages) == 2
+
+
+def test_send_many_reports_each_message(smtp_server, pool):
+    smtp_server.refuse["nobody@example.com"] = "550 5.1.1 No such user"
+    messages = [{'recipient': USER, 'subject': "first"},
+                {'recipient': "nobody@example.com", 'subject': "refused"},
+                {'recipient': USER, 'subject': "third"}]
+    batch, results = send_many(messages, USER, PASSWORD, "127.0.0.1", smtp_server.port, pool=pool)
+
+    assert not batch[0]
+    assert [result[0] for result in results] == [True, False, True]
+    assert len(smtp_server.messages) == 2
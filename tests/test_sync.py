@@ -0,0 +1,154 @@
+"""
+Tests for incremental IMAP sync into the local cache.
+Course: Computer Networks - Fall 2025
+"""
+
+import imaplib
+import threading
+import time
+
+import pytest
+
+import email_client
+from conftest import USER, PASSWORD
+from email_client import _interleave_by_server, sync_accounts, sync_mailbox
+from local_servers import Mailbox, sample_message
+from mail_cache import MailCache, account_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MailCache(str(tmp_path / "cache.db"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def uid_commands(monkeypatch):
+    """Records the UID command names (SEARCH, FETCH) each sync sends."""
+    commands = []
+    uid = imaplib.IMAP4.uid
+
+    def recording_uid(self, command, *args):
+        commands.append(command.upper())
+        return uid(self, command, *args)
+
+    monkeypatch.setattr(imaplib.IMAP4, 'uid', recording_uid)
+    return commands
+
+
+def _sync(imap_server, cache):
+    result = sync_mailbox(USER, PASSWORD, "127.0.0.1", imap_server.port, cache=cache)
+    assert result[0]
+    return result[5]
+
+
+def _cached_uids(imap_server, cache):
+    account = account_key(USER, "127.0.0.1", imap_server.port)
+    return sorted(message['uid'] for message in cache.latest(account, 'INBOX', 1000))
+
+
+def test_only_new_messages_are_fetched(imap_server, cache):
+    for n in range(5):
+        imap_server.deliver(sample_message(n))
+    assert _sync(imap_server, cache) == 5
+
+    imap_server.deliver(sample_message(5))
+    imap_server.deliver(sample_message(6))
+    assert _sync(imap_server, cache) == 2
+    assert _cached_uids(imap_server, cache) == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_unchanged_mailbox_sends_no_search(imap_server, cache, uid_commands):
+    for n in range(3):
+        imap_server.deliver(sample_message(n))
+    _sync(imap_server, cache)
+    assert 'SEARCH' in uid_commands
+
+    uid_commands.clear()
+    assert _sync(imap_server, cache) == 0
+    assert uid_commands == []
+
+
+def test_expunged_messages_are_pruned(imap_server, cache):
+    for n in range(5):
+        imap_server.deliver(sample_message(n))
+    _sync(imap_server, cache)
+
+    imap_server.mailboxes['INBOX'].expunge([2, 4])
+    assert _sync(imap_server, cache) == 0
+    assert _cached_uids(imap_server, cache) == [1, 3, 5]
+
+
+def test_uidvalidity_change_discards_the_cache(imap_server, cache):
+    for n in range(4):
+        imap_server.deliver(sample_message(n))
+    _sync(imap_server, cache)
+    account = account_key(USER, "127.0.0.1", imap_server.port)
+    old_uidvalidity = cache.get_state(account, 'INBOX')[0]
+
+    # The mailbox is recreated: UIDs restart under a new UIDVALIDITY
+    imap_server.mailboxes['INBOX'] = Mailbox(uidvalidity=old_uidvalidity + 1)
+    imap_server.deliver(sample_message(10, subject="after the reset"))
+    assert _sync(imap_server, cache) == 1
+
+    assert _cached_uids(imap_server, cache) == [1]
+    assert cache.latest(account, 'INBOX')[0]['subject'] == "after the reset"
+    assert cache.get_state(account, 'INBOX')[:2] == (old_uidvalidity + 1, 1)
+
+
+def test_sync_accounts_reports_each_mailbox_and_account(imap_server, cache):
+    imap_server.users["other@example.com"] = "secret"
+    for n in range(3):
+        imap_server.deliver(sample_message(n))
+    imap_server.deliver(sample_message(10), mailbox="Archive")
+    server = {'imap_server': "127.0.0.1", 'imap_port': imap_server.port}
+    accounts = [dict(server, email=USER, password=PASSWORD, mailboxes=["INBOX", "Archive"]),
+                dict(server, email="other@example.com", password="wrong")]
+
+    total, per_account, per_mailbox = sync_accounts(accounts, cache=cache)
+
+    user = account_key(USER, "127.0.0.1", imap_server.port)
+    other = account_key("other@example.com", "127.0.0.1", imap_server.port)
+    assert {key: metrics[0] for key, metrics in per_mailbox.items()} == {
+        (user, "INBOX"): True, (user, "Archive"): True, (other, "INBOX"): False}
+    assert per_account[user][0] and per_account[user][5] == 4
+    assert not per_account[other][0]
+    assert not total[0] and total[5] == 4
+    assert (cache.count(user, "INBOX"), cache.count(user, "Archive")) == (3, 1)
+
+
+def test_sync_accounts_limits_connections_per_server(imap_server, cache, monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+    sync = email_client.sync_mailbox
+
+    def counting_sync(*args):
+        with lock:
+            running.append(args)
+            peak.append(len(running))
+        try:
+            time.sleep(0.05)
+            return sync(*args)
+        finally:
+            with lock:
+                running.remove(args)
+
+    monkeypatch.setattr(email_client, 'sync_mailbox', counting_sync)
+    mailboxes = [f"Box{n}" for n in range(6)]
+    for mailbox in mailboxes:
+        imap_server.deliver(sample_message(1), mailbox=mailbox)
+    accounts = [{'email': USER, 'password': PASSWORD, 'imap_server': "127.0.0.1",
+                 'imap_port': imap_server.port, 'mailboxes': mailboxes}]
+
+    total = sync_accounts(accounts, cache=cache, max_workers=6, per_server_limit=2)[0]
+    assert total[0] and total[5] == 6
+    assert max(peak) == 2
+
+
+def test_jobs_are_interleaved_across_servers():
+    jobs = [{'imap_server': server, 'imap_port': 993, 'n': n}
+            for server, count in (("a", 3), ("b", 1), ("c", 2)) for n in range(count)]
+    order = [(job['imap_server'], job['n']) for job in _interleave_by_server(jobs)]
+    assert order == [("a", 0), ("b", 0), ("c", 0), ("a", 1), ("c", 1), ("a", 2)]
@@ -0,0 +1,590 @@
+"""
+Wire Metrics
+Socket instrumentation that measures real bytes, send/recv calls, TCP segments
+and per-phase timings for the SMTP, IMAP and notification connections, plus
+the connection setup shared by them (DNS cache, TLS session resumption).
+Course: Computer Networks - Fall 2025
+"""
+
+import io
+import ssl
+import time
+import zlib
+import socket
+import threading
+import struct
+import imaplib
+import smtplib
+
+
+# ==================== TCP_INFO (Linux) ====================
+
+# struct tcp_info from linux/tcp.h: 8 x u8 then 24 x u32 (tcpi_rto ... tcpi_total_retrans)
+_TCP_INFO_BASE = struct.Struct('=8B24I')
+
+
+def read_tcp_info(sock):
+    """Read TCP_INFO for a connected socket. Returns a dict, or None where unsupported."""
+    if not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+    except (OSError, ValueError):
+        return None
+    if len(raw) < _TCP_INFO_BASE.size:
+        return None
+
+    values = _TCP_INFO_BASE.unpack_from(raw)
+    u32 = values[8:]
+    info = {
+        "rtt_us": u32[15],
+        "rttvar_us": u32[16],
+        "snd_mss": u32[2],
+        "snd_cwnd": u32[18],
+        "lost": u32[6],
+        "total_retrans": u32[23],
+    }
+    if len(raw) >= 144:
+        info["bytes_acked"], info["bytes_received"] = struct.unpack_from('=QQ', raw, 120)
+        info["segs_out"], info["segs_in"] = struct.unpack_from('=II', raw, 136)
+    if len(raw) >= 216:
+        info["bytes_sent"], info["bytes_retrans"] = struct.unpack_from('=QQ', raw, 200)
+    return info
+
+
+# ==================== Meter ====================
+
+class WireMeter:
+    """Counters and phase timings for one connection.
+
+    Phases are recorded with mark(name): the time since the previous mark
+    (or since begin()) is added to that phase. Timing uses perf_counter.
+    on_phase, if set, is called with (phase, seconds) on every mark, from the
+    thread doing the I/O. abort() cancels the operation from another thread.
+    """
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_recv = 0
+        self.send_calls = 0
+        self.recv_calls = 0
+        self.tls_handshakes = 0
+        self.tls_resumed = 0     # handshakes that resumed a cached session
+        self.compressed_sent = 0     # COMPRESS=DEFLATE traffic: bytes on the wire...
+        self.uncompressed_sent = 0   # ...and before compression / after decompression
+        self.compressed_recv = 0
+        self.uncompressed_recv = 0
+        self.phases = {}
+        self.sock = None
+        self.last_tcp_info = None
+        self.on_phase = None
+        self.aborted = False
+        self.begin()
+
+    def begin(self):
+        """Start timing a new operation on this connection."""
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        if self.on_phase is not None:
+            self.on_phase(phase, now - self._last)
+        self._last = now
+        if self.aborted:
+            raise ConnectionAbortedError("operation cancelled")
+
+    def abort(self):
+        """Cancel the operation using this meter (safe to call from any thread).
+
+        The live socket is shut down, so a blocked send/recv fails at once;
+        if there is no socket yet, the next phase mark raises instead.
+        """
+        self.aborted = True
+        sock = self.sock
+        if sock is not None:
+            try:
+                # socket.socket's shutdown, not SSLSocket's: just the TCP
+                # connection, without touching TLS state another thread is using
+                socket.socket.shutdown(sock, socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def tcp_info(self):
+        """Live TCP_INFO, or the last value read before the socket closed."""
+        if self.sock is not None:
+            info = read_tcp_info(self.sock)
+            if info is not None:
+                self.last_tcp_info = info
+        return self.last_tcp_info
+
+    def snapshot(self):
+        """Current counters, for computing per-operation deltas with stats()."""
+        return {
+            "bytes_sent": self.bytes_sent,
+            "bytes_recv": self.bytes_recv,
+            "send_calls": self.send_calls,
+            "recv_calls": self.recv_calls,
+            "tls_handshakes": self.tls_handshakes,
+            "tls_resumed": self.tls_resumed,
+            "compressed_sent": self.compressed_sent,
+            "uncompressed_sent": self.uncompressed_sent,
+            "compressed_recv": self.compressed_recv,
+            "uncompressed_recv": self.uncompressed_recv,
+            "phases": dict(self.phases),
+            "tcp": self.tcp_info(),
+        }
+
+    def stats(self, since=None, now=None):
+        """Counters (minus an earlier snapshot) as a plain dict.
+
+        wire_bytes_* and segs_* come from TCP_INFO when available and include
+        TLS and protocol overhead; otherwise they fall back to the socket-level
+        byte counts and send/recv call counts. Pass now= to measure up to a
+        snapshot already taken.
+        """
+        now = now or self.snapshot()
+        counters = ("bytes_sent", "bytes_recv", "send_calls", "recv_calls",
+                    "tls_handshakes", "tls_resumed", "compressed_sent", "uncompressed_sent",
+                    "compressed_recv", "uncompressed_recv")
+        base = since or dict(dict.fromkeys(counters, 0), phases={}, tcp=None)
+        stats = {key: now[key] - base[key] for key in counters}
+        stats["phases"] = {name: value - base["phases"].get(name, 0)
+                           for name, value in now["phases"].items()
+                           if value - base["phases"].get(name, 0) > 0}
+
+        tcp = now["tcp"]
+        if tcp and "segs_out" in tcp:
+            before = base["tcp"] or {}
+            sent_key = "bytes_sent" if "bytes_sent" in tcp else "bytes_acked"
+            stats["wire_bytes_sent"] = tcp[sent_key] - before.get(sent_key, 0)
+            stats["wire_bytes_recv"] = tcp["bytes_received"] - before.get("bytes_received", 0)
+            stats["segs_out"] = tcp["segs_out"] - before.get("segs_out", 0)
+            stats["segs_in"] = tcp["segs_in"] - before.get("segs_in", 0)
+            stats["retrans"] = tcp["total_retrans"] - before.get("total_retrans", 0)
+            stats["rtt_ms"] = tcp["rtt_us"] / 1000
+            stats["tcp_info"] = True
+        else:
+            stats["wire_bytes_sent"] = stats["bytes_sent"]
+            stats["wire_bytes_recv"] = stats["bytes_recv"]
+            stats["segs_out"] = stats["send_calls"]
+            stats["segs_in"] = stats["recv_calls"]
+            stats["retrans"] = None
+            stats["rtt_ms"] = None
+            stats["tcp_info"] = False
+        return stats
+
+
+class OperationMetrics(tuple):
+    """A metrics tuple (success, time, bytes, packets_sent, packets_recv, ...)
+    that also carries the WireMeter stats dict as .wire."""
+
+    def __new__(cls, values, wire=None):
+        metrics = super().__new__(cls, values)
+        metrics.wire = wire
+        return metrics
+
+
+def merge_stats(stats_list):
+    """Add up several stats() dicts (e.g. one per message of a batch)."""
+    if not stats_list:
+        return None
+    merged = {"phases": {}, "rtt_ms": None,
+              "tcp_info": all(s["tcp_info"] for s in stats_list)}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if key == "phases":
+                for name, seconds in value.items():
+                    merged["phases"][name] = merged["phases"].get(name, 0) + seconds
+            elif key == "rtt_ms":
+                merged["rtt_ms"] = value if value is not None else merged["rtt_ms"]
+            elif key != "tcp_info":
+                if value is None or merged.get(key, 0) is None:
+                    merged[key] = None
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+# ==================== Connection Setup ====================
+
+DNS_TTL = 300  # seconds a resolved address is reused
+
+
+class DNSCache:
+    """getaddrinfo() answers shared by every connection, kept for `ttl` seconds."""
+
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self._entries = {}  # (host, port) -> (expires, addrinfo list)
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, infos)
+        return infos
+
+    def forget(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TLSSessionCache:
+    """The last TLS session of each server, offered on the next connection.
+
+    A server that accepts it resumes the session (abbreviated handshake: no
+    certificate exchange or key agreement from scratch). Sessions are only
+    valid with the SSLContext that made them, so the key includes it.
+    """
+
+    def __init__(self):
+        self._sessions = {}  # (context id, host, port) -> SSLSession
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def put(self, key, session):
+        with self._lock:
+            self._sessions[key] = session
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+default_dns_cache = DNSCache()
+default_tls_sessions = TLSSessionCache()
+_shared_context = None
+_shared_context_lock = threading.Lock()
+_local_hostname = None
+
+
+def local_hostname():
+    """socket.getfqdn(), looked up once: smtplib (EHLO) and make_msgid() would
+    otherwise do a reverse DNS lookup for every connection and message."""
+    global _local_hostname
+    if _local_hostname is None:
+        _local_hostname = socket.getfqdn()
+    return _local_hostname
+
+
+def open_connection(host, port, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None,
+                    meter=None, dns=None):
+    """socket.create_connection() with cached name resolution.
+
+    The lookup is timed as the 'dns' phase; the caller marks 'connect'. If
+    no cached address answers, the entry is dropped so the next attempt
+    resolves again.
+    """
+    dns = dns or default_dns_cache
+    infos = dns.resolve(host, port)
+    if meter is not None:
+        meter.mark('dns')
+    error = None
+    for family, type_, proto, _, address in infos:
+        sock = None
+        try:
+            sock = socket.socket(family, type_, proto)
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(address)
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    dns.forget(host, port)
+    raise error or OSError(f"getaddrinfo returned no addresses for {host}")
+
+
+def shared_ssl_context():
+    """Process-wide client SSLContext (the same unverified settings smtplib and
+    imaplib use by default), so TLS sessions can be resumed across connections."""
+    global _shared_context
+    with _shared_context_lock:
+        if _shared_context is None:
+            _shared_context = ssl._create_stdlib_context()
+        return _shared_context
+
+
+# ==================== Socket Wrappers ====================
+
+class MeteredSocket:
+    """Proxy around a socket (or SSLSocket) that counts bytes and calls.
+
+    With a session_key (TLS sockets), the TLS session is stored in
+    default_tls_sessions after the first read and again on close: TLS 1.3
+    servers only send the resumable ticket after the handshake.
+    """
+
+    def __init__(self, sock, meter, session_key=None):
+        self.sock = sock
+        self.meter = meter
+        self.session_key = session_key
+        self._session_saved = False
+        meter.sock = sock
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def send(self, data, *args):
+        sent = self.sock.send(data, *args)
+        self.meter.send_calls += 1
+        self.meter.bytes_sent += sent
+        return sent
+
+    def sendall(self, data, *args):
+        view = memoryview(data)
+        while view:
+            sent = self.send(view, *args)
+            view = view[sent:]
+
+    def recv(self, bufsize, *args):
+        data = self.sock.recv(bufsize, *args)
+        self.meter.recv_calls += 1
+        self.meter.bytes_recv += len(data)
+        if not self._session_saved:
+            self._save_session()
+        return data
+
+    def recv_into(self, buffer, *args):
+        count = self.sock.recv_into(buffer, *args)
+        self.meter.recv_calls += 1
+        self.meter.bytes_recv += count
+        if not self._session_saved:
+            self._save_session()
+        return count
+
+    def makefile(self, mode='r', buffering=None, **kwargs):
+        if mode != 'rb':
+            raise ValueError("MeteredSocket only supports makefile('rb')")
+        return io.BufferedReader(_MeteredReader(self))
+
+    def close(self):
+        self.meter.tcp_info()  # keep the final counters
+        self.meter.sock = None
+        self._save_session()
+        self.sock.close()
+
+    def _save_session(self):
+        self._session_saved = True
+        if self.session_key is None:
+            return
+        try:
+            session = self.sock.session
+        except (AttributeError, ValueError, OSError):
+            return
+        if session is not None:
+            default_tls_sessions.put(self.session_key, session)
+
+
+class _MeteredReader(io.RawIOBase):
+    """Raw stream over a MeteredSocket (or DeflateSocket) for smtplib/imaplib's buffered file."""
+
+    def __init__(self, metered):
+        self._metered = metered
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._metered.recv_into(buffer)
+
+
+class DeflateSocket:
+    """IMAP COMPRESS=DEFLATE (RFC 4978) layered over a socket.
+
+    Both directions are raw deflate streams; every write ends with a sync
+    flush so the peer can decode it at once. Reads are inflated at most
+    bufsize bytes at a time, so a small compressed burst cannot balloon in
+    memory. With a meter, the compressed and uncompressed byte counts of
+    both directions are kept on it. read_ahead is compressed data already
+    read from the socket (e.g. by a buffered reader); it is inflated first.
+    """
+
+    def __init__(self, sock, meter=None, level=6, read_ahead=b""):
+        self.sock = sock
+        self.meter = meter
+        self._deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self._inflate = zlib.decompressobj(-15)
+        self._read_ahead = read_ahead
+        if meter is not None:
+            meter.compressed_recv += len(read_ahead)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def sendall(self, data, *args):
+        packed = self._deflate.compress(data) + self._deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.sock.sendall(packed, *args)
+        if self.meter is not None:
+            self.meter.uncompressed_sent += len(data)
+            self.meter.compressed_sent += len(packed)
+
+    def send(self, data, *args):
+        self.sendall(data, *args)
+        return len(data)
+
+    def recv(self, bufsize, *args):
+        while True:
+            if self._inflate.unconsumed_tail:
+                data = self._inflate.decompress(self._inflate.unconsumed_tail, bufsize)
+            elif self._read_ahead:
+                data = self._inflate.decompress(self._read_ahead, bufsize)
+                self._read_ahead = b""
+            else:
+                packed = self.sock.recv(max(bufsize, 16384), *args)
+                if not packed:
+                    return b""
+                if self.meter is not None:
+                    self.meter.compressed_recv += len(packed)
+                data = self._inflate.decompress(packed, bufsize)
+            if data:
+                if self.meter is not None:
+                    self.meter.uncompressed_recv += len(data)
+                return data
+
+    def recv_into(self, buffer, nbytes=0, *args):
+        data = self.recv(nbytes or len(buffer), *args)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def pending(self):
+        """True if a recv() can return without reading the socket."""
+        if self._inflate.unconsumed_tail or self._read_ahead:
+            return True
+        pending = getattr(self.sock, 'pending', None)  # TLS may hold decrypted bytes
+        return bool(pending and pending())
+
+    def makefile(self, mode='r', buffering=None, **kwargs):
+        if mode != 'rb':
+            raise ValueError("DeflateSocket only supports makefile('rb')")
+        return io.BufferedReader(_MeteredReader(self))
+
+    def close(self):
+        self.sock.close()
+
+
+class MeteredSSLContext:
+    """Wraps an SSLContext so the TLS handshake is timed and the result metered.
+
+    The server's cached TLS session (if any) is offered for resumption;
+    meter.tls_resumed counts the handshakes where the server accepted it.
+    """
+
+    def __init__(self, context, meter):
+        self.context = context
+        self.meter = meter
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def wrap_socket(self, sock, server_hostname=None, **kwargs):
+        raw = sock.sock if isinstance(sock, MeteredSocket) else sock
+        key = (id(self.context), server_hostname, raw.getpeername()[1])
+        session = default_tls_sessions.get(key)
+        try:
+            ssl_sock = self.context.wrap_socket(raw, server_hostname=server_hostname,
+                                                session=session, **kwargs)
+        except ValueError:
+            # Session from an older context that happened to get the same id
+            ssl_sock = self.context.wrap_socket(raw, server_hostname=server_hostname, **kwargs)
+        self.meter.tls_handshakes += 1
+        if ssl_sock.session_reused:
+            self.meter.tls_resumed += 1
+        self.meter.mark('tls')
+        return MeteredSocket(ssl_sock, self.meter, session_key=key)
+
+
+def default_ssl_context():
+    """Same (unverified) context smtplib/imaplib create when given none, shared
+    by all connections (see shared_ssl_context())."""
+    return shared_ssl_context()
+
+
+# ==================== Metered Protocol Clients ====================
+
+class MeteredSMTP(smtplib.SMTP):
+    """smtplib.SMTP over a MeteredSocket; starttls() is metered as well."""
+
+    def __init__(self, host='', port=0, meter=None, **kwargs):
+        self.meter = meter or WireMeter()
+        super().__init__(host, port, **kwargs)
+
+    def _get_socket(self, host, port, timeout):
+        sock = open_connection(host, port, timeout, self.source_address, self.meter)
+        self.meter.mark('connect')
+        return MeteredSocket(sock, self.meter)
+
+    def starttls(self, context=None):
+        context = MeteredSSLContext(context or default_ssl_context(), self.meter)
+        return super().starttls(context=context)
+
+
+class MeteredSMTP_SSL(smtplib.SMTP_SSL):
+    """smtplib.SMTP_SSL with separate connect and TLS timings."""
+
+    def __init__(self, host='', port=0, meter=None, context=None, **kwargs):
+        self.meter = meter or WireMeter()
+        context = MeteredSSLContext(context or default_ssl_context(), self.meter)
+        super().__init__(host, port, context=context, **kwargs)
+
+    def _get_socket(self, host, port, timeout):
+        sock = open_connection(host, port, timeout, self.source_address, self.meter)
+        self.meter.mark('connect')
+        return self.context.wrap_socket(sock, server_hostname=self._host)
+
+
+def _imap_socket(imap, timeout):
+    """imaplib.IMAP4._create_socket() through open_connection()."""
+    if timeout is not None and not timeout:
+        raise ValueError('Non-blocking socket (timeout=0) is not supported')
+    if timeout is None:
+        timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+    return open_connection(imap.host or None, imap.port, timeout, meter=imap.meter)
+
+
+class MeteredIMAP4(imaplib.IMAP4):
+    """imaplib.IMAP4 over a MeteredSocket; starttls() is metered as well."""
+
+    def __init__(self, host='', port=imaplib.IMAP4_PORT, meter=None, timeout=None):
+        self.meter = meter or WireMeter()
+        super().__init__(host, port, timeout)
+
+    def _create_socket(self, timeout):
+        sock = _imap_socket(self, timeout)
+        self.meter.mark('connect')
+        return MeteredSocket(sock, self.meter)
+
+    def starttls(self, ssl_context=None):
+        context = MeteredSSLContext(ssl_context or default_ssl_context(), self.meter)
+        return super().starttls(ssl_context=context)
+
+
+class MeteredIMAP4_SSL(imaplib.IMAP4_SSL):
+    """imaplib.IMAP4_SSL with separate connect and TLS timings."""
+
+    def __init__(self, host='', port=imaplib.IMAP4_SSL_PORT, meter=None,
+                 ssl_context=None, timeout=None):
+        self.meter = meter or WireMeter()
+        context = MeteredSSLContext(ssl_context or default_ssl_context(), self.meter)
+        super().__init__(host, port, ssl_context=context, timeout=timeout)
+
+    def _create_socket(self, timeout):
+        sock = _imap_socket(self, timeout)
+        self.meter.mark('connect')
+        return self.ssl_context.wrap_socket(sock, server_hostname=self.host)